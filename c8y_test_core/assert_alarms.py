@@ -1,64 +1,198 @@
 """Alarm assertions"""
 import re
-from typing import List, Optional
+from typing import Any, Callable, Optional, Sequence, Set, Union
 
 from c8y_api.model import Alarm
 
 from c8y_test_core.assert_device import AssertDevice
+from c8y_test_core.context import AssertContext
 from c8y_test_core.errors import FinalAssertionError
+from c8y_test_core.paging import (
+    CursorStore,
+    LazySequence,
+    QueryCursor,
+    fetch_until_decided,
+    format_count,
+    get_field,
+    item_last_updated,
+    select_new,
+    select_with_shards,
+)
+from c8y_test_core.records import ensure_fields, get_select
 
 
 class AlarmNotFound(AssertionError):
     """Alarm not found"""
 
 
+def _split(value: Optional[str]) -> Optional[Set[str]]:
+    if not value:
+        return None
+    return {item.strip().upper() for item in str(value).split(",")}
+
+
+def _alarm_filter(
+    status: Optional[str] = None,
+    severity: Optional[str] = None,
+    resolved: Optional[Union[bool, str]] = None,
+    matches: Optional[Callable[[Any], bool]] = None,
+) -> Optional[Callable[[Any], bool]]:
+    """Client-side version of the status, severity and resolved alarm filters
+    (comma separated values are supported), combined with an optional text match"""
+    statuses = _split(status)
+    severities = _split(severity)
+    if resolved is not None:
+        resolved = str(resolved).lower() == "true"
+    if statuses is None and severities is None and resolved is None:
+        return matches
+
+    def alarm_filter(item) -> bool:
+        item_status = get_field(item, "status")
+        if statuses is not None and item_status not in statuses:
+            return False
+        if severities is not None and get_field(item, "severity") not in severities:
+            return False
+        if resolved is not None and (item_status == "CLEARED") != resolved:
+            return False
+        return matches is None or matches(item)
+
+    return alarm_filter
+
+
 class Alarms(AssertDevice):
     """Alarm assertions"""
 
     # pylint: disable=too-few-public-methods
 
+    def __init__(self, context: AssertContext) -> None:
+        super().__init__(context)
+        # alarms change (status, text, count), so a last updated cursor is used
+        # and alarms which are returned again are re-evaluated
+        self._cursors = CursorStore(
+            lambda: QueryCursor(item_last_updated, replace=True)
+        )
+
+    def reset_cursors(self) -> None:
+        """Forget all alarms accumulated by incremental assertions"""
+        self._cursors.clear()
+
     def assert_count(
         self,
         expected_text: Optional[str] = None,
         min_matches: int = 1,
         max_matches: Optional[int] = None,
+        shards: int = 0,
+        raw: bool = False,
+        fields: Optional[Sequence[str]] = None,
+        incremental: bool = False,
         **kwargs,
-    ) -> List[Alarm]:
+    ) -> LazySequence[Alarm]:
         """
         Assert a count of matching alarms
 
+        Only the pages required to decide the assertion are fetched. The remaining
+        alarms are fetched when the returned sequence is accessed.
+
         Args:
             expected_text (str, optional): Expected matching text
             min_matches (int, optional): Expected minimum number of alarms. Defaults to 1.
             max_matches (int, optional): Expected maximum number of alarms. Defaults to None.
+            shards (int, optional): Split the time range (after/max_age and before) into
+                the given number of shards which are fetched concurrently. Shards
+                with too many pages are split further. All pages are fetched
+                when shards are used. Ignored if set to 0. Defaults to 0.
+            raw (bool, optional): Return the raw json dictionaries instead of
+                Alarm objects. Defaults to False.
+            fields (Sequence[str], optional): Return compact records (namedtuples)
+                with only the given fields, e.g. ["time", "source.id"]. Nested
+                fields are accessible using underscores (source_id). The id, time,
+                text, status, severity and lastUpdated fields are always included.
+                Defaults to None.
+            incremental (bool, optional): Remember the alarms seen by previous calls
+                (e.g. retries) using the same filter, and only fetch alarms updated
+                since the previous call (lastUpdatedFrom). Alarms which changed
+                (e.g. cleared, new text or count) are checked again, and are removed
+                if they no longer match. The status, severity and resolved filters
+                are therefore checked by the client, other server-side filters
+                (e.g. type, fragment) can be given as kwargs.
+                Use reset_cursors() to forget previous results.
+                Can't be combined with shards, as the shards split the time range
+                using the time, whereas the cursor uses the last updated time.
+                Defaults to False.
 
         Returns:
-            List[Alarm]: List of matching alarms
+            LazySequence[Alarm]: Lazily materialized sequence of matching alarms.
+                It is read-only (not a list), use list() to get a list
         """
         source = kwargs.pop("source", self.context.device_id)
         if not source:
             raise FinalAssertionError(
                 "source and the current device context is empty. One of these values must be set!"
             )
-        alarms = self.context.client.alarms.get_all(source=source, **kwargs)
+        if incremental and shards:
+            raise FinalAssertionError(
+                "incremental and shards can't be used together. "
+                "The incremental cursor uses the last updated time of the alarms, "
+                "but shards split the alarms by their time"
+            )
+        select = get_select(
+            self.context.client.alarms,
+            raw=raw,
+            fields=ensure_fields(
+                fields, "id", "time", "text", "status", "severity", "lastUpdated"
+            ),
+        )
 
-        matching_alarms = alarms
+        matches = None
         if expected_text:
             text_pattern = re.compile(expected_text, re.IGNORECASE)
-            matching_alarms = list(filter(lambda x: text_pattern.match(x.text), alarms))
 
-        assert len(matching_alarms) >= min_matches, (
+            def matches(item) -> bool:
+                return bool(text_pattern.match(get_field(item, "text") or ""))
+
+        if incremental:
+            cursor = self._cursors.get(
+                expected_text=expected_text,
+                source=source,
+                raw=raw,
+                fields=fields,
+                **kwargs,
+            )
+            # a server-side status filter would hide alarms which changed status
+            alarm_filter = _alarm_filter(
+                kwargs.pop("status", None),
+                kwargs.pop("severity", None),
+                kwargs.pop("resolved", None),
+                matches,
+            )
+            alarms = select_new(
+                cursor,
+                select,
+                alarm_filter,
+                cursor_param="updated_after",
+                source=source,
+                **kwargs,
+            )
+        else:
+            alarms = select_with_shards(select, shards=shards, source=source, **kwargs)
+            if matches:
+                alarms = filter(matches, alarms)
+
+        matching_alarms = LazySequence(alarms)
+        total = fetch_until_decided(matching_alarms, min_matches, max_matches)
+
+        assert total >= min_matches, (
             "Alarm count is less than expected. "
             f"wanted={min_matches} (min)\n"
-            f"got={len(matching_alarms)}\n\n"
+            f"got={total}\n\n"
             f"alarms:\n{matching_alarms}"
         )
 
         if max_matches is not None:
-            assert len(matching_alarms) <= max_matches, (
+            assert total <= max_matches, (
                 "Alarm count is more than expected. "
                 f"wanted={max_matches} (max)\n"
-                f"got={len(matching_alarms)}\n\n"
+                f"got={format_count(matching_alarms)}\n\n"
                 f"alarms:\n{matching_alarms}"
             )
 
@@ -31,7 +31,7 @@ class AssertDeviceAvailability(AssertDevice):
         is set to AVAILABLE
         """
         if mo is None:
-            mo = self.context.client.inventory.get(self.context.device_id)
+            mo = self._get_managed_object("c8y_Availability")
         assert (
             mo.to_json()["c8y_Availability"]["status"]
             == self.AvailabilityStatus.AVAILABLE
@@ -47,7 +47,7 @@ class AssertDeviceAvailability(AssertDevice):
         is set to UNAVAILABLE
         """
         if mo is None:
-            mo = self.context.client.inventory.get(self.context.device_id)
+            mo = self._get_managed_object("c8y_Availability")
         assert (
             mo.to_json()["c8y_Availability"]["status"]
             == self.AvailabilityStatus.UNAVAILABLE
@@ -63,7 +63,7 @@ class AssertDeviceAvailability(AssertDevice):
         is set to MAINTENANCE
         """
         if mo is None:
-            mo = self.context.client.inventory.get(self.context.device_id)
+            mo = self._get_managed_object("c8y_Availability")
         assert (
             mo.to_json()["c8y_Availability"]["status"]
             == self.AvailabilityStatus.MAINTENANCE
@@ -79,7 +79,7 @@ class AssertDeviceAvailability(AssertDevice):
         is set to CONNECTED
         """
         if mo is None:
-            mo = self.context.client.inventory.get(self.context.device_id)
+            mo = self._get_managed_object("c8y_Connection")
         assert (
             mo.to_json()["c8y_Connection"]["status"] == self.ConnectionStatus.CONNECTED
         )
@@ -94,7 +94,7 @@ class AssertDeviceAvailability(AssertDevice):
         is set to DISCONNECTED
         """
         if mo is None:
-            mo = self.context.client.inventory.get(self.context.device_id)
+            mo = self._get_managed_object("c8y_Connection")
         assert (
             mo.to_json()["c8y_Connection"]["status"]
             == self.ConnectionStatus.DISCONNECTED
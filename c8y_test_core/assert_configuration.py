@@ -108,7 +108,7 @@ class DeviceConfiguration(AssertDevice):
             List[str]: List of supported configuration types
         """
         if mo is None:
-            mo = self.context.client.inventory.get(self.context.device_id)
+            mo = self._get_managed_object(SUPPORTED_CONFIGURATIONS)
 
         mo_json = mo.to_json()
         assert (
@@ -1,8 +1,9 @@
 """Device assertion"""
-from c8y_api.model import Operation
+from c8y_api.model import ManagedObject, Operation
 
 from c8y_test_core.assert_operation import AssertOperation
 from c8y_test_core.context import AssertContext
+from c8y_test_core.inventory_projection import get_managed_object
 
 
 class AssertDevice:
@@ -12,6 +13,17 @@ class AssertDevice:
     def __init__(self, context: AssertContext) -> None:
         self.context = context
 
+    def _get_managed_object(self, *fragments: str) -> ManagedObject:
+        """Get the device managed object. If projected reads are enabled, only the
+        given fragments are read (see inventory_projection)"""
+        if not self.context.projected_reads:
+            return self.context.client.inventory.get(self.context.device_id)
+        return get_managed_object(
+            self.context.client,
+            self.context.device_id,
+            fragments=fragments or None,
+        )
+
     def _execute(self, **kwargs) -> AssertOperation:
         device_id = kwargs.pop("device_id", self.context.device_id)
         operation = Operation(self.context.client, device_id, **kwargs).create()
@@ -105,7 +105,7 @@ class DeviceProfile(AssertDevice):
             ManagedObject: Managed object
         """
         if mo is None:
-            mo = self.context.client.inventory.get(self.context.device_id)
+            mo = self._get_managed_object("c8y_Profile")
         mo_data = mo.to_full_json()
 
         profile = self.context.client.inventory.get(profile_id).to_full_json()
@@ -128,7 +128,7 @@ class DeviceProfile(AssertDevice):
             ManagedObject: Managed object
         """
         if mo is None:
-            mo = self.context.client.inventory.get(self.context.device_id)
+            mo = self._get_managed_object("c8y_Profile")
         mo_data = mo.to_full_json()
 
         if "c8y_Profile" not in mo_data:
@@ -1,12 +1,15 @@
 """Device registration assertions and actions"""
 import io
+import itertools
 import logging
 import random
 import secrets
 import time
-from dataclasses import dataclass
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 from c8y_test_core.assert_device import AssertDevice
+from c8y_test_core.c8y import error_status
 from c8y_test_core.utils import to_csv
 import contextlib
 
@@ -29,6 +32,35 @@ class DeviceSimpleEnrollCredentials:
     one_time_password: str
 
 
+@dataclass
+class DeviceRegistration:
+    """Device to be registered using the bulk registration"""
+
+    external_id: str
+    name: Optional[str] = None
+    external_type: str = "c8y_Serial"
+    device_type: str = "thin-edge.io"
+
+
+@dataclass
+class BulkRegistrationResult:
+    """Result of a multi-device bulk registration
+
+    credentials and failures are keyed by the external id of the device.
+    """
+
+    credentials: Dict[str, Any] = field(default_factory=dict)
+    failures: Dict[str, str] = field(default_factory=dict)
+    requests: int = 0
+
+
+# Maximum number of devices per bulk registration request (CSV rows)
+BULK_REGISTRATION_CHUNK_SIZE = 500
+
+# Status codes returned when a new device request already exists
+REQUEST_EXISTS_STATUSES = (409, 422)
+
+
 log = logging.getLogger()
 
 
@@ -66,9 +98,78 @@ def random_password(password_len=16) -> str:
     return value
 
 
+def _chunks(
+    devices: Iterable[Union[str, DeviceRegistration]], size: int, **defaults
+) -> Iterator[List[DeviceRegistration]]:
+    """Split the devices into chunks (without reading the whole iterable)"""
+    iterator = iter(devices)
+    while True:
+        chunk = [
+            device
+            if isinstance(device, DeviceRegistration)
+            else DeviceRegistration(external_id=device, **defaults)
+            for device in itertools.islice(iterator, size)
+        ]
+        if not chunk:
+            return
+        yield chunk
+
+
+def _parse_failures(
+    response: Dict[str, Any], chunk: List[DeviceRegistration]
+) -> Dict[str, str]:
+    """Get the failed devices (external id and reason) from a bulk registration response
+
+    If the counts of the response don't add up (e.g. fewer devices were created
+    than requested, but not all of them are listed as failed), then it is not
+    known which devices were created, so all devices of the chunk which are not
+    listed are also treated as failed.
+    """
+    failures = {
+        item.get("deviceId", ""): item.get("failureReason")
+        or item.get("bulkNewDeviceStatus", "FAILED")
+        for item in response.get("failedCreationList", [])
+    }
+    number_of_all = response.get("numberOfAll")
+    number_of_successful = response.get("numberOfSuccessful")
+    listed = sum(1 for device in chunk if device.external_id in failures)
+    if number_of_all != len(chunk) or number_of_successful != len(chunk) - listed:
+        reason = (
+            "Unknown registration status. "
+            f"numberOfAll={number_of_all}, numberOfSuccessful={number_of_successful}, "
+            f"requested={len(chunk)}, failed={listed}"
+        )
+        for device in chunk:
+            failures.setdefault(device.external_id, reason)
+    return failures
+
+
 class AssertDeviceRegistration(AssertDevice):
     """Assertions"""
 
+    def _post_bulk_registration(
+        self, columns: List[Tuple[str, List[Any]]]
+    ) -> Dict[str, Any]:
+        registration_body = to_csv(columns)
+        resp = self.context.client.post_file(
+            "/devicecontrol/bulkNewDeviceRequests",
+            io.BytesIO(registration_body.encode("utf-8")),
+            accept="application/json",
+        )
+        log.info(
+            "Registration response: numberOfAll=%s, numberOfSuccessful=%s",
+            resp.get("numberOfAll"),
+            resp.get("numberOfSuccessful"),
+        )
+        log.debug("Registration response: %s", resp)
+        return resp
+
+    def _device_username(self, external_id: str) -> str:
+        username = f"device_{external_id}"
+        if self.context.client.tenant_id:
+            username = f"{self.context.client.tenant_id}/device_{external_id}"
+        return username
+
     def bulk_register_with_basic_auth(
         self,
         external_id: str,
@@ -113,14 +214,73 @@ class AssertDeviceRegistration(AssertDevice):
             "Failed to register device\n" f"response:\n{resp}"
         )
 
-        username = f"device_{external_id}"
-        if self.context.client.tenant_id:
-            username = f"{self.context.client.tenant_id}/device_{external_id}"
-
         return DeviceCredentials(
-            username=username, password=password, url=self.context.domain()
+            username=self._device_username(external_id),
+            password=password,
+            url=self.context.domain(),
         )
 
+    def bulk_register_devices_with_basic_auth(
+        self,
+        devices: Iterable[Union[str, DeviceRegistration]],
+        external_type: str = "c8y_Serial",
+        device_type: str = "thin-edge.io",
+        auth_type: str = "BASIC",
+        chunk_size: int = BULK_REGISTRATION_CHUNK_SIZE,
+        allow_failures: bool = False,
+        **kwargs,
+    ) -> BulkRegistrationResult:
+        """Bulk device registration of multiple devices (non-cert based
+        authentication, e.g. basic auth) using one CSV per chunk of devices
+
+        Arguments:
+            devices (Iterable[str | DeviceRegistration]): External ids or devices.
+                It can be a generator, as it is only read one chunk at a time.
+            external_type (str): External type (for external ids). Defaults to c8y_Serial
+            device_type (str): Type of the device (for external ids). Defaults to thin-edge.io
+            auth_type (str): Type of the authentication type.
+                Either 'BASIC' or 'CREDENTIALS'. Defaults to 'BASIC'
+            chunk_size (int): Maximum number of devices per request. Defaults to 500
+            allow_failures (bool): Return the failed devices instead of failing
+                the assertion. Defaults to False
+
+        Returns:
+            BulkRegistrationResult: Credentials of the registered devices and
+                the reason of each failed device
+        """
+        result = BulkRegistrationResult()
+        for chunk in _chunks(
+            devices, chunk_size, external_type=external_type, device_type=device_type
+        ):
+            passwords = [random_password() for _ in chunk]
+            resp = self._post_bulk_registration(
+                [
+                    ("ID", [device.external_id for device in chunk]),
+                    ("IDTYPE", [device.external_type for device in chunk]),
+                    ("AUTH_TYPE", [auth_type] * len(chunk)),
+                    ("CREDENTIALS", passwords),
+                    ("TYPE", [device.device_type for device in chunk]),
+                    ("NAME", [device.name or device.external_id for device in chunk]),
+                    ("com_cumulocity_model_Agent.active", [True] * len(chunk)),
+                ]
+            )
+            result.requests += 1
+            failures = _parse_failures(resp, chunk)
+            result.failures.update(failures)
+            for device, password in zip(chunk, passwords):
+                if device.external_id not in failures:
+                    result.credentials[device.external_id] = DeviceCredentials(
+                        username=self._device_username(device.external_id),
+                        password=password,
+                        url=self.context.domain(),
+                    )
+
+        assert allow_failures or not result.failures, (
+            f"Failed to register {len(result.failures)} device/s\n"
+            + "\n".join(f"  {key}: {reason}" for key, reason in result.failures.items())
+        )
+        return result
+
     def bulk_register_with_ca(
         self,
         external_id: str,
@@ -174,49 +334,277 @@ class AssertDeviceRegistration(AssertDevice):
             url=self.context.domain(),
         )
 
-    def register_with_basic_auth(self, external_id: str, timeout: float = 60, **kwargs):
+    def bulk_register_devices_with_ca(
+        self,
+        devices: Iterable[Union[str, DeviceRegistration]],
+        external_type: str = "c8y_Serial",
+        device_type: str = "thin-edge.io",
+        chunk_size: int = BULK_REGISTRATION_CHUNK_SIZE,
+        allow_failures: bool = False,
+        **kwargs,
+    ) -> BulkRegistrationResult:
+        """Bulk device registration of multiple devices using the Cumulocity
+        certificate-authority feature, using one CSV per chunk of devices
+
+        Existing registration requests can't be updated, so the failed devices of
+        each chunk are deleted and registered once more (in a single request),
+        instead of deleting the request of every device beforehand.
+
+        Arguments:
+            devices (Iterable[str | DeviceRegistration]): External ids or devices.
+                It can be a generator, as it is only read one chunk at a time.
+            external_type (str): External type (for external ids). Defaults to c8y_Serial
+            device_type (str): Type of the device (for external ids). Defaults to thin-edge.io
+            chunk_size (int): Maximum number of devices per request. Defaults to 500
+            allow_failures (bool): Return the failed devices instead of failing
+                the assertion. Defaults to False
+
+        Returns:
+            BulkRegistrationResult: Enrollment credentials of the registered devices
+                and the reason of each failed device
+        """
+
+        def register(chunk: List[DeviceRegistration]) -> Dict[str, Any]:
+            passwords = [random_password() for _ in chunk]
+            resp = self._post_bulk_registration(
+                [
+                    ("ID", [device.external_id for device in chunk]),
+                    ("IDTYPE", [device.external_type for device in chunk]),
+                    ("AUTH_TYPE", ["CERTIFICATES"] * len(chunk)),
+                    ("ENROLLMENT_OTP", passwords),
+                    ("TYPE", [device.device_type for device in chunk]),
+                    ("NAME", [device.name or device.external_id for device in chunk]),
+                    ("com_cumulocity_model_Agent.active", [True] * len(chunk)),
+                ]
+            )
+            result.requests += 1
+            failures = _parse_failures(resp, chunk)
+            for device, password in zip(chunk, passwords):
+                if device.external_id not in failures:
+                    result.credentials[device.external_id] = (
+                        DeviceSimpleEnrollCredentials(
+                            external_id=device.external_id,
+                            one_time_password=password,
+                            url=self.context.domain(),
+                        )
+                    )
+            return failures
+
+        result = BulkRegistrationResult()
+        for chunk in _chunks(
+            devices, chunk_size, external_type=external_type, device_type=device_type
+        ):
+            failures = register(chunk)
+            if not failures:
+                continue
+
+            # Remove the existing requests of the failed devices, and try again
+            retry = [device for device in chunk if device.external_id in failures]
+            for device in retry:
+                with contextlib.suppress(KeyError):
+                    self.context.client.delete(
+                        f"/devicecontrol/bulkNewDeviceRequests/{device.external_id}"
+                    )
+            result.failures.update(register(retry))
+
+        assert allow_failures or not result.failures, (
+            f"Failed to register {len(result.failures)} device/s\n"
+            + "\n".join(f"  {key}: {reason}" for key, reason in result.failures.items())
+        )
+        return result
+
+    def _create_new_device_request(self, external_id: str) -> None:
+        try:
+            resp = self.context.client.post(
+                "/devicecontrol/newDeviceRequests",
+                json={
+                    "id": external_id,
+                },
+                accept="application/json",
+            )
+            log.info("Registration response. %s", resp)
+        except (KeyError, SyntaxError, ValueError) as ex:
+            if error_status(ex) in REQUEST_EXISTS_STATUSES:
+                log.info(
+                    "Registration request already exists: id=%s, %s", external_id, ex
+                )
+                return
+            log.warning(
+                "Could not create registration request: id=%s, %s", external_id, ex
+            )
+            raise
+
+    def _list_new_device_requests(
+        self, page_size: int = 2000
+    ) -> Iterator[Dict[str, Any]]:
+        page = 1
+        while True:
+            items = self.context.client.get(
+                "/devicecontrol/newDeviceRequests",
+                params={"pageSize": page_size, "currentPage": page},
+            ).get("newDeviceRequests", [])
+            yield from items
+            if len(items) < page_size:
+                return
+            page += 1
+
+    def _accept_new_device_request(self, external_id: str) -> bool:
+        # pylint: disable=broad-exception-caught
+        try:
+            resp = self.context.client.put(
+                f"/devicecontrol/newDeviceRequests/{external_id}",
+                json={
+                    "status": "ACCEPTED",
+                },
+                accept="application/json",
+                content_type="application/json",
+            )
+            log.info("Registration accepted: %s", resp)
+            return True
+        except Exception as ex:
+            log.info(
+                "Registration accepted failed: id=%s, exception=%s", external_id, ex
+            )
+            return False
+
+    def iter_register_with_basic_auth(
+        self,
+        external_ids: Iterable[str],
+        timeout: float = 60,
+        min_interval: float = 0.5,
+        max_interval: float = 5.0,
+        backoff: float = 2.0,
+        max_workers: int = 4,
+        **kwargs,
+    ) -> Iterator[str]:
+        """Register multiple devices using basic auth, yielding the external id of
+        each device as soon as its registration is accepted
+
+        For the registration to work, the devices must be polling the
+        POST /devicecontrol/newDeviceRequests/{external_id} endpoint in the background.
+        The pending requests are listed once per tick (for all devices), and all of
+        the requests which are ready (PENDING_ACCEPTANCE) are accepted concurrently.
+        The first check is done immediately, and the poll interval is doubled
+        (up to max_interval) while no device becomes ready.
+
+        Arguments:
+            external_ids (Iterable[str]): external ids of the devices to be registered
+            timeout (float): Timeout in seconds. Defaults to 60
+            min_interval (float): Initial poll interval in seconds. Defaults to 0.5
+            max_interval (float): Maximum poll interval in seconds. Defaults to 5
+            backoff (float): Poll interval multiplier. Defaults to 2
+            max_workers (int): Maximum number of concurrent requests. Defaults to 4
+
+        Returns:
+            Iterator[str]: External ids of the accepted devices. Devices which
+                are not accepted before the timeout are not returned.
+        """
+        # pylint: disable=too-many-arguments
+        pending = set(external_ids)
+        timeout_at = time.monotonic() + timeout
+        interval = min_interval
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(self._create_new_device_request, pending))
+
+            while pending:
+                ready = [
+                    item["id"]
+                    for item in self._list_new_device_requests()
+                    if item.get("id") in pending
+                    and item.get("status") == "PENDING_ACCEPTANCE"
+                ]
+                accepted = 0
+                for external_id, success in zip(
+                    ready, executor.map(self._accept_new_device_request, ready)
+                ):
+                    if success:
+                        accepted += 1
+                        pending.discard(external_id)
+                        yield external_id
+
+                if accepted:
+                    interval = min_interval
+                else:
+                    interval = min(interval * backoff, max_interval)
+                remaining = timeout_at - time.monotonic()
+                if not pending or remaining <= 0:
+                    break
+                time.sleep(min(interval, remaining))
+
+        if pending:
+            log.warning("Registration was not accepted for devices: %s", sorted(pending))
+
+    def register_devices_with_basic_auth(
+        self, external_ids: Iterable[str], timeout: float = 60, **kwargs
+    ) -> List[str]:
+        """Register multiple devices using basic auth, and assert that all of
+        them are accepted before the timeout
+
+        See iter_register_with_basic_auth for a description of the arguments.
+
+        Returns:
+            List[str]: External ids in the order in which they were accepted
+        """
+        external_ids = list(external_ids)
+        accepted = list(
+            self.iter_register_with_basic_auth(external_ids, timeout=timeout, **kwargs)
+        )
+        missing = sorted(set(external_ids) - set(accepted))
+        assert not missing, f"Failed to register device/s: {missing}"
+        return accepted
+
+    def _get_new_device_request_status(self, external_id: str) -> str:
+        try:
+            return self.context.client.get(
+                f"/devicecontrol/newDeviceRequests/{external_id}"
+            ).get("status", "")
+        except (KeyError, SyntaxError, ValueError) as ex:
+            log.info(
+                "Could not get registration request: id=%s, %s", external_id, ex
+            )
+            return ""
+
+    def register_with_basic_auth(
+        self,
+        external_id: str,
+        timeout: float = 60,
+        min_interval: float = 0.5,
+        max_interval: float = 5.0,
+        backoff: float = 2.0,
+        **kwargs,
+    ):
         """Register a single device using the basic auth
 
         For the registration to work, the device must be polling the
         POST /devicecontrol/newDeviceRequests/{external_id} endpoint in the background.
         Once the request is approved by this function, the device will receive
-        platform credentials.
+        platform credentials. Only the request of the device is polled, use
+        register_devices_with_basic_auth to register many devices.
 
         Arguments:
             external_id (str): external id of the device to be registered
             timeout (float): Timeout in seconds. Defaults to 60
+            min_interval (float): Initial poll interval in seconds. Defaults to 0.5
+            max_interval (float): Maximum poll interval in seconds. Defaults to 5
+            backoff (float): Poll interval multiplier. Defaults to 2
         """
-        resp = self.context.client.post(
-            "/devicecontrol/newDeviceRequests",
-            json={
-                "id": external_id,
-            },
-            accept="application/json",
-        )
-        log.info("Registration response. %s", resp)
+        # pylint: disable=too-many-arguments
+        self._create_new_device_request(external_id)
 
-        # pylint: disable=broad-exception-caught
         success = False
         timeout_at = time.monotonic() + timeout
+        interval = min_interval
         while True:
-            try:
-                resp = self.context.client.put(
-                    f"/devicecontrol/newDeviceRequests/{external_id}",
-                    json={
-                        "status": "ACCEPTED",
-                    },
-                    accept="application/json",
-                    content_type="application/json",
-                )
-                log.info("Registration accepted: %s", resp)
-                success = True
-                break
-            except Exception as ex:
-                log.info(
-                    "Registration accepted failed: response=%s, exception=%s", resp, ex
-                )
-            time.sleep(3)
-            if time.monotonic() > timeout_at:
+            status = self._get_new_device_request_status(external_id)
+            if status == "PENDING_ACCEPTANCE":
+                success = self._accept_new_device_request(external_id)
+                if success:
+                    break
+            remaining = timeout_at - time.monotonic()
+            if remaining <= 0:
                 break
+            time.sleep(min(interval, remaining))
+            interval = min(interval * backoff, max_interval)
 
         assert success, "Failed to register device"
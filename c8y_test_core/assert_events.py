@@ -1,13 +1,44 @@
 """Event assertions"""
-import hashlib
 import re
-from pathlib import Path
-from typing import List, Optional, Union
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List, Optional, Sequence, Union
 
 from c8y_api.model import Event
 
 from c8y_test_core.assert_device import AssertDevice
+from c8y_test_core.context import AssertContext
+from c8y_test_core.attachments import (
+    DEFAULT_CHUNK_SIZE,
+    DEFAULT_WINDOW_SIZE,
+    AttachmentDigest,
+    AttachmentResult,
+    download_chunks,
+    format_results,
+    resolve_checksum,
+    verify_chunks,
+)
 from c8y_test_core.errors import FinalAssertionError
+from c8y_test_core.paging import (
+    CursorStore,
+    LazySequence,
+    QueryCursor,
+    fetch_until_decided,
+    format_count,
+    get_field,
+    item_creation_time,
+    select_new,
+    select_with_shards,
+    to_datetime,
+)
+from c8y_test_core.proc_utils import JsonReader
+from c8y_test_core.records import ensure_fields, get_select
+from c8y_test_core.throughput import (
+    ThroughputStats,
+    assert_throughput,
+    observation_period,
+    timestamps_from_stream,
+)
 from . import compare
 
 
@@ -20,25 +51,60 @@ class Events(AssertDevice):
 
     # pylint: disable=too-few-public-methods
 
+    def __init__(self, context: AssertContext) -> None:
+        super().__init__(context)
+        self._cursors = CursorStore(lambda: QueryCursor(item_creation_time))
+
+    def reset_cursors(self) -> None:
+        """Forget all events accumulated by incremental assertions"""
+        self._cursors.clear()
+
     def assert_count(
         self,
         expected_text: Optional[str] = None,
         min_matches: int = 1,
         max_matches: Optional[int] = None,
         with_attachment: Optional[bool] = None,
+        shards: int = 0,
+        raw: bool = False,
+        fields: Optional[Sequence[str]] = None,
+        incremental: bool = False,
         **kwargs,
-    ) -> List[Event]:
+    ) -> LazySequence[Event]:
         """Assert a minimum count of matches events.
 
+        Only the pages required to decide the assertion are fetched. The remaining
+        events are fetched when the returned sequence is accessed.
+
         Args:
             expected_text (str, optional): Expected matching text
             min_matches (int, optional): Expected minimum number of events. Defaults to 1.
             max_matches (int, optional): Expected maximum number of events. Defaults to None.
             with_attachment (bool, optional): Only match events with an attachment.
                 If set to True, it will override any 'fragment' kwargs provided!
+            shards (int, optional): Split the time range (after/max_age and before) into
+                the given number of shards which are fetched concurrently. Shards
+                with too many pages are split further. All pages are fetched
+                when shards are used. Ignored if set to 0. Defaults to 0.
+            raw (bool, optional): Return the raw json dictionaries instead of
+                Event objects. Defaults to False.
+            fields (Sequence[str], optional): Return compact records (namedtuples)
+                with only the given fields, e.g. ["time", "source.id"]. Nested
+                fields are accessible using underscores (source_id). The id, time,
+                text and creationTime fields are always included. Defaults to None.
+            incremental (bool, optional): Remember the events seen by previous calls
+                (e.g. retries) using the same filter, and only fetch events created
+                since the previous call (createdFrom). expected_text is only checked
+                against new events. Server-side filters (e.g. type, fragment)
+                can be given as kwargs. Events are kept even if they are changed
+                afterwards. Use reset_cursors() to forget previous results.
+                Can't be combined with shards, as the shards split the time range
+                using the time, whereas the cursor uses the creation time.
+                Defaults to False.
 
         Returns:
-            List[Event]: List of matching events
+            LazySequence[Event]: Lazily materialized sequence of matching events.
+                It is read-only (not a list), use list() to get a list
         """
         min_matches = min_matches if min_matches is not None else 1
         source = kwargs.pop("source", self.context.device_id)
@@ -46,33 +112,138 @@ class Events(AssertDevice):
             raise FinalAssertionError(
                 "source and the current device context is empty. One of these values must be set!"
             )
+        if incremental and shards:
+            raise FinalAssertionError(
+                "incremental and shards can't be used together. "
+                "The incremental cursor uses the creation time of the events, "
+                "but shards split the events by their time"
+            )
 
         fragment = kwargs.pop("fragment", None)
         if with_attachment:
             # Override the existing fragment check
             fragment = "c8y_IsBinary"
 
-        events = self.context.client.events.get_all(
-            source=source, fragment=fragment, **kwargs
+        select = get_select(
+            self.context.client.events,
+            raw=raw,
+            fields=ensure_fields(fields, "id", "time", "text", "creationTime"),
         )
 
-        matching_events = events
+        matches = None
         if expected_text:
             text_pattern = re.compile(expected_text, re.IGNORECASE)
-            matching_events = list(filter(lambda x: text_pattern.match(x.text), events))
 
-        assert len(matching_events) >= min_matches, (
+            def matches(item) -> bool:
+                return bool(text_pattern.match(get_field(item, "text") or ""))
+
+        if incremental:
+            cursor = self._cursors.get(
+                expected_text=expected_text,
+                source=source,
+                fragment=fragment,
+                raw=raw,
+                fields=fields,
+                **kwargs,
+            )
+            events = select_new(
+                cursor,
+                select,
+                matches,
+                source=source,
+                fragment=fragment,
+                **kwargs,
+            )
+        else:
+            events = select_with_shards(
+                select,
+                shards=shards,
+                source=source,
+                fragment=fragment,
+                **kwargs,
+            )
+            if matches:
+                events = filter(matches, events)
+
+        matching_events = LazySequence(events)
+        total = fetch_until_decided(matching_events, min_matches, max_matches)
+
+        assert total >= min_matches, (
             "Event count is less than expected. "
-            f"wanted={min_matches} (min), got={len(matching_events)}"
+            f"wanted={min_matches} (min), got={total}"
         )
 
         if max_matches is not None:
-            assert len(matching_events) <= max_matches, (
+            assert total <= max_matches, (
                 "Event count is more than expected. "
-                f"wanted={max_matches} (max), got={len(matching_events)}"
+                f"wanted={max_matches} (max), got={format_count(matching_events)}"
             )
         return matching_events
 
+    def assert_rate(
+        self,
+        min_rate: Optional[float] = None,
+        max_rate: Optional[float] = None,
+        max_gap: Optional[float] = None,
+        max_jitter: Optional[float] = None,
+        jitter_percentile: int = 99,
+        window: float = 10.0,
+        reader: Optional[JsonReader] = None,
+        **kwargs,
+    ) -> ThroughputStats:
+        """Assert the publishing rate (throughput) of events over a sliding
+        time window. The observed throughput is logged and returned on success.
+
+        The events are either read from a realtime subscription (reader), or
+        polled using the given filter, e.g. after/before/max_age, type etc. The
+        observation period is defined by the after/before/max_age filter, otherwise
+        the time of the first and last event is used.
+
+        Args:
+            min_rate (float, optional): Minimum events per second within any window
+            max_rate (float, optional): Maximum events per second within any window
+            max_gap (float, optional): Maximum time in seconds between events
+            max_jitter (float, optional): Maximum deviation in seconds of the interarrival
+                time from the mean interarrival time (at the jitter_percentile)
+            jitter_percentile (int, optional): Percentile used for the jitter check.
+                Defaults to 99.
+            window (float, optional): Sliding window in seconds. Defaults to 10.
+            reader (JsonReader, optional): Realtime subscription, e.g.
+                realtime.Subscriber.to_events(...). It is read until the
+                subscription ends.
+
+        Returns:
+            ThroughputStats: Observed throughput
+        """
+        # pylint: disable=too-many-arguments
+        if reader is not None:
+            timestamps = timestamps_from_stream(reader)
+        else:
+            source = kwargs.pop("source", self.context.device_id)
+            if not source:
+                raise FinalAssertionError(
+                    "source and the current device context is empty. One of these values must be set!"
+                )
+            timestamps = [
+                to_datetime(item.time).timestamp()
+                for item in self.context.client.events.select(source=source, **kwargs)
+                if item.time
+            ]
+
+        start, end = observation_period(kwargs)
+        return assert_throughput(
+            "Event",
+            timestamps,
+            window=window,
+            start=start,
+            end=end,
+            min_rate=min_rate,
+            max_rate=max_rate,
+            max_gap=max_gap,
+            max_jitter=max_jitter,
+            jitter_percentile=jitter_percentile,
+        )
+
     def assert_exists(self, event_id: str, **kwargs) -> Event:
         """Assert that an event exists and return it if found"""
         try:
@@ -138,6 +309,29 @@ class Events(AssertDevice):
 
         return event
 
+    def _attachment_url(self, event_id: str) -> str:
+        return self.context.client.events.build_object_path(event_id) + "/binaries"
+
+    def _verify_attachment(
+        self,
+        event_id: str,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        **kwargs,
+    ) -> AttachmentDigest:
+        digest, errors = verify_chunks(
+            download_chunks(
+                self.context.client,
+                self._attachment_url(event_id),
+                chunk_size=chunk_size,
+            ),
+            **kwargs,
+        )
+        assert len(errors) == 0, (
+            f"Event binary did not match expectations. event_id={event_id}\n"
+            + "\n".join(f"  {error}" for error in errors)
+        )
+        return digest
+
     def assert_attachment(
         self,
         event_id: str,
@@ -146,58 +340,187 @@ class Events(AssertDevice):
         expected_size_min: Optional[int] = None,
         expected_md5: Optional[str] = None,
         encoding: str = "utf8",
+        expected_sha256: Optional[str] = None,
+        expected_window_pattern: Optional[str] = None,
+        window_size: int = DEFAULT_WINDOW_SIZE,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
         **kwargs,
     ) -> bytes:
         """Assert that an event has an attachment
 
+        The attachment is downloaded in chunks and all checks (except expected_pattern)
+        are done incrementally. Use assert_attachment_digest to verify large
+        attachments without keeping the contents in memory.
+
         Args:
             event_id (str, optional): Event id which should have an attachment (binary)
             expected_contents (str, optional): Expected contents (as a string) should exactly match against. Ignored if set to None.
             expected_pattern (str, optional): Expected regex pattern which the contents should match (using re.MULTILINE | re.DOTALL regex flags).
-                Ignored if set to None
+                The whole contents are required to check the pattern. Ignored if set to None
             expected_size_min (int, optional): Expected minimum size in bytes. Ignored if set to None.
             expected_md5 (str, optional): Expected md5 checksum or a file that should be used
                 to calculated the md5 checksum from. Defaults to None.
             encoding (str, optional): Encoding to be used when comparing the attachment contents. Defaults to 'utf8'
+            expected_sha256 (str, optional): Expected sha256 checksum or a file that should be used
+                to calculated the sha256 checksum from. Defaults to None.
+            expected_window_pattern (str, optional): Regex pattern which should be found
+                anywhere in the contents (using the re.MULTILINE flag). The contents are
+                searched using a sliding window, so the match can not be longer than
+                window_size. Ignored if set to None.
+            window_size (int, optional): Sliding window size in bytes. Defaults to 64KB.
+            chunk_size (int, optional): Download chunk size in bytes. Defaults to 64KB.
 
         Returns:
             bytes: Attachment bytes
         """
+        # pylint: disable=too-many-arguments
+        digest = self._verify_attachment(
+            event_id,
+            chunk_size=chunk_size,
+            expected_contents=expected_contents,
+            expected_pattern=expected_pattern,
+            expected_window_pattern=expected_window_pattern,
+            window_size=window_size,
+            expected_size_min=expected_size_min,
+            expected_md5=expected_md5,
+            expected_sha256=expected_sha256,
+            encoding=encoding,
+            keep_contents=True,
+        )
 
-        url = self.context.client.events.build_object_path(event_id) + "/binaries"
-        downloaded_file = self.context.client.get_file(url)
+        # Return raw bytes so the user can apply their own checks
+        return digest.contents
 
-        if expected_size_min is not None:
-            assert (
-                len(downloaded_file) >= expected_size_min
-            ), f"Expected file size to be greater or equal to {expected_size_min} bytes"
+    def assert_attachment_digest(
+        self,
+        event_id: str,
+        expected_contents: Optional[str] = None,
+        expected_size_min: Optional[int] = None,
+        expected_md5: Optional[str] = None,
+        expected_sha256: Optional[str] = None,
+        expected_window_pattern: Optional[str] = None,
+        window_size: int = DEFAULT_WINDOW_SIZE,
+        encoding: str = "utf8",
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        keep_contents: bool = False,
+        **kwargs,
+    ) -> AttachmentDigest:
+        """Assert that an event has an attachment, without keeping the contents in
+        memory (unless keep_contents is set). See assert_attachment for a description
+        of the checks.
 
-        # Compare contents (if provided by user)
-        if expected_pattern is not None:
-            contents = downloaded_file.decode(encoding)
-            assert contents == compare.RegexPattern(
-                expected_pattern, re.MULTILINE | re.DOTALL
-            )
-        elif expected_contents is not None:
-            contents = downloaded_file.decode(encoding)
-            assert contents == expected_contents
+        Returns:
+            AttachmentDigest: Size and checksums (md5 and sha256) of the attachment
+        """
+        # pylint: disable=too-many-arguments
+        return self._verify_attachment(
+            event_id,
+            chunk_size=chunk_size,
+            expected_contents=expected_contents,
+            expected_window_pattern=expected_window_pattern,
+            window_size=window_size,
+            expected_size_min=expected_size_min,
+            expected_md5=expected_md5,
+            expected_sha256=expected_sha256,
+            encoding=encoding,
+            keep_contents=keep_contents,
+        )
 
-        # Compare checksums
-        if expected_md5 is not None:
-            # Check if user provide the checksum as a file or not
-            if Path(expected_md5).is_file():
-                reference_file = expected_md5
-                with open(reference_file, "rb") as file:
-                    file_hash = hashlib.md5()
-                    while chunk := file.read(8192):
-                        file_hash.update(chunk)
-                    expected_md5 = file_hash.hexdigest()
-
-            file_md5 = hashlib.md5(downloaded_file).hexdigest().lower()
-            assert expected_md5.lower() == file_md5, (
-                "Event binary checksum (md5) did not match. "
-                f"wanted={expected_md5.lower()}, got={file_md5}"
-            )
+    def assert_attachments(
+        self,
+        events: Iterable[Union[Event, str]],
+        expected_name_pattern: Optional[str] = None,
+        expected_type_pattern: Optional[str] = None,
+        expected_contents: Optional[str] = None,
+        expected_size_min: Optional[int] = None,
+        expected_md5: Optional[str] = None,
+        expected_sha256: Optional[str] = None,
+        expected_window_pattern: Optional[str] = None,
+        window_size: int = DEFAULT_WINDOW_SIZE,
+        encoding: str = "utf8",
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        max_workers: int = 4,
+        **kwargs,
+    ) -> List[AttachmentResult]:
+        """Assert that multiple events have attachments matching the same expectations.
+        The attachments are downloaded (streamed) concurrently, and all events are
+        checked before the assertion fails, so the failure lists every event.
 
-        # Return raw bytes so the user can apply their own checks
-        return downloaded_file
+        See assert_attachment_info and assert_attachment for a description of the checks.
+
+        Args:
+            events (Iterable[Event | str]): Events or event ids. Events given as ids
+                are only looked up when the name or type pattern is set.
+            max_workers (int, optional): Maximum number of concurrent downloads.
+                Defaults to 4.
+
+        Returns:
+            List[AttachmentResult]: Result of each event (in the given order)
+        """
+        # pylint: disable=too-many-arguments,too-many-locals
+        # checksums given as files are only calculated once (not per event)
+        if expected_md5 is not None:
+            expected_md5 = resolve_checksum(expected_md5, "md5")
+        if expected_sha256 is not None:
+            expected_sha256 = resolve_checksum(expected_sha256, "sha256")
+
+        checks = {
+            "expected_contents": expected_contents,
+            "expected_window_pattern": expected_window_pattern,
+            "window_size": window_size,
+            "expected_size_min": expected_size_min,
+            "expected_md5": expected_md5,
+            "expected_sha256": expected_sha256,
+            "encoding": encoding,
+        }
+        info_patterns = {
+            "name": expected_name_pattern,
+            "type": expected_type_pattern,
+        }
+
+        def verify(event: Union[Event, str]) -> AttachmentResult:
+            result = AttachmentResult(event if isinstance(event, str) else event.id)
+            start = time.monotonic()
+            try:
+                if any(info_patterns.values()):
+                    if isinstance(event, str):
+                        try:
+                            event = self.context.client.events.get(event)
+                        except KeyError:
+                            result.errors.append("Event not found")
+                            result.duration = time.monotonic() - start
+                            return result
+                    info = event.to_json().get("c8y_IsBinary")
+                    if info is None:
+                        result.errors.append("Event has no c8y_IsBinary fragment")
+                    for key, pattern in info_patterns.items():
+                        if info and pattern and not re.match(pattern, info.get(key, "")):
+                            result.errors.append(
+                                f"Attachment {key} does not match. "
+                                f"wanted={pattern}, got={info.get(key)}"
+                            )
+                result.digest, errors = verify_chunks(
+                    download_chunks(
+                        self.context.client,
+                        self._attachment_url(result.event_id),
+                        chunk_size=chunk_size,
+                    ),
+                    **checks,
+                )
+                result.errors.extend(errors)
+            except KeyError:
+                result.errors.append("Attachment not found")
+            except (SyntaxError, ValueError) as ex:
+                result.errors.append(str(ex))
+            result.duration = time.monotonic() - start
+            return result
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(verify, events))
+
+        failed = [result for result in results if not result.ok]
+        assert len(failed) == 0, (
+            f"{len(failed)} of {len(results)} event attachment/s did not match expectations\n"
+            + format_results(results)
+        )
+        return results
@@ -26,7 +26,7 @@ class FirmwareManagement(AssertDevice):
     ) -> ManagedObject:
         """Assert a firmware name and optional version"""
         if mo is None:
-            mo = self.context.client.inventory.get(self.context.device_id)
+            mo = self._get_managed_object("c8y_Firmware")
 
         assert compare_dataclass(mo.to_json()["c8y_Firmware"], expected_firmware), (
             f"Firmware does not match. "
@@ -39,7 +39,7 @@ class FirmwareManagement(AssertDevice):
     ):
         """Assert that the device firmware does not match"""
         if mo is None:
-            mo = self.context.client.inventory.get(self.context.device_id)
+            mo = self._get_managed_object("c8y_Firmware")
 
         assert not compare_dataclass(
             mo.to_json()["c8y_Firmware"], expected_firmware
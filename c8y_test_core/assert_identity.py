@@ -2,6 +2,7 @@
 from c8y_api.model import ManagedObject
 
 from c8y_test_core.assert_device import AssertDevice
+from c8y_test_core.identity_cache import get_identity_cache
 
 
 class DeviceNotFound(AssertionError):
@@ -20,8 +21,9 @@ class AssertIdentity(AssertDevice):
     ) -> ManagedObject:
         """Assert that the external id exists"""
         try:
-            mo = self.context.client.identity.get_object(
-                external_id=external_id, external_type=external_type
+            # the identity itself is checked, so the cache is only updated
+            mo = get_identity_cache(self.context.client).get_object(
+                external_id=external_id, external_type=external_type, refresh=True
             )
         except KeyError as ex:
             raise DeviceNotFound() from ex
@@ -1,15 +1,31 @@
 """Inventory assertions
 """
+import dataclasses
 import logging
-from typing import Any, Dict, List, Optional
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence
 from c8y_api.model import ManagedObject
 from c8y_test_core.assert_device import AssertDevice
-from c8y_test_core.compare import compare_dataclass
+from c8y_test_core.c8y import error_status
+from c8y_test_core.compare import compare_dataclass, compile_matcher
 from c8y_test_core.errors import FinalAssertionError
+from c8y_test_core.identity_cache import get_identity_cache
+from c8y_test_core.records import Projection, select_records
 
 
 SUPPORTED_OPERATIONS = "c8y_SupportedOperations"
 
+# Maximum number of ids per request when reading managed objects in bulk
+# (the ids are sent as a query parameter, so the url length is the limit)
+BULK_CHUNK_SIZE = 100
+
+# Child relationship types
+CHILD_TYPES = ("childDevices", "childAssets", "childAdditions")
+
+# Maximum page size supported by the inventory api
+MAX_PAGE_SIZE = 2000
+
 log = logging.getLogger()
 
 
@@ -21,6 +37,40 @@ class InventoryFound(AssertionError):
     """Inventory found"""
 
 
+@dataclasses.dataclass
+class TeardownReport:
+    """Result of a bulk device teardown. Devices are identified by their
+    external id, or by the managed object id when a query was used."""
+
+    removed: List[str] = dataclasses.field(default_factory=list)
+    already_removed: List[str] = dataclasses.field(default_factory=list)
+    failed: Dict[str, str] = dataclasses.field(default_factory=dict)
+
+    def __str__(self) -> str:
+        return (
+            f"removed={len(self.removed)}, already_removed={len(self.already_removed)}, "
+            f"failed={len(self.failed)}"
+        )
+
+
+HTTP_TOO_MANY_REQUESTS = 429
+
+
+def _retry_throttled(
+    func: Callable[[], Any], max_retries: int = 5, backoff: float = 0.5
+) -> Any:
+    """Call a function, and retry (with an exponential backoff) when the request
+    is rejected due to rate limiting (429 Too Many Requests)"""
+    for attempt in range(max_retries + 1):
+        try:
+            return func()
+        except ValueError as ex:
+            if error_status(ex) != HTTP_TOO_MANY_REQUESTS or attempt >= max_retries:
+                raise
+            time.sleep(backoff * 2**attempt)
+    return None
+
+
 class AssertInventory(AssertDevice):
     """Inventory assertions"""
 
@@ -57,6 +107,130 @@ class AssertInventory(AssertDevice):
         except KeyError:
             return
 
+    def get_managed_objects(
+        self,
+        inventory_ids: Optional[Iterable[str]] = None,
+        query: Optional[str] = None,
+        chunk_size: int = BULK_CHUNK_SIZE,
+    ) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Get many managed objects (as raw json) using a few requests, either by
+        their ids (sent in chunks using the ids query parameter) or an inventory
+        query. Child references are not included.
+
+        Args:
+            inventory_ids (Iterable[str], optional): Managed object ids
+            query (str, optional): Inventory query, e.g. "has(c8y_Agent)". If ids
+                are also given, then the query is sent with each chunk of ids, and
+                ids not matching the query are None.
+            chunk_size (int, optional): Maximum number of ids per request.
+                Defaults to 100.
+
+        Returns:
+            Dict[str, Optional[Dict[str, Any]]]: Managed object by id. If ids are
+                given, each id is included (in the same order) and is None if
+                it was not found.
+        """
+        ids = [str(value) for value in inventory_ids or []]
+        if query is None and not ids:
+            raise FinalAssertionError("Either inventory_ids or query is required")
+
+        found: Dict[str, Dict[str, Any]] = {}
+        if not ids:
+            for item in select_records(
+                self.context.client.inventory,
+                query=query,
+                page_size=MAX_PAGE_SIZE,
+                withChildren="false",
+            ):
+                found[item["id"]] = item
+        else:
+            # the query (if given) is sent with each chunk of ids, so only the
+            # requested managed objects are read
+            for index in range(0, len(ids), chunk_size):
+                chunk = ids[index : index + chunk_size]
+                for item in select_records(
+                    self.context.client.inventory,
+                    limit=len(chunk),
+                    ids=chunk,
+                    query=query,
+                    page_size=len(chunk),
+                    withChildren="false",
+                ):
+                    found[item["id"]] = item
+
+        if not ids:
+            return dict(found)
+        return {mo_id: found.get(mo_id) for mo_id in ids}
+
+    def assert_exists_many(
+        self,
+        inventory_ids: Optional[Iterable[str]] = None,
+        query: Optional[str] = None,
+        chunk_size: int = BULK_CHUNK_SIZE,
+        **kwargs,
+    ) -> Dict[str, Dict[str, Any]]:
+        """Assert that many inventory managed objects exist. See get_managed_objects
+
+        Returns:
+            Dict[str, Dict[str, Any]]: Managed object by id
+        """
+        result = self.get_managed_objects(inventory_ids, query, chunk_size)
+        missing = [mo_id for mo_id, mo in result.items() if mo is None]
+        if missing or not result:
+            raise InventoryNotFound(
+                f"Managed objects do not exist. missing={missing}, query={query}"
+            )
+        return result  # type: ignore
+
+    def assert_not_exists_many(
+        self,
+        inventory_ids: Optional[Iterable[str]] = None,
+        query: Optional[str] = None,
+        chunk_size: int = BULK_CHUNK_SIZE,
+        **kwargs,
+    ) -> None:
+        """Assert that none of the given managed objects (or none matching the
+        query) exist. See get_managed_objects"""
+        result = self.get_managed_objects(inventory_ids, query, chunk_size)
+        existing = [mo_id for mo_id, mo in result.items() if mo is not None]
+        if existing:
+            raise InventoryFound(f"Managed objects exist. existing={existing}")
+
+    def assert_contains_fragments_many(
+        self,
+        fragments: List[str],
+        inventory_ids: Optional[Iterable[str]] = None,
+        query: Optional[str] = None,
+        chunk_size: int = BULK_CHUNK_SIZE,
+        **kwargs,
+    ) -> Dict[str, Dict[str, Any]]:
+        """Assert the presence of fragments (regardless of value) in many managed
+        objects. See get_managed_objects
+
+        Args:
+            fragments (List[str]): Fragments which each managed object should contain
+            inventory_ids (Iterable[str], optional): Managed object ids
+            query (str, optional): Inventory query selecting the managed objects
+
+        Returns:
+            Dict[str, Dict[str, Any]]: Managed object by id
+        """
+        result = self.get_managed_objects(inventory_ids, query, chunk_size)
+        assert result, f"No managed objects matched the query. query={query}"
+        errors = {}
+        for mo_id, mo in result.items():
+            if mo is None:
+                errors[mo_id] = "not found"
+                continue
+            missing = [key for key in fragments if key not in mo]
+            if missing:
+                errors[mo_id] = f"missing={missing}"
+        assert not errors, (
+            f"{len(errors)} of {len(result)} managed object/s are missing some fragments\n"
+            + "\n".join(f"  {mo_id}: {reason}" for mo_id, reason in errors.items())
+        )
+        return result  # type: ignore
+
     def assert_contains_supported_operations(self, *types: str, **kwargs) -> List[str]:
         """Assert presence of some supported operations by checking the c8y_SupportedOperations
         fragment of the inventory managed object.
@@ -141,19 +315,26 @@ class AssertInventory(AssertDevice):
         mo: Optional[ManagedObject] = None,
         **kwargs,
     ) -> ManagedObject:
-        """Assert the present and the values of fragments in the device managed object"""
-        if mo is None:
-            mo = self.context.client.inventory.get(self.context.device_id)
+        """Assert the present and the values of fragments in the device managed object
 
+        The fragments are compiled into a matcher (see compare.compile_matcher)
+        which is cached, so retries only have to fetch and check the managed object.
+        """
         if not fragments:
             raise FinalAssertionError(
                 "At least 1 fragment is required to compare objects"
             )
 
-        assert compare_dataclass(mo.to_json(), fragments), (
+        if mo is None:
+            mo = self._get_managed_object(*fragments)
+
+        mo_dict = mo.to_json()
+        mismatches = compile_matcher(fragments).mismatches(mo_dict)
+        assert not mismatches, (
             "Managed object does not contain fragment values\n"
-            f"  wanted={fragments}\n"
-            f"  got={mo.to_json()}"
+            + "".join(f"  {mismatch}\n" for mismatch in mismatches)
+            + f"  wanted={fragments}\n"
+            f"  got={mo_dict}"
         )
         return mo
 
@@ -165,7 +346,7 @@ class AssertInventory(AssertDevice):
     ) -> ManagedObject:
         """Assert the present of fragments in the device managed object (regardless of value)"""
         if mo is None:
-            mo = self.context.client.inventory.get(self.context.device_id)
+            mo = self._get_managed_object(*fragments)
 
         mo_dict = mo.to_json()
         missing = [key for key in fragments if key not in mo_dict]
@@ -188,7 +369,7 @@ class AssertInventory(AssertDevice):
             mo (ManagedObject, optional): Managed object to check
         """
         if mo is None:
-            mo = self.context.client.inventory.get(self.context.device_id)
+            mo = self._get_managed_object(*fragments)
 
         mo_dict = mo.to_json()
         existing = [key for key in fragments if key in mo_dict]
@@ -210,22 +391,112 @@ class AssertInventory(AssertDevice):
         reference = reference_object.get(fragment) if fragment else reference_object
 
         if mo is None:
-            mo = self.context.client.inventory.get(self.context.device_id)
+            mo = self._get_managed_object(*([fragment] if fragment else []))
         assert not compare_dataclass(mo.to_json().get(fragment), reference)
         return mo
 
-    def assert_child_device_count(
-        self, min_count: int = 1, max_count: Optional[int] = None, **kwargs
-    ) -> List[Dict[str, Any]]:
-        """Assert that a device has a specific number of child devices"""
+    def _child_references_path(self, child_type: str, mo_id: Optional[str]) -> str:
+        if child_type not in CHILD_TYPES:
+            raise FinalAssertionError(
+                f"Invalid child type. got={child_type}, wanted one of {list(CHILD_TYPES)}"
+            )
+        return f"/inventory/managedObjects/{mo_id or self.context.device_id}/{child_type}"
+
+    def _iter_child_references(
+        self,
+        child_type: str = "childDevices",
+        mo_id: Optional[str] = None,
+        page_size: int = MAX_PAGE_SIZE,
+    ) -> Iterator[Dict[str, Any]]:
+        path = self._child_references_path(child_type, mo_id)
+        page = 1
+        while True:
+            response = self.context.client.get(
+                path, params={"pageSize": page_size, "currentPage": page}
+            )
+            references = response.get("references", [])
+            yield from references
+            if len(references) < page_size:
+                return
+            page += 1
+
+    def iter_children(
+        self,
+        child_type: str = "childDevices",
+        mo_id: Optional[str] = None,
+        fields: Optional[Sequence[str]] = None,
+        page_size: int = MAX_PAGE_SIZE,
+    ) -> Iterator[Any]:
+        """Iterate over the children of a managed object. The pages are read
+        lazily, so gateways with a large number of children can be processed
+        without holding all of the children in memory.
+
+        Args:
+            child_type (str, optional): Child relationship type, e.g. childDevices,
+                childAssets, childAdditions. Defaults to 'childDevices'
+            mo_id (str, optional): Managed object (parent) id. Defaults to the
+                device id of the context.
+            fields (Sequence[str], optional): Only return records with the given
+                fields, e.g. ["id", "name"]. If None, the child managed objects
+                (as included in the references) are returned.
+            page_size (int, optional): Number of children per request. Defaults to 2000.
+
+        Returns:
+            Iterator[Any]: Child managed objects (raw json) or records
+        """
+        parse = Projection(fields) if fields is not None else None
+        for reference in self._iter_child_references(child_type, mo_id, page_size):
+            child = reference.get("managedObject", {})
+            if child:
+                yield parse(child) if parse else child
+
+    def count_children(
+        self, child_type: str = "childDevices", mo_id: Optional[str] = None
+    ) -> int:
+        """Count the children of a managed object using a single request (the total
+        is read from the page statistics)"""
         response = self.context.client.get(
-            f"/inventory/managedObjects/{self.context.device_id}/childDevices",
+            self._child_references_path(child_type, mo_id),
             params={
-                "pageSize": 2000,
+                "pageSize": 1,
+                "withTotalPages": "true",
             },
         )
+        return response["statistics"]["totalPages"]
 
-        children = response.get("references", [])
+    def assert_child_count(
+        self,
+        min_count: Optional[int] = 1,
+        max_count: Optional[int] = None,
+        child_type: str = "childDevices",
+        mo_id: Optional[str] = None,
+        **kwargs,
+    ) -> int:
+        """Assert the number of children of a managed object without reading
+        the children
+
+        Returns:
+            int: Number of children
+        """
+        total = self.count_children(child_type, mo_id)
+        if min_count is not None:
+            assert total >= min_count, (
+                f"Expected total {child_type} count to be greater than or equal to {min_count}. "
+                f"got={total}"
+            )
+        if max_count is not None:
+            assert total <= max_count, (
+                f"Expected total {child_type} count to be less than or equal to {max_count}. "
+                f"got={total}"
+            )
+        return total
+
+    def assert_child_device_count(
+        self, min_count: int = 1, max_count: Optional[int] = None, **kwargs
+    ) -> List[Dict[str, Any]]:
+        """Assert that a device has a specific number of child devices. Use
+        assert_child_count if the child references are not needed"""
+        children = list(self._iter_child_references("childDevices"))
 
         if min_count is not None:
             assert (
@@ -243,29 +514,14 @@ class AssertInventory(AssertDevice):
         self, *expected_devices: str, **kwargs
     ) -> List[Dict[str, Any]]:
         """Assert that a device has child devices with the specified names"""
-        response = self.context.client.get(
-            f"/inventory/managedObjects/{self.context.device_id}/childDevices"
-        )
-
-        children = []
-        for child in response.get("references", []):
-            child_mo = child.get("managedObject", {})
-            if child_mo:
-                children.append(child_mo)
+        children = list(self.iter_children("childDevices"))
 
         assert sorted(expected_devices) == sorted(map(lambda x: x["name"], children))
         return children
 
     def assert_no_child_devices(self, **kwargs):
         """Assert that a device has no child devices"""
-        result_json = self.context.client.get(
-            f"/inventory/managedObjects/{self.context.device_id}/childDevices",
-            params={
-                "pageSize": 1,
-                "withTotalPages": "true",
-            },
-        )
-        total = result_json["statistics"]["totalPages"]
+        total = self.count_children("childDevices")
         assert total == 0, (
             "Managed object should not have any child devices\n"
             "want=0\n"
@@ -291,22 +547,31 @@ class AssertInventory(AssertDevice):
                 current context is used.
         """
 
-        child_id = ""
-        try:
-            child_identity_obj = self.context.client.identity.get(
-                child_identity, child_identity_type
-            )
-            child_id = child_identity_obj.managed_object_id
-            assert child_id, "Child id should not be empty"
-        except KeyError as ex:
-            raise InventoryNotFound from ex
+        mo_id = self.context.device_id
+        if mo is not None:
+            mo_id = mo.id
 
-        try:
-            mo_id = self.context.device_id
-            if mo is not None:
-                mo_id = mo.id
+        def get_reference(child_id: str) -> Any:
+            assert child_id, "Child id should not be empty"
             return self.context.client.get(
                 f"/inventory/managedObjects/{mo_id}/{child_type}/{child_id}"
+            )
+
+        def is_stale(child_id: str) -> bool:
+            try:
+                self.context.client.get(
+                    f"/inventory/managedObjects/{child_id}",
+                    params={"withChildren": "false"},
+                )
+                return False
+            except KeyError:
+                return True
+
+        try:
+            # a missing reference is expected while retrying, so a cached child id
+            # is only looked up again if the child managed object does not exist
+            return get_identity_cache(self.context.client).call_with_id(
+                child_identity, child_identity_type, get_reference, is_stale=is_stale
             )  # type: ignore
         except KeyError as ex:
             raise InventoryNotFound from ex
@@ -319,8 +584,9 @@ class AssertInventory(AssertDevice):
     ) -> None:
         """Assert device user and all child devices. The device user is then deleted afterwards"""
 
+        identities = get_identity_cache(self.context.client)
         try:
-            mo_id = self.context.client.identity.get_id(external_id, external_type)
+            mo_id = identities.get_id(external_id, external_type)
             log.info(
                 "Removing managed object and all child devices. id=%s",
                 mo_id,
@@ -332,7 +598,9 @@ class AssertInventory(AssertDevice):
                     "withDeviceUser": False,
                 },
             )
+            identities.invalidate(external_id, external_type, mo_id=mo_id)
         except KeyError as ex:
+            identities.invalidate(external_id, external_type)
             log.info("Device has already been removed. %s", ex)
         except Exception as ex:
             log.error("Could not delete device. %s", ex)
@@ -352,6 +620,126 @@ class AssertInventory(AssertDevice):
             log.error("Could not delete device user. name=%s, ex=%s", username, ex)
             raise
 
+    def delete_devices_and_users(
+        self,
+        external_ids: Optional[Iterable[str]] = None,
+        external_type: str = "c8y_Serial",
+        query: Optional[str] = None,
+        max_workers: int = 8,
+        max_retries: int = 5,
+        backoff: float = 0.5,
+        allow_failures: bool = False,
+        **kwargs,
+    ) -> TeardownReport:
+        """Delete many devices (including child devices) and their device users
+        concurrently. Requests rejected due to rate limiting (429) are retried.
+
+        Args:
+            external_ids (Iterable[str], optional): External ids of the devices
+            external_type (str, optional): External type. Defaults to c8y_Serial
+            query (str, optional): Inventory query selecting the devices to delete,
+                e.g. "name eq 'pool_*'". The device user is taken from the owner
+                of the managed object. Used instead of external_ids.
+            max_workers (int, optional): Maximum number of concurrent devices being
+                deleted. Defaults to 8
+            max_retries (int, optional): Maximum number of retries of a request due to
+                rate limiting. Defaults to 5
+            backoff (float, optional): Initial retry delay in seconds. Defaults to 0.5
+            allow_failures (bool, optional): Return the failed devices instead of
+                failing the assertion. Defaults to False
+
+        Returns:
+            TeardownReport: Removed, already removed and failed devices
+        """
+        # pylint: disable=too-many-arguments
+        client = self.context.client
+        tenant_id = client.tenant_id
+        identities = get_identity_cache(client)
+
+        def call(func: Callable[[], Any]) -> Any:
+            return _retry_throttled(func, max_retries=max_retries, backoff=backoff)
+
+        def delete_object(mo_id: str) -> bool:
+            try:
+                call(
+                    lambda: client.delete(
+                        f"/inventory/managedObjects/{mo_id}",
+                        params={"cascade": True, "withDeviceUser": False},
+                    )
+                )
+                return True
+            except KeyError:
+                return False
+            finally:
+                identities.invalidate(mo_id=mo_id)
+
+        def delete(key: str, mo_id: Optional[str], username: Optional[str]) -> str:
+            removed = False
+            if mo_id is not None:
+                removed = delete_object(mo_id)
+            else:
+                try:
+                    mo_id = call(lambda: identities.get_id(key, external_type))
+                    removed = delete_object(mo_id)
+                    if not removed:
+                        # the cached id might be stale, so check the identity again
+                        mo_id = call(
+                            lambda: identities.get_id(key, external_type, refresh=True)
+                        )
+                        removed = delete_object(mo_id)
+                except KeyError:
+                    pass
+                identities.invalidate(key, external_type)
+            if username:
+                try:
+                    call(lambda: client.delete(f"/user/{tenant_id}/users/{username}"))
+                    removed = True
+                except KeyError:
+                    pass
+            return "removed" if removed else "already_removed"
+
+        if query is not None:
+            targets = [
+                (
+                    item.id,
+                    item.id,
+                    item.owner if (item.owner or "").startswith("device_") else None,
+                )
+                for item in select_records(
+                    client.inventory,
+                    fields=["id", "owner"],
+                    query=query,
+                    page_size=MAX_PAGE_SIZE,
+                )
+            ]
+        else:
+            targets = [
+                (external_id, None, f"device_{external_id}")
+                for external_id in external_ids or []
+            ]
+
+        report = TeardownReport()
+
+        def run(target) -> None:
+            key = target[0]
+            try:
+                status = delete(*target)
+            except Exception as ex:  # pylint: disable=broad-except
+                log.error("Could not delete device. id=%s, ex=%s", key, ex)
+                report.failed[key] = str(ex)
+                return
+            getattr(report, status).append(key)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(run, targets))
+
+        log.info("Device teardown: %s", report)
+        assert allow_failures or not report.failed, (
+            f"Failed to delete {len(report.failed)} device/s\n"
+            + "\n".join(f"  {key}: {reason}" for key, reason in report.failed.items())
+        )
+        return report
+
     def get_services(
         self,
         inventory_id,
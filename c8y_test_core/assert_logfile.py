@@ -33,7 +33,7 @@ class DeviceLogFile(AssertDevice):
             List[str]: List of supported log types
         """
         if mo is None:
-            mo = self.context.client.inventory.get(self.context.device_id)
+            mo = self._get_managed_object(SUPPORTED_LOGFILE_TYPES)
         mo_json = mo.to_json()
 
         assert (
@@ -80,7 +80,7 @@ class DeviceLogFile(AssertDevice):
             List[str]: List of supported log types
         """
         if mo is None:
-            mo = self.context.client.inventory.get(self.context.device_id)
+            mo = self._get_managed_object(SUPPORTED_LOGFILE_TYPES)
         mo_json = mo.to_json()
 
         assert (
@@ -1,27 +1,114 @@
 """Measurement assertions"""
-from typing import Any, List, Optional
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
 
 from c8y_api.model import Measurement
 
 from c8y_test_core.assert_device import AssertDevice
+from c8y_test_core.context import AssertContext
 from c8y_test_core.errors import FinalAssertionError
+from c8y_test_core.paging import (
+    CursorStore,
+    LazySequence,
+    QueryCursor,
+    fetch_until_decided,
+    item_time,
+    select_with_shards,
+    to_datetime,
+)
+from c8y_test_core.proc_utils import JsonReader
+from c8y_test_core.records import ensure_fields, get_select
+from c8y_test_core.series import (
+    MAX_DIAGNOSTIC_VALUES,
+    SeriesData,
+    SeriesInterval,
+    check_series,
+    extract_series,
+    find_missing_intervals,
+    get_aggregation_interval,
+)
+from c8y_test_core.throughput import (
+    ThroughputStats,
+    assert_throughput,
+    observation_period,
+    timestamps_from_stream,
+)
 
 
-def _sort_by_time(item: Measurement):
+def _sort_by_time(item: Any):
     """Sort measurement by time
 
     Args:
-        item (Measurement): measurement
+        item (Any): measurement (object, raw dictionary or record)
 
     Returns:
         float: timestamp
     """
-    return item.datetime.timestamp() or 0
+    value = item_time(item)
+    return value.timestamp() if value else 0
 
 
 class AssertMeasurements(AssertDevice):
     """Measurement assertions"""
 
+    def __init__(self, context: AssertContext) -> None:
+        super().__init__(context)
+        self._cursors = CursorStore(lambda: QueryCursor(item_time))
+
+    def reset_cursors(self) -> None:
+        """Forget all measurements accumulated by incremental assertions"""
+        self._cursors.clear()
+
+    def _select(
+        self,
+        incremental: bool = False,
+        shards: int = 0,
+        raw: bool = False,
+        fields: Optional[Sequence[str]] = None,
+        **kwargs,
+    ) -> LazySequence[Measurement]:
+        """Select measurements (unsorted). See assert_count for a description
+        of the incremental, shards, raw and fields options"""
+        source = kwargs.pop("source", self.context.device_id) or None
+        if not source:
+            raise FinalAssertionError(
+                "source and the current device context is empty. One of these values must be set!"
+            )
+        page_size = kwargs.pop("pageSize", 2000)
+        fields = ensure_fields(fields, "id", "time")
+        select = get_select(self.context.client.measurements, raw=raw, fields=fields)
+
+        if incremental:
+            cursor = self._cursors.get(source=source, raw=raw, fields=fields, **kwargs)
+            after = kwargs.pop("after", None)
+            max_age = kwargs.pop("max_age", None)
+            if max_age is not None:
+                after = datetime.now(timezone.utc) - max_age
+            if after is not None:
+                # measurements seen by previous polls might be outside of the window now
+                cursor.evict_before(after)
+            kwargs["after"] = cursor.after(after)
+            cursor.merge(
+                select_with_shards(
+                    select,
+                    shards=shards,
+                    source=source,
+                    page_size=page_size,
+                    **kwargs,
+                )
+            )
+            return LazySequence(cursor.items())
+
+        return LazySequence(
+            select_with_shards(
+                select,
+                shards=shards,
+                source=source,
+                page_size=page_size,
+                **kwargs,
+            )
+        )
+
     def _get_supported_series(self) -> List[str]:
         response = self.context.client.get(
             f"/inventory/managedObjects/{self.context.device_id}/supportedSeries"
@@ -60,10 +147,17 @@ class AssertMeasurements(AssertDevice):
         min_count: int = 1,
         max_count: Optional[int] = None,
         sort_newest: bool = False,
+        incremental: bool = False,
+        shards: int = 0,
+        raw: bool = False,
+        fields: Optional[Sequence[str]] = None,
         **kwargs,
-    ) -> List[Any]:
+    ) -> LazySequence[Measurement]:
         """Assert a measurement count
 
+        Only the pages required to decide the assertion are fetched. The remaining
+        measurements are fetched (and sorted) when the returned sequence is accessed.
+
         Args:
             min_count (int, optional): Minimum (inclusive) number of matches.
                 Ignored if set to None. Defaults to 1.
@@ -75,24 +169,33 @@ class AssertMeasurements(AssertDevice):
                 measurements are being used. Doing client-side sorting ensures
                 consistent results across the two different measurement types.
                 Defaults to False.
+            incremental (bool, optional): Remember the measurements seen by previous
+                calls (e.g. retries) using the same filter, and only fetch measurements
+                which are newer than the newest measurement seen so far. The new
+                measurements are merged into the previous results (deduplicated by id).
+                Relative filters like max_age are resolved on each call, but already
+                seen measurements are kept. Use reset_cursors() to forget previous
+                results. Defaults to False.
+            shards (int, optional): Split the time range (after/max_age and before) into
+                the given number of shards which are fetched concurrently. Shards
+                with too many pages are split further. All pages are fetched
+                when shards are used. Ignored if set to 0. Defaults to 0.
+            raw (bool, optional): Return the raw json dictionaries instead of
+                Measurement objects. Defaults to False.
+            fields (Sequence[str], optional): Return compact records (namedtuples)
+                with only the given fields, e.g. ["time", "c8y_Temperature.T.value"].
+                Nested fields are accessible using underscores (c8y_Temperature_T_value).
+                The id and time fields are always included. Defaults to None.
 
         Returns:
-            List[Any]: List of measurements
+            LazySequence[Measurement]: Lazily materialized sequence of measurements.
+                It is read-only (not a list), use list() to get a list
         """
-        source = kwargs.pop("source", self.context.device_id) or None
-        if not source:
-            raise FinalAssertionError(
-                "source and the current device context is empty. One of these values must be set!"
-            )
-        page_size = kwargs.pop("pageSize", 2000)
-
-        measurements = self.context.client.measurements.get_all(
-            source=source,
-            page_size=page_size,
-            **kwargs,
+        measurements = self._select(
+            incremental=incremental, shards=shards, raw=raw, fields=fields, **kwargs
         )
 
-        total = len(measurements)
+        total = fetch_until_decided(measurements, min_count, max_count)
 
         if min_count is not None and max_count is not None:
             assert min_count <= total <= max_count
@@ -102,6 +205,292 @@ class AssertMeasurements(AssertDevice):
             assert total <= max_count
 
         # always sort results to normalize the order between legacy and time series measurements
+        # (deferred until the measurements are accessed)
         measurements.sort(key=_sort_by_time, reverse=sort_newest)
 
         return measurements
+
+    def assert_series(
+        self,
+        fragment: str,
+        series: str,
+        min_count: int = 1,
+        min_value: Optional[float] = None,
+        max_value: Optional[float] = None,
+        monotonic: Optional[str] = None,
+        max_gap: Optional[float] = None,
+        min_rate: Optional[float] = None,
+        max_rate: Optional[float] = None,
+        mean: Optional[float] = None,
+        mean_tolerance: float = 0.0,
+        max_std: Optional[float] = None,
+        incremental: bool = False,
+        **kwargs,
+    ) -> SeriesData:
+        """Assert properties of all values of a measurement series. The values are
+        extracted into numpy arrays and the checks are evaluated vectorized, so it is
+        suitable for series with a large number of values.
+
+        Requires numpy, e.g. pip install "c8y-test-core[series]"
+
+        Args:
+            fragment (str): Value fragment, e.g. c8y_Temperature
+            series (str): Series name, e.g. T
+            min_count (int, optional): Minimum number of values. Defaults to 1.
+            min_value (float, optional): All values should be greater or equal to this value.
+            max_value (float, optional): All values should be less or equal to this value.
+            monotonic (str, optional): Expected monotonicity of the values, e.g. increasing,
+                non_decreasing, decreasing or non_increasing. See series.Monotonic.
+            max_gap (float, optional): Maximum time in seconds between consecutive values.
+            min_rate (float, optional): Minimum rate of change of the values (per second).
+            max_rate (float, optional): Maximum rate of change of the values (per second).
+            mean (float, optional): Expected mean of the values.
+            mean_tolerance (float, optional): Allowed absolute deviation from the
+                expected mean. Defaults to 0.
+            max_std (float, optional): Maximum standard deviation of the values.
+            incremental (bool, optional): Only fetch new measurements on each call.
+                See assert_count for details. Defaults to False.
+
+        Returns:
+            SeriesData: Series timestamps (epoch seconds) and values as numpy arrays
+        """
+        # pylint: disable=too-many-arguments,too-many-locals
+        measurements = self._select(
+            incremental=incremental,
+            value=fragment,
+            series=series,
+            **kwargs,
+        )
+        data = extract_series(measurements, fragment, series)
+
+        assert len(data) >= min_count, (
+            f"Series {data.name} has less values than expected. "
+            f"wanted={min_count} (min), got={len(data)}"
+        )
+
+        errors = check_series(
+            data,
+            min_value=min_value,
+            max_value=max_value,
+            monotonic=monotonic,
+            max_gap=max_gap,
+            min_rate=min_rate,
+            max_rate=max_rate,
+            mean=mean,
+            mean_tolerance=mean_tolerance,
+            max_std=max_std,
+        )
+        assert len(errors) == 0, (
+            f"Series {data.name} does not match expectations\n"
+            + "\n".join(f"  {error}" for error in errors)
+            + f"\nstats={data.stats()}"
+        )
+        return data
+
+    def _get_out_of_range_values(
+        self,
+        source: str,
+        series: str,
+        intervals: List[SeriesInterval],
+        interval: float,
+        min_value: Optional[float],
+        max_value: Optional[float],
+    ) -> List[Tuple[str, float]]:
+        """Download the raw measurements of the given intervals and return the
+        values which are out of range"""
+        # pylint: disable=too-many-arguments
+        fragment, name = series.split(".", 1)
+        values = []
+        for item in intervals:
+            for measurement in self.context.client.measurements.select(
+                source=source,
+                value=fragment,
+                series=name,
+                after=item.start,
+                before=item.start + timedelta(seconds=interval),
+                page_size=2000,
+            ):
+                value = (
+                    measurement.fragments.get(fragment, {}).get(name, {}).get("value")
+                )
+                if value is None:
+                    continue
+                if (min_value is not None and value < min_value) or (
+                    max_value is not None and value > max_value
+                ):
+                    values.append((measurement.time, value))
+                    if len(values) >= MAX_DIAGNOSTIC_VALUES:
+                        return values
+        return values
+
+    def assert_series_aggregates(
+        self,
+        series: str,
+        aggregation: str = "MINUTELY",
+        min_value: Optional[float] = None,
+        max_value: Optional[float] = None,
+        max_missing_intervals: int = 0,
+        after: Optional[Union[str, datetime]] = None,
+        before: Optional[Union[str, datetime]] = None,
+        max_age: Optional[timedelta] = None,
+        **kwargs,
+    ) -> List[SeriesInterval]:
+        """Assert the per-interval min/max values of a series using the server-side
+        aggregation of the measurement series endpoint, so raw measurements don't
+        need to be downloaded. Raw measurements are only downloaded for the intervals
+        which fail, to show the offending values.
+
+        The series endpoint only provides min/max values per interval, so counts can
+        only be checked in the form of missing intervals (intervals without any values).
+
+        Args:
+            series (str): Series name, including the fragment, e.g. c8y_Temperature.T
+            aggregation (str, optional): Aggregation type, MINUTELY, HOURLY or DAILY.
+                Defaults to MINUTELY.
+            min_value (float, optional): Minimum value of each interval.
+            max_value (float, optional): Maximum value of each interval.
+            max_missing_intervals (int, optional): Maximum number of intervals without
+                any values. Only intervals which are completely within the time range
+                are checked. Ignored if set to None. Defaults to 0.
+            after (str | datetime, optional): Start of the time range. Either after
+                or max_age must be set.
+            before (str | datetime, optional): End of the time range. Defaults to now.
+            max_age (timedelta, optional): Start of the time range relative to the end.
+
+        Returns:
+            List[SeriesInterval]: Aggregated values per interval
+        """
+        # pylint: disable=too-many-arguments,too-many-locals
+        source = kwargs.pop("source", self.context.device_id) or None
+        if not source:
+            raise FinalAssertionError(
+                "source and the current device context is empty. One of these values must be set!"
+            )
+        if after is None and max_age is None:
+            raise FinalAssertionError("Either after or max_age must be set")
+
+        interval = get_aggregation_interval(aggregation)
+        date_to = to_datetime(before) if before else datetime.now(timezone.utc)
+        date_from = to_datetime(after) if after else date_to - max_age
+
+        result = self.context.client.measurements.get_series(
+            source=source,
+            aggregation=aggregation.upper(),
+            series=series,
+            after=date_from,
+            before=date_to,
+        )
+        if result.truncated:
+            raise FinalAssertionError(
+                "Series result was truncated by the server. "
+                "Use a shorter time range or a larger aggregation interval"
+            )
+
+        intervals = []
+        if series in [spec.series for spec in result.specs]:
+            intervals = [
+                SeriesInterval(to_datetime(timestamp), min_val, max_val)
+                for timestamp, min_val, max_val in result.collect(
+                    series=series, timestamps=True
+                )
+            ]
+
+        errors = []
+        failed = [
+            item
+            for item in intervals
+            if (min_value is not None and item.min is not None and item.min < min_value)
+            or (max_value is not None and item.max is not None and item.max > max_value)
+        ]
+        if failed:
+            details = ", ".join(
+                f"{item.start.isoformat()} (min={item.min}, max={item.max})"
+                for item in failed[:MAX_DIAGNOSTIC_VALUES]
+            )
+            raw_values = self._get_out_of_range_values(
+                source, series, failed, interval, min_value, max_value
+            )
+            errors.append(
+                f"{len(failed)} interval/s out of range (min_value={min_value}, "
+                f"max_value={max_value}): {details}\n"
+                f"    raw values: {raw_values}"
+            )
+
+        if max_missing_intervals is not None:
+            missing = find_missing_intervals(intervals, date_from, date_to, interval)
+            if len(missing) > max_missing_intervals:
+                details = ", ".join(
+                    item.isoformat() for item in missing[:MAX_DIAGNOSTIC_VALUES]
+                )
+                errors.append(
+                    f"{len(missing)} interval/s without values "
+                    f"(max_missing_intervals={max_missing_intervals}): {details}"
+                )
+
+        assert len(errors) == 0, (
+            f"Series {series} aggregates ({aggregation}) do not match expectations\n"
+            + "\n".join(f"  {error}" for error in errors)
+        )
+        return intervals
+
+    def assert_rate(
+        self,
+        min_rate: Optional[float] = None,
+        max_rate: Optional[float] = None,
+        max_gap: Optional[float] = None,
+        max_jitter: Optional[float] = None,
+        jitter_percentile: int = 99,
+        window: float = 10.0,
+        reader: Optional[JsonReader] = None,
+        incremental: bool = False,
+        **kwargs,
+    ) -> ThroughputStats:
+        """Assert the publishing rate (throughput) of measurements over a sliding
+        time window. The observed throughput is logged and returned on success.
+
+        The measurements are either read from a realtime subscription (reader), or
+        polled using the given filter, e.g. after/before/max_age, type etc. The
+        observation period is defined by the after/before/max_age filter, otherwise
+        the time of the first and last measurement is used.
+
+        Args:
+            min_rate (float, optional): Minimum measurements per second within any window
+            max_rate (float, optional): Maximum measurements per second within any window
+            max_gap (float, optional): Maximum time in seconds between measurements
+            max_jitter (float, optional): Maximum deviation in seconds of the interarrival
+                time from the mean interarrival time (at the jitter_percentile)
+            jitter_percentile (int, optional): Percentile used for the jitter check.
+                Defaults to 99.
+            window (float, optional): Sliding window in seconds. Defaults to 10.
+            reader (JsonReader, optional): Realtime subscription, e.g.
+                realtime.Subscriber.to_measurements(...). It is read until the
+                subscription ends.
+            incremental (bool, optional): Only fetch new measurements on each call.
+                See assert_count for details. Defaults to False.
+
+        Returns:
+            ThroughputStats: Observed throughput
+        """
+        # pylint: disable=too-many-arguments
+        if reader is not None:
+            timestamps = timestamps_from_stream(reader)
+        else:
+            timestamps = [
+                to_datetime(item.time).timestamp()
+                for item in self._select(incremental=incremental, **kwargs)
+                if item.time
+            ]
+
+        start, end = observation_period(kwargs)
+        return assert_throughput(
+            "Measurement",
+            timestamps,
+            window=window,
+            start=start,
+            end=end,
+            min_rate=min_rate,
+            max_rate=max_rate,
+            max_gap=max_gap,
+            max_jitter=max_jitter,
+            jitter_percentile=jitter_percentile,
+        )
@@ -1,7 +1,11 @@
 """Operation collection assertions"""
-from typing import Any, List, Optional
+from typing import Optional, Sequence
+
+from c8y_api.model import Operation
 
 from c8y_test_core.context import AssertContext
+from c8y_test_core.paging import LazySequence, fetch_until_decided, format_count
+from c8y_test_core.records import ensure_fields, get_select
 from c8y_test_core.retry import configure_retry_on_members, strip_retry_parameters
 
 
@@ -20,9 +24,20 @@ class AssertOperations:
         fragment: Optional[str] = None,
         status: Optional[str] = None,
         device_id: Optional[str] = None,
+        raw: bool = False,
+        fields: Optional[Sequence[str]] = None,
         **kwargs,
-    ) -> List[Any]:
-        """Assert the count of operations given a given status"""
+    ) -> LazySequence[Operation]:
+        """Assert the count of operations given a given status
+
+        Only the pages required to decide the assertion are fetched. The remaining
+        operations are fetched when the returned sequence is accessed. The
+        sequence is read-only (not a list), use list() to get a list.
+
+        Use raw=True to return the raw json dictionaries, or fields to return
+        compact records (namedtuples) with only the given fields (the id is
+        always included) instead of Operation objects.
+        """
 
         # set existing device id context if not explicitly set
         if device_id is None:
@@ -43,14 +58,19 @@ class AssertOperations:
         if status:
             params["status"] = status
 
-        operations = self.context.client.operations.get_all(**params)
-        total = len(operations)
+        select = get_select(
+            self.context.client.operations,
+            raw=raw,
+            fields=ensure_fields(fields, "id"),
+        )
+        operations = LazySequence(select(**params))
+        total = fetch_until_decided(operations, min_count, max_count)
 
         if min_count is not None and (max_count is not None):
             assert min_count <= total <= max_count, (
                 "Operation count is not between min and max range (inclusive)\n"
                 f"want=Between {min_count} and {max_count}\n"
-                f"got={total}"
+                f"got={format_count(operations)}"
             )
 
         if min_count is not None and max_count is None:
@@ -64,14 +84,14 @@ class AssertOperations:
             assert total <= max_count, (
                 "Operation count is greater than expected\n"
                 f"want= <= {max_count}\n"
-                f"got={total}"
+                f"got={format_count(operations)}"
             )
 
         return operations
 
     def assert_all_completed(
         self, device_id: Optional[str] = None, **kwargs
-    ) -> List[Any]:
+    ) -> LazySequence[Operation]:
         """Assert that all operations have been completed, e.g. no operations are in
         PENDING or EXECUTING status.
 
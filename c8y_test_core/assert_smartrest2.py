@@ -4,6 +4,7 @@ import logging
 from typing import Any, Dict
 from c8y_api.model import ManagedObject
 from c8y_test_core.assert_device import AssertDevice
+from c8y_test_core.identity_cache import get_identity_cache
 
 
 log = logging.getLogger()
@@ -29,7 +30,7 @@ class AssertSmartREST2(AssertDevice):
             external_id (str): external id to check if it exists
         """
         try:
-            return self.context.client.identity.get_object(
+            return get_identity_cache(self.context.client).get_object(
                 external_id, SMARTREST2_EXTERNAL_ID_TYPE
             )
         except KeyError as ex:
@@ -43,8 +44,8 @@ class AssertSmartREST2(AssertDevice):
         """
         try:
             # expected to throw an error
-            self.context.client.identity.get_object(
-                external_id, SMARTREST2_EXTERNAL_ID_TYPE
+            get_identity_cache(self.context.client).get_object(
+                external_id, SMARTREST2_EXTERNAL_ID_TYPE, refresh=True
             )
             raise SmartREST2TemplateFound()
         except KeyError:
@@ -78,5 +79,8 @@ class AssertSmartREST2(AssertDevice):
         ).create()
 
         self.context.client.identity.create(name, SMARTREST2_EXTERNAL_ID_TYPE, mo.id)
+        get_identity_cache(self.context.client).put(
+            name, SMARTREST2_EXTERNAL_ID_TYPE, mo.id
+        )
 
         return mo
@@ -1,19 +1,281 @@
 """Software management"""
 import dataclasses
+import functools
+import itertools
+import logging
 import re
-from typing import Dict, Any, Optional
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, FrozenSet, Iterable, List, Optional, Sequence, Tuple
 
-from c8y_api.model import ManagedObject
+from c8y_api.model import ManagedObject, Operation
+from requests.exceptions import RequestException
 
 from c8y_test_core.assert_device import AssertDevice
 from c8y_test_core.assert_operation import AssertOperation
 from c8y_test_core.models import Software
 
 
+log = logging.getLogger()
+
 _package_name = str
 _package = Dict[str, Any]
 
 
+@functools.lru_cache(maxsize=1024)
+def compile_pattern(pattern: str) -> re.Pattern:
+    """Compile a version or type pattern. Patterns are cached, as the same
+    expected software is usually checked many times (e.g. on each retry)"""
+    return re.compile(pattern)
+
+
+class SoftwareIndex:
+    """Software list indexed by package name
+
+    The index is built once per software list, so checking m expected packages
+    against n installed packages is O(n + m) rather than O(n * m).
+    """
+
+    def __init__(self, software_list: Iterable[_package]) -> None:
+        self.packages: Dict[_package_name, List[_package]] = {}
+        for item in software_list:
+            self.packages.setdefault(item["name"], []).append(item)
+
+    def __contains__(self, name: _package_name) -> bool:
+        return name in self.packages
+
+    def get(self, name: _package_name) -> List[_package]:
+        """Get all packages with the given name (e.g. multiple versions or types)"""
+        return self.packages.get(name, [])
+
+    def find(self, name: _package_name, field: str, pattern: str) -> Optional[_package]:
+        """Find the first package with the given name whose field matches a pattern
+
+        Args:
+            name (str): Package name
+            field (str): Package field, e.g. version or softwareType
+            pattern (str): Regular expression (matched from the start of the value)
+
+        Returns:
+            Optional[_package]: Matching package, or None if there is no match
+        """
+        regex = compile_pattern(pattern)
+        for item in self.get(name):
+            if regex.match(item.get(field, "")):
+                return item
+        return None
+
+
+@dataclasses.dataclass(frozen=True)
+class SoftwareSnapshot:
+    """Compact copy of a software list, i.e. the (name, softwareType, version)
+    of each package. Snapshots are compared using set operations, so the
+    diff of large software lists only takes a few milliseconds."""
+
+    packages: FrozenSet[Tuple[str, str, str]]
+
+    @classmethod
+    def from_list(cls, software_list: Iterable[_package]) -> "SoftwareSnapshot":
+        """Create a snapshot from a c8y_SoftwareList fragment"""
+        return cls(
+            frozenset(
+                (
+                    item["name"],
+                    item.get("softwareType", ""),
+                    item.get("version", ""),
+                )
+                for item in software_list
+            )
+        )
+
+    def __len__(self) -> int:
+        return len(self.packages)
+
+    def diff(self, other: "SoftwareSnapshot") -> "SoftwareDiff":
+        """Get the changes from this snapshot to a later (other) snapshot.
+        Packages are identified by their name and type, so a package whose
+        version changed is reported as changed rather than removed and added.
+        Each added or removed version of a package is reported separately."""
+        before: Dict[Tuple[str, str], List[str]] = {}
+        for name, software_type, version in self.packages - other.packages:
+            before.setdefault((name, software_type), []).append(version)
+        after: Dict[Tuple[str, str], List[str]] = {}
+        for name, software_type, version in other.packages - self.packages:
+            after.setdefault((name, software_type), []).append(version)
+
+        result = SoftwareDiff()
+        for key in sorted(before.keys() | after.keys()):
+            name, software_type = key
+            # versions can be empty, so only the presence of the key is checked
+            old = tuple(sorted(before.get(key, [])))
+            new = tuple(sorted(after.get(key, [])))
+            if key in before and key in after:
+                result.changed.append(
+                    SoftwareChange(
+                        name,
+                        software_type,
+                        ",".join(old),
+                        ",".join(new),
+                        before_versions=old,
+                        after_versions=new,
+                    )
+                )
+            elif key in after:
+                result.added.extend(
+                    Software(name, version, softwareType=software_type)
+                    for version in new
+                )
+            else:
+                result.removed.extend(
+                    Software(name, version, softwareType=software_type)
+                    for version in old
+                )
+        return result
+
+
+@dataclasses.dataclass
+class SoftwareChange:
+    """Package whose version changed. before and after are comma separated if
+    the package had multiple versions, the individual versions are listed in
+    before_versions and after_versions."""
+
+    name: str
+    softwareType: str
+    before: str
+    after: str
+    before_versions: Tuple[str, ...] = dataclasses.field(default=(), compare=False)
+    after_versions: Tuple[str, ...] = dataclasses.field(default=(), compare=False)
+
+
+@dataclasses.dataclass
+class SoftwareDiff:
+    """Changes between two software snapshots (sorted by name and type)"""
+
+    added: List[Software] = dataclasses.field(default_factory=list)
+    removed: List[Software] = dataclasses.field(default_factory=list)
+    changed: List[SoftwareChange] = dataclasses.field(default_factory=list)
+
+    @property
+    def empty(self) -> bool:
+        """No packages were added, removed or changed"""
+        return not (self.added or self.removed or self.changed)
+
+    def __str__(self) -> str:
+        return (
+            f"added={[f'{item.name}={item.version}' for item in self.added]}, "
+            f"removed={[f'{item.name}={item.version}' for item in self.removed]}, "
+            f"changed={[f'{item.name}={item.before}->{item.after}' for item in self.changed]}"
+        )
+
+
+def _find_change(
+    items: Sequence[Any], expected: Software, version_field: str = "version"
+) -> Optional[Any]:
+    for item in items:
+        if item.name != expected.name:
+            continue
+        if expected.softwareType and not compile_pattern(expected.softwareType).match(
+            item.softwareType
+        ):
+            continue
+        if expected.version:
+            # each version of a package with multiple versions is matched separately
+            versions = getattr(item, f"{version_field}_versions", ()) or (
+                getattr(item, version_field),
+            )
+            pattern = compile_pattern(expected.version)
+            if not any(pattern.match(version) for version in versions):
+                continue
+        return item
+    return None
+
+
+@dataclasses.dataclass
+class SoftwareBatch:
+    """Batch of software which is updated using a single c8y_SoftwareUpdate operation
+
+    The status is the operation status, or empty if the batch has not been
+    submitted yet. Batches which did not finish within the timeout are PENDING
+    (or EXECUTING) and batches which could not be submitted are FAILED.
+    """
+
+    index: int
+    software: List[Software]
+    operation_id: Optional[str] = None
+    status: str = ""
+    failure_reason: str = ""
+    duration: float = 0.0
+
+    @property
+    def successful(self) -> bool:
+        """Batch was installed/removed successfully"""
+        return self.status == Operation.Status.SUCCESSFUL
+
+
+@dataclasses.dataclass
+class SoftwareRollout:
+    """Results of a chunked software update. A rollout can be resumed by passing
+    it to update_in_batches again, in which case only the batches which were
+    not successful are submitted. Batches whose operation is still in progress
+    (PENDING or EXECUTING) are waited for again instead of being resubmitted."""
+
+    batches: List[SoftwareBatch] = dataclasses.field(default_factory=list)
+    duration: float = 0.0
+
+    @property
+    def successful(self) -> List[SoftwareBatch]:
+        """Successful batches"""
+        return [batch for batch in self.batches if batch.successful]
+
+    @property
+    def failed(self) -> List[SoftwareBatch]:
+        """Batches which were submitted but did not succeed"""
+        return [
+            batch for batch in self.batches if batch.status and not batch.successful
+        ]
+
+    @property
+    def remaining(self) -> List[Software]:
+        """Software of all of the batches which were not successful"""
+        return [
+            software
+            for batch in self.batches
+            if not batch.successful
+            for software in batch.software
+        ]
+
+    @property
+    def done(self) -> bool:
+        """All batches were successful"""
+        return all(batch.successful for batch in self.batches)
+
+    def __str__(self) -> str:
+        return (
+            f"batches={len(self.batches)}, successful={len(self.successful)}, "
+            f"failed={len(self.failed)}, remaining_software={len(self.remaining)}, "
+            f"duration={self.duration:.3f}s"
+        )
+
+
+def _in_progress(batch: SoftwareBatch) -> bool:
+    """Batch was submitted but its operation was not done yet"""
+    return bool(batch.operation_id) and batch.status in (
+        Operation.Status.PENDING,
+        Operation.Status.EXECUTING,
+    )
+
+
+def _software_batches(
+    software_list: Iterable[Software], batch_size: int
+) -> List[SoftwareBatch]:
+    iterator = iter(software_list)
+    batches = []
+    while chunk := list(itertools.islice(iterator, batch_size)):
+        batches.append(SoftwareBatch(index=len(batches), software=chunk))
+    return batches
+
+
 class SoftwareManagement(AssertDevice):
     """Software management"""
 
@@ -51,6 +313,153 @@ class SoftwareManagement(AssertDevice):
             items.append(dataclasses.replace(software, action=self.Action.DELETE))
         return self.update(*items, **kwargs)
 
+    def install_in_batches(self, *software_list: Software, **kwargs) -> SoftwareRollout:
+        """Install software using multiple c8y_SoftwareUpdate operations.
+        See update_in_batches"""
+        return self.update_in_batches(
+            *[
+                dataclasses.replace(software, action=self.Action.INSTALL)
+                for software in software_list
+            ],
+            **kwargs,
+        )
+
+    def remove_in_batches(self, *software_list: Software, **kwargs) -> SoftwareRollout:
+        """Remove software using multiple c8y_SoftwareUpdate operations.
+        See update_in_batches"""
+        return self.update_in_batches(
+            *[
+                dataclasses.replace(software, action=self.Action.DELETE)
+                for software in software_list
+            ],
+            **kwargs,
+        )
+
+    def update_in_batches(
+        self,
+        *software_list: Software,
+        batch_size: int = 100,
+        max_concurrent: int = 1,
+        timeout: float = 300,
+        wait: float = 2,
+        stop_on_failure: bool = True,
+        rollout: Optional[SoftwareRollout] = None,
+        **kwargs,
+    ) -> SoftwareRollout:
+        """Install or delete a large number of software packages by splitting them
+        into batches, where each batch is a separate c8y_SoftwareUpdate operation.
+        Each operation is waited for before the next batch is submitted (unless
+        max_concurrent is greater than 1).
+
+        The returned rollout records the operation and status of each batch. If
+        some batches fail, the rollout can be resumed by passing it via the
+        rollout argument.
+
+        Example:
+            rollout = device.software_management.install_in_batches(*packages)
+            if not rollout.done:
+                rollout = device.software_management.update_in_batches(rollout=rollout)
+
+        Args:
+            *software_list (Software): Software to install or delete (ignored
+                when resuming a rollout)
+            batch_size (int, optional): Number of packages per operation. Defaults to 100.
+            max_concurrent (int, optional): Maximum number of operations which are
+                in progress at the same time. Defaults to 1 (sequential).
+            timeout (float, optional): Timeout in seconds to wait for each
+                operation to be done. Defaults to 300.
+            wait (float, optional): Interval in seconds at which the operation
+                status is checked. Defaults to 2.
+            stop_on_failure (bool, optional): Don't submit any more batches once
+                a batch has failed. Defaults to True.
+            rollout (SoftwareRollout, optional): Rollout to resume
+
+        Returns:
+            SoftwareRollout: Results of all batches
+        """
+        # pylint: disable=too-many-arguments
+        if batch_size <= 0:
+            raise ValueError("batch_size needs to be greater than 0")
+        if rollout is None:
+            rollout = SoftwareRollout(_software_batches(software_list, batch_size))
+
+        started = time.monotonic()
+        stopped = threading.Event()
+
+        def run(batch: SoftwareBatch) -> None:
+            if stopped.is_set():
+                if _in_progress(batch):
+                    # keep the operation of a previous run, so it is waited for on resume
+                    return
+                # clear any results of a previous run, as the batch was not submitted
+                batch.operation_id = None
+                batch.status = ""
+                batch.failure_reason = ""
+                batch.duration = 0.0
+                return
+            self._run_batch(batch, timeout=timeout, wait=wait, **kwargs)
+            if not batch.successful and stop_on_failure:
+                stopped.set()
+
+        pending = [batch for batch in rollout.batches if not batch.successful]
+        with ThreadPoolExecutor(max_workers=max(max_concurrent, 1)) as executor:
+            list(executor.map(run, pending))
+
+        rollout.duration += time.monotonic() - started
+        log.info("Software rollout finished. %s", rollout)
+        return rollout
+
+    def _run_batch(
+        self, batch: SoftwareBatch, timeout: float, wait: float, **kwargs
+    ) -> None:
+        started = time.monotonic()
+        resume = _in_progress(batch)
+        if not resume:
+            batch.operation_id = None
+        batch.failure_reason = ""
+        operation: Optional[AssertOperation] = None
+        try:
+            if resume:
+                # the operation of a previous run is still queued on the device, so
+                # wait for it again instead of submitting the same software again
+                operation = AssertOperation(
+                    self.context,
+                    self.context.client.operations.get(batch.operation_id),
+                )
+            else:
+                operation = self.update(*batch.software, **kwargs)
+            batch.operation_id = operation.id
+            result = operation.assert_done(timeout=timeout, wait=wait)
+            batch.status = result.status
+            batch.failure_reason = result.to_json().get("failureReason", "")
+        except AssertionError as ex:
+            # operation is not done yet
+            batch.status = Operation.Status.PENDING
+            batch.failure_reason = str(ex)
+            if operation is not None:
+                try:
+                    batch.status = (
+                        operation.fetch_operation().operation.status
+                        or Operation.Status.PENDING
+                    )
+                except (KeyError, SyntaxError, ValueError, RequestException, OSError):
+                    log.info("Could not refresh operation. id=%s", batch.operation_id)
+        except (KeyError, SyntaxError, ValueError, RequestException, OSError) as ex:
+            # request errors (which did not recover within the retry timeout) only
+            # fail the batch, so the rollout can be resumed
+            batch.status = Operation.Status.FAILED
+            batch.failure_reason = f"Request failed. {ex}"
+        batch.duration = time.monotonic() - started
+        log.info(
+            "Software batch done. index=%d, packages=%d, operation=%s, status=%s, "
+            "duration=%.3fs",
+            batch.index,
+            len(batch.software),
+            batch.operation_id,
+            batch.status,
+            batch.duration,
+        )
+
     def replace(self, *software_list: Software, **kwargs) -> AssertOperation:
         """Replace the software list on a device via the c8y_SoftwareList operation"""
         fragments = {
@@ -73,6 +482,102 @@ class SoftwareManagement(AssertDevice):
         VERSION_MISMATCH = "VERSION_MISMATCH"
         VERSION_MATCH = "VERSION_MATCH"
         TYPE_MATCH = "TYPE_MATCH"
+        NOT_ADDED = "NOT_ADDED"
+        NOT_REMOVED = "NOT_REMOVED"
+        NOT_CHANGED = "NOT_CHANGED"
+        UNEXPECTED_CHANGE = "UNEXPECTED_CHANGE"
+
+    def snapshot(self, mo: Optional[ManagedObject] = None) -> SoftwareSnapshot:
+        """Capture the current software list of the device, e.g. before
+        installing or removing software. See assert_software_changed
+
+        Args:
+            mo (ManagedObject, optional): Managed object to use instead of
+                fetching the device managed object
+
+        Returns:
+            SoftwareSnapshot: Snapshot of the software list
+        """
+        if mo is None:
+            mo = self._get_managed_object("c8y_SoftwareList")
+        if "c8y_SoftwareList" not in mo:
+            return SoftwareSnapshot(frozenset())
+        return SoftwareSnapshot.from_list(mo["c8y_SoftwareList"])
+
+    def assert_software_changed(
+        self,
+        before: SoftwareSnapshot,
+        added: Sequence[Software] = (),
+        removed: Sequence[Software] = (),
+        changed: Sequence[Software] = (),
+        exact: bool = False,
+        mo: Optional[ManagedObject] = None,
+        **kwargs,
+    ) -> SoftwareDiff:
+        """Assert the changes of the software list since a snapshot was taken.
+        The version and softwareType of the expected software are patterns
+        (and are ignored if empty).
+
+        Example:
+            before = device.software_management.snapshot()
+            device.software_management.install(Software("vim", "9.0"))
+            device.software_management.assert_software_changed(
+                before, added=[Software("vim", "9.0")]
+            )
+
+        Args:
+            before (SoftwareSnapshot): Snapshot taken before the change
+            added (Sequence[Software], optional): Packages which should have been added
+            removed (Sequence[Software], optional): Packages which should have been
+                removed. The version is matched against the removed version.
+            changed (Sequence[Software], optional): Packages whose version should
+                have changed. The version is matched against the new version.
+            exact (bool, optional): Fail if there are any other changes.
+                Defaults to False.
+            mo (ManagedObject, optional): Managed object to use instead of
+                fetching the device managed object
+
+        Returns:
+            SoftwareDiff: Changes since the snapshot
+        """
+        diff = before.diff(self.snapshot(mo))
+        errors = []
+        unmatched = []
+        for reason, expected_list, changes, version_field in (
+            (self.Reasons.NOT_ADDED, added, diff.added, "version"),
+            (self.Reasons.NOT_REMOVED, removed, diff.removed, "version"),
+            (self.Reasons.NOT_CHANGED, changed, diff.changed, "after"),
+        ):
+            # each change can only be matched by one expectation
+            items = list(changes)
+            for expected in expected_list:
+                item = _find_change(items, expected, version_field)
+                if item is None:
+                    errors.append((expected.name, reason))
+                else:
+                    items.remove(item)
+            unmatched.extend(items)
+
+        if exact:
+            for item in unmatched:
+                errors.append((item.name, self.Reasons.UNEXPECTED_CHANGE))
+
+        assert len(errors) == 0, (
+            "Software list did not change as expected. "
+            f"errors={errors}, diff=({diff})"
+        )
+        return diff
+
+    def assert_software_unchanged(
+        self,
+        before: SoftwareSnapshot,
+        mo: Optional[ManagedObject] = None,
+        **kwargs,
+    ) -> SoftwareDiff:
+        """Assert that the software list has not changed since a snapshot was taken"""
+        diff = before.diff(self.snapshot(mo))
+        assert diff.empty, f"Software list changed. diff=({diff})"
+        return diff
 
     def assert_software_installed(
         self,
@@ -90,13 +595,13 @@ class SoftwareManagement(AssertDevice):
                 by referencing individual packages by the package name.
         """
         if mo is None:
-            mo = self.context.client.inventory.get(self.context.device_id)
+            mo = self._get_managed_object("c8y_SoftwareList")
 
         assert (
             "c8y_SoftwareList" in mo
         ), "Managed object does not have a c8y_SoftwareList fragment"
 
-        installed = [item["name"] for item in mo["c8y_SoftwareList"]]
+        installed = SoftwareIndex(mo["c8y_SoftwareList"])
         errors = []
 
         for exp_software in expected_software_list:
@@ -105,26 +610,22 @@ class SoftwareManagement(AssertDevice):
                 continue
 
             # version check
-            if exp_software.version:
-                version_pattern = re.compile(exp_software.version)
-                for current_software in mo["c8y_SoftwareList"]:
-                    name = current_software.get("name", "")
-                    version = current_software.get("version", "")
-                    if name == exp_software.name and version_pattern.match(version):
-                        break
-                else:
-                    errors.append((exp_software.name, self.Reasons.VERSION_MISMATCH))
+            if (
+                exp_software.version
+                and installed.find(exp_software.name, "version", exp_software.version)
+                is None
+            ):
+                errors.append((exp_software.name, self.Reasons.VERSION_MISMATCH))
 
             # type check
-            if exp_software.softwareType:
-                type_pattern = re.compile(exp_software.softwareType)
-                for current_software in mo["c8y_SoftwareList"]:
-                    name = current_software.get("name", "")
-                    software_type = current_software.get("softwareType", "")
-                    if name == exp_software.name and type_pattern.match(software_type):
-                        break
-                else:
-                    errors.append((exp_software.name, self.Reasons.TYPE_MATCH))
+            if (
+                exp_software.softwareType
+                and installed.find(
+                    exp_software.name, "softwareType", exp_software.softwareType
+                )
+                is None
+            ):
+                errors.append((exp_software.name, self.Reasons.TYPE_MATCH))
 
         assert len(errors) == 0, (
             "Software not installed. "
@@ -146,13 +647,13 @@ class SoftwareManagement(AssertDevice):
         If the version is empty, then version matching is skipped.
         """
         if mo is None:
-            mo = self.context.client.inventory.get(self.context.device_id)
+            mo = self._get_managed_object("c8y_SoftwareList")
 
         assert (
             "c8y_SoftwareList" in mo
         ), "Managed object does not have a c8y_SoftwareList fragment"
 
-        installed = [item["name"] for item in mo["c8y_SoftwareList"]]
+        installed = SoftwareIndex(mo["c8y_SoftwareList"])
         errors = []
 
         for exp_software in unexpected_software_list:
@@ -161,15 +662,11 @@ class SoftwareManagement(AssertDevice):
                 continue
 
             # version check
-            version_pattern = re.compile(exp_software.version)
-            for current_software in mo["c8y_SoftwareList"]:
-                if current_software[
-                    "name"
-                ] == exp_software.name and version_pattern.match(
-                    current_software["version"]
-                ):
-                    errors.append((exp_software.name, self.Reasons.VERSION_MATCH))
-                    break
+            if (
+                installed.find(exp_software.name, "version", exp_software.version)
+                is not None
+            ):
+                errors.append((exp_software.name, self.Reasons.VERSION_MATCH))
 
         assert len(errors) == 0, (
             "Unwanted software installed. "
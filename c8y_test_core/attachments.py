@@ -0,0 +1,256 @@
+"""Streaming attachment (binary) helpers
+
+Attachments are downloaded in chunks, and the size, checksums and content checks
+are computed incrementally, so the memory usage does not depend on the size of
+the attachment (unless the contents are explicitly kept).
+"""
+import dataclasses
+import hashlib
+import re
+from pathlib import Path
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
+
+from c8y_api import CumulocityApi
+
+from c8y_test_core.c8y import check_response
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+# Longest match (in bytes) guaranteed to be found by a sliding window search
+DEFAULT_WINDOW_SIZE = 64 * 1024
+
+
+@dataclasses.dataclass
+class AttachmentDigest:
+    """Size and checksums of a downloaded attachment"""
+
+    size: int = 0
+    md5: str = ""
+    sha256: str = ""
+    contents: Optional[bytes] = None
+
+
+@dataclasses.dataclass
+class AttachmentResult:
+    """Verification result of a single event attachment"""
+
+    event_id: str
+    digest: Optional[AttachmentDigest] = None
+    errors: List[str] = dataclasses.field(default_factory=list)
+    duration: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        """Attachment matched all expectations"""
+        return not self.errors
+
+
+def format_results(results: Iterable[AttachmentResult]) -> str:
+    """Format attachment results as a table (one event per line)"""
+    lines = [f"{'event_id':<16} {'size':>12} {'md5':<32} {'time':>8}  result"]
+    for result in results:
+        digest = result.digest or AttachmentDigest()
+        lines.append(
+            f"{result.event_id:<16} {digest.size:>12} {digest.md5:<32} "
+            f"{result.duration:>7.2f}s  {'; '.join(result.errors) or 'ok'}"
+        )
+    return "\n".join(lines)
+
+
+def file_checksum(path: str, algorithm: str = "md5") -> str:
+    """Calculate the checksum of a file (read in chunks)"""
+    file_hash = hashlib.new(algorithm)
+    with open(path, "rb") as file:
+        while chunk := file.read(DEFAULT_CHUNK_SIZE):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def resolve_checksum(expected: str, algorithm: str) -> str:
+    """Get the expected checksum, which can either be given as the checksum
+    itself or a file that should be used to calculate the checksum from"""
+    if Path(expected).is_file():
+        return file_checksum(expected, algorithm)
+    return expected.lower()
+
+
+def download_chunks(
+    client: CumulocityApi, resource: str, chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Iterator[bytes]:
+    """Download a binary in chunks. The errors are the same as client.get_file
+
+    Args:
+        client (CumulocityApi): Cumulocity client
+        resource (str): Resource path, e.g. /event/events/{id}/binaries
+        chunk_size (int, optional): Chunk size in bytes. Defaults to 64KB.
+
+    Returns:
+        Iterator[bytes]: Chunks of the binary
+    """
+    response = client.session.get(client.base_url + resource, stream=True)
+    try:
+        check_response(response, resource)
+        yield from response.iter_content(chunk_size)
+    finally:
+        response.close()
+
+
+class WindowSearch:
+    """Search for a regex pattern in a stream of chunks. Only the last window_size
+    bytes are kept between chunks, so matches longer than the window are not
+    guaranteed to be found.
+
+    The byte before the kept bytes is also remembered, so that anchors such as
+    ^ (with re.MULTILINE) or \\b don't match at the start of the kept bytes when
+    they start in the middle of a line or word.
+    """
+
+    def __init__(self, pattern: re.Pattern, window_size: int = DEFAULT_WINDOW_SIZE):
+        self.pattern = pattern
+        self.window_size = window_size
+        self.matched = False
+        self._tail = b""
+        self._before = b""
+
+    def feed(self, chunk: bytes) -> None:
+        """Search the next chunk (including the end of the previous chunks)"""
+        if self.matched:
+            return
+        data = self._tail + chunk
+        # matches can't start at the remembered byte, it is only used as context
+        if self.pattern.search(self._before + data, len(self._before)):
+            self.matched = True
+            self._tail = b""
+        elif len(data) > self.window_size:
+            cut = len(data) - self.window_size
+            self._before = data[cut - 1 : cut]
+            self._tail = data[cut:]
+        else:
+            self._tail = data
+
+
+class ContentsCompare:
+    """Compare a stream of chunks against the expected contents"""
+
+    def __init__(self, expected: bytes):
+        self.expected = expected
+        self.offset = 0
+        self.mismatch: Optional[int] = None
+
+    def feed(self, chunk: bytes) -> None:
+        """Compare the next chunk, recording the offset of the first difference"""
+        if self.mismatch is None:
+            wanted = self.expected[self.offset : self.offset + len(chunk)]
+            if chunk != wanted:
+                self.mismatch = self.offset + next(
+                    (i for i, (a, b) in enumerate(zip(chunk, wanted)) if a != b),
+                    min(len(chunk), len(wanted)),
+                )
+        self.offset += len(chunk)
+
+    def error(self) -> Optional[str]:
+        """Describe the difference (if any)"""
+        if self.mismatch is None and self.offset != len(self.expected):
+            self.mismatch = min(self.offset, len(self.expected))
+        if self.mismatch is None:
+            return None
+        return (
+            "Attachment contents did not match. "
+            f"First difference at byte {self.mismatch}, "
+            f"wanted_size={len(self.expected)}, got_size={self.offset}"
+        )
+
+
+def verify_chunks(
+    chunks: Iterable[bytes],
+    expected_contents: Optional[str] = None,
+    expected_pattern: Optional[str] = None,
+    expected_window_pattern: Optional[str] = None,
+    window_size: int = DEFAULT_WINDOW_SIZE,
+    expected_size_min: Optional[int] = None,
+    expected_md5: Optional[str] = None,
+    expected_sha256: Optional[str] = None,
+    encoding: str = "utf8",
+    keep_contents: bool = False,
+) -> Tuple[AttachmentDigest, List[str]]:
+    """Verify a binary while it is being read. See Events.assert_attachment
+    for a description of the arguments.
+
+    Returns:
+        Tuple[AttachmentDigest, List[str]]: Digest and a description of each failed check
+    """
+    # pylint: disable=too-many-arguments,too-many-locals
+    md5 = hashlib.md5()
+    sha256 = hashlib.sha256()
+    digest = AttachmentDigest()
+
+    # the full pattern match needs the whole contents
+    keep_contents = keep_contents or expected_pattern is not None
+    buffer: List[bytes] = []
+    checks: List[Any] = []
+
+    compare_contents = None
+    if expected_contents is not None and expected_pattern is None:
+        compare_contents = ContentsCompare(expected_contents.encode(encoding))
+        checks.append(compare_contents)
+
+    window_search = None
+    if expected_window_pattern is not None:
+        window_search = WindowSearch(
+            re.compile(expected_window_pattern.encode(encoding), re.MULTILINE),
+            window_size,
+        )
+        checks.append(window_search)
+
+    for chunk in chunks:
+        digest.size += len(chunk)
+        md5.update(chunk)
+        sha256.update(chunk)
+        for check in checks:
+            check.feed(chunk)
+        if keep_contents:
+            buffer.append(chunk)
+
+    digest.md5 = md5.hexdigest()
+    digest.sha256 = sha256.hexdigest()
+    if keep_contents:
+        digest.contents = b"".join(buffer)
+
+    errors = []
+    if expected_size_min is not None and digest.size < expected_size_min:
+        errors.append(
+            f"Expected file size to be greater or equal to {expected_size_min} bytes. "
+            f"got={digest.size}"
+        )
+
+    if expected_pattern is not None:
+        pattern = re.compile(expected_pattern, re.MULTILINE | re.DOTALL)
+        if not pattern.match(digest.contents.decode(encoding)):
+            errors.append(
+                f"Attachment contents did not match pattern. pattern={expected_pattern}"
+            )
+    elif compare_contents is not None:
+        error = compare_contents.error()
+        if error:
+            errors.append(error)
+
+    if window_search is not None and not window_search.matched:
+        errors.append(
+            "Attachment contents did not contain pattern. "
+            f"pattern={expected_window_pattern}, window_size={window_size}"
+        )
+
+    for name, expected, actual in (
+        ("md5", expected_md5, digest.md5),
+        ("sha256", expected_sha256, digest.sha256),
+    ):
+        if expected is None:
+            continue
+        expected = resolve_checksum(expected, name)
+        if expected != actual:
+            errors.append(
+                f"Event binary checksum ({name}) did not match. "
+                f"wanted={expected}, got={actual}"
+            )
+
+    return digest, errors
@@ -2,12 +2,14 @@
 """
 import logging
 import os
+import re
 from typing import Optional
 
 from c8y_api._auth import HTTPBearerAuth
 from c8y_api.app import CumulocityApi, _CumulocityAppBase
 from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
+from requests.models import Response
 from requests.sessions import Session
 from urllib3.util import Retry
 
@@ -18,6 +20,42 @@ retry_strategy = Retry(
 )
 
 
+def check_response(response: Response, resource: str) -> None:
+    """Raise the same errors as the CumulocityApi.get function for a response of
+    a request sent using the session directly (e.g. when streaming the response)
+
+    Raises:
+        KeyError: Resource was not found (404)
+        SyntaxError: Server error (5xx)
+        ValueError: Any other unsuccessful status code
+    """
+    if response.status_code == 404:
+        raise KeyError(f"No such object: {resource}")
+    if 500 <= response.status_code <= 599:
+        raise SyntaxError(
+            f"Invalid GET request. Status: {response.status_code} "
+            f"Response:\n{response.text}"
+        )
+    if response.status_code != 200:
+        raise ValueError(
+            f"Unable to perform GET request. Status: {response.status_code} "
+            f"Response:\n{response.text}"
+        )
+
+
+# The c8y_api client does not attach the response to its errors. The status code
+# is only included in the message, e.g.
+# "Unable to perform DELETE request. Status: 429 Response:\n..."
+# (see c8y_api._base_api.CumulocityRestApi)
+ERROR_STATUS_PATTERN = re.compile(r"\bStatus: (\d{3})\b")
+
+
+def error_status(ex: Exception) -> Optional[int]:
+    """Get the http status code of a c8y_api request error (if any)"""
+    match = ERROR_STATUS_PATTERN.search(str(ex))
+    return int(match.group(1)) if match else None
+
+
 def resolve_tenant_id(api: CumulocityApi):
     """Try to resolve the tenant_id by looking it up via an REST API call
 
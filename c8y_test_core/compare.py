@@ -1,5 +1,9 @@
 """Comparison helpers"""
+import abc
+import collections
 import re
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
 
 
 class RegexPattern:
@@ -15,25 +19,230 @@ class RegexPattern:
         return self._regex.pattern
 
 
-def compare_dataclass(obj1: object, obj2: object) -> bool:
-    """Compare objects"""
-    obj1_dict = obj1.__dict__ if not hasattr(obj1, "items") else obj1
-    obj2_dict = obj2.__dict__ if not hasattr(obj2, "items") else obj2
+class Mismatch(NamedTuple):
+    """Difference between an expected and an actual value"""
+
+    path: str
+    reason: str
+
+    def __str__(self) -> str:
+        return f"{self.path or '<root>'}: {self.reason}"
+
+
+def _join(path: str, key: Any) -> str:
+    if isinstance(key, int):
+        return f"{path}[{key}]"
+    return f"{path}.{key}" if path else str(key)
+
+
+def _as_dict(value: Any) -> Optional[Dict[str, Any]]:
+    if hasattr(value, "items"):
+        return value
+    return getattr(value, "__dict__", None)
+
+
+class Matcher(abc.ABC):
+    """Compiled expectation, which can be evaluated against any number of values
+
+    Use compile_matcher to create a matcher from an expected fragment spec.
+    """
+
+    @abc.abstractmethod
+    def _check(self, actual: Any, path: str, errors: List[Mismatch], stop: bool) -> bool:
+        """Check the value, appending each difference to errors. Stop at the
+        first difference if stop is set"""
+
+    def matches(self, actual: Any) -> bool:
+        """Check if the value matches (stops at the first difference)"""
+        return self._check(actual, "", [], True)
+
+    def mismatches(self, actual: Any) -> List[Mismatch]:
+        """Get all differences (including their full path) between the expected
+        and the actual value"""
+        errors: List[Mismatch] = []
+        self._check(actual, "", errors, False)
+        return errors
+
+    __call__ = matches
+
+
+class ValueMatcher(Matcher):
+    """Match a value using equality"""
+
+    def __init__(self, expected: Any) -> None:
+        self.expected = expected
+
+    def _check(self, actual, path, errors, stop):
+        if self.expected == actual:
+            return True
+        errors.append(Mismatch(path, f"wanted={self.expected!r}, got={actual!r}"))
+        return False
+
+
+class PatternMatcher(Matcher):
+    """Match a string against a (precompiled) regular expression"""
+
+    def __init__(self, pattern: re.Pattern) -> None:
+        self.pattern = pattern
+
+    def _check(self, actual, path, errors, stop):
+        if isinstance(actual, str) and self.pattern.match(actual):
+            return True
+        errors.append(
+            Mismatch(path, f"pattern={self.pattern.pattern!r}, got={actual!r}")
+        )
+        return False
+
+
+class DictMatcher(Matcher):
+    """Match the given keys of a dictionary (or object). Other keys are ignored"""
+
+    def __init__(self, items: List[Tuple[str, Matcher]]) -> None:
+        self.items = items
 
-    for key, value in obj2_dict.items():  # type: ignore
-        if not value:
-            continue
+    def _check(self, actual, path, errors, stop):
+        actual_dict = _as_dict(actual)
+        if actual_dict is None:
+            errors.append(Mismatch(path, f"wanted an object, got={actual!r}"))
+            return False
+        ok = True
+        for key, matcher in self.items:
+            key_path = _join(path, key)
+            if key not in actual_dict:
+                errors.append(Mismatch(key_path, "missing"))
+                ok = False
+            elif not matcher._check(actual_dict[key], key_path, errors, stop):
+                ok = False
+            if not ok and stop:
+                break
+        return ok
+
+
+class ListMatcher(Matcher):
+    """Match a list item by item (same length and order)"""
+
+    def __init__(self, items: List[Matcher]) -> None:
+        self.items = items
 
-        if key not in obj1_dict:  # type: ignore
+    def _check(self, actual, path, errors, stop):
+        if not isinstance(actual, (list, tuple)):
+            errors.append(Mismatch(path, f"wanted a list, got={actual!r}"))
             return False
+        if len(actual) != len(self.items):
+            errors.append(
+                Mismatch(
+                    path,
+                    f"wanted {len(self.items)} items, got {len(actual)} items. got={actual!r}",
+                )
+            )
+            return False
+        ok = True
+        for index, (matcher, value) in enumerate(zip(self.items, actual)):
+            if not matcher._check(value, _join(path, index), errors, stop):
+                ok = False
+                if stop:
+                    break
+        return ok
+
+
+def _compile(spec: Any) -> Matcher:
+    if isinstance(spec, Matcher):
+        return spec
+    if isinstance(spec, re.Pattern):
+        return PatternMatcher(spec)
+    if isinstance(spec, RegexPattern):
+        # pylint: disable=protected-access
+        return PatternMatcher(spec._regex)
+    if isinstance(spec, dict):
+        # empty (falsy) values are not compared, e.g. unset dataclass fields
+        return DictMatcher(
+            [(key, _compile(value)) for key, value in spec.items() if value]
+        )
+    if isinstance(spec, list):
+        return ListMatcher([_compile(value) for value in spec])
+    return ValueMatcher(spec)
+
+
+def _freeze(spec: Any) -> Any:
+    if isinstance(spec, dict):
+        return ("dict", tuple((key, _freeze(value)) for key, value in spec.items()))
+    if isinstance(spec, list):
+        return ("list", tuple(_freeze(value) for value in spec))
+    if isinstance(spec, RegexPattern):
+        # pylint: disable=protected-access
+        return ("regex", spec._regex)
+    # include the type so that e.g. 1 and True do not share a matcher
+    return (type(spec).__name__, spec)
+
+
+class _MatcherCache:
+    """Least recently used cache of compiled matchers (keyed by the spec)"""
+
+    def __init__(self, maxsize: int = 256) -> None:
+        self.maxsize = maxsize
+        self._items: "collections.OrderedDict[Any, Matcher]" = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, spec: Any) -> Matcher:
+        """Get the compiled matcher of a spec, compiling it if necessary"""
+        try:
+            key = _freeze(spec)
+            hash(key)
+        except TypeError:
+            # specs with unhashable values can't be cached
+            return _compile(spec)
 
-        if isinstance(value, re.Pattern):
-            if not re.match(value, obj1_dict.get(key, "")):  # type: ignore
-                return False
-        elif isinstance(value, dict):
-            return compare_dataclass(obj1_dict.get(key, ""), value)  # type: ignore
-        else:
-            if value != obj1_dict.get(key, ""):  # type: ignore
-                return False
+        with self._lock:
+            matcher = self._items.get(key)
+            if matcher is not None:
+                self._items.move_to_end(key)
+                return matcher
 
-    return True
+        matcher = _compile(spec)
+        with self._lock:
+            self._items[key] = matcher
+            if len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+        return matcher
+
+    def clear(self) -> None:
+        """Remove all compiled matchers"""
+        with self._lock:
+            self._items.clear()
+
+
+_cache = _MatcherCache()
+
+
+def compile_matcher(spec: Any) -> Matcher:
+    """Compile an expected fragment spec into a reusable matcher
+
+    The spec can contain plain values (compared using equality), regular
+    expressions (re.Pattern or RegexPattern, matched from the start of the
+    string), nested dictionaries (only the given keys are compared, and keys
+    with empty values are ignored) and lists (compared item by item).
+    Compiled matchers are cached, so the same spec is only compiled once even
+    when it is used for many retries or devices.
+
+    Example:
+        matcher = compile_matcher({"c8y_Agent": {"version": re.compile(r"^1\\.")}})
+        matcher.matches(mo.to_json())
+        matcher.mismatches(mo.to_json())  # [Mismatch("c8y_Agent.version", ...)]
+
+    Args:
+        spec (Any): Expected values. Objects (e.g. dataclasses) are compared using
+            their attributes.
+
+    Returns:
+        Matcher: Compiled matcher
+    """
+    if isinstance(spec, Matcher):
+        return spec
+    if not isinstance(spec, (dict, list)) and hasattr(spec, "__dict__"):
+        spec = dict(spec.__dict__)
+    return _cache.get(spec)
+
+
+def compare_dataclass(obj1: object, obj2: object) -> bool:
+    """Compare objects. Check if obj1 contains all of the (non-empty) values of obj2"""
+    return compile_matcher(obj2).matches(obj1)
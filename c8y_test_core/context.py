@@ -13,6 +13,10 @@ class AssertContext:
     client: CumulocityApi
     log: Optional[logging.Logger] = None
 
+    # Only read the fragments needed by an assertion (and skip the child
+    # references) when fetching the device managed object
+    projected_reads: bool = False
+
     def domain(self) -> str:
         """Get the Cumulocity domain without the scheme"""
         assert self.client, "client is empty"
@@ -25,6 +25,7 @@ from c8y_test_core.assert_operations import AssertOperations
 from c8y_test_core.assert_smartrest2 import AssertSmartREST2
 from c8y_test_core.assert_software_management import SoftwareManagement
 from c8y_test_core.context import AssertContext
+from c8y_test_core.identity_cache import get_identity_cache
 from c8y_test_core.retry import configure_retry_on_members
 
 
@@ -96,9 +97,19 @@ def create_context_from_identity(
     device_id: str = "",
     external_id: Optional[str] = None,
     external_type: Optional[str] = None,
+    projected_reads: bool = False,
 ) -> "DeviceManagement":
     """Create a context from a device identity"""
-    context = AssertContext(client=c8y, device_id=device_id, log=logging.getLogger())
+    context = AssertContext(
+        client=c8y,
+        device_id=device_id,
+        log=logging.getLogger(),
+        projected_reads=projected_reads,
+    )
     if not device_id and external_id:
-        context.device_id = c8y.identity.get_id(external_id, external_type)
+        # the id is used for the lifetime of the context, so it is always looked up
+        # (a cached id could belong to a device which has been re-created)
+        context.device_id = get_identity_cache(c8y).get_id(
+            external_id, external_type, refresh=True
+        )
     return DeviceManagement(context)
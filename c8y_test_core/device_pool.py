@@ -0,0 +1,386 @@
+"""Warm pool of pre-registered test devices
+
+Registering a device and deleting it afterwards dominates the setup and
+teardown time of short tests. The pool keeps a number of registered devices
+(with credentials) ready, leases them to tests, resets them between leases,
+and registers new devices in the background when the pool runs low.
+"""
+import collections
+import contextlib
+import dataclasses
+import logging
+import secrets
+import threading
+import time
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Set
+
+from c8y_api import CumulocityApi
+
+from c8y_test_core.assert_device_registration import (
+    AssertDeviceRegistration,
+    DeviceCredentials,
+)
+from c8y_test_core.assert_inventory import AssertInventory
+from c8y_test_core.context import AssertContext
+from c8y_test_core.identity_cache import get_identity_cache
+
+log = logging.getLogger()
+
+# Managed object fragments which are never removed when resetting a device
+PRESERVED_FRAGMENTS = {
+    "id",
+    "self",
+    "name",
+    "type",
+    "owner",
+    "creationTime",
+    "lastUpdated",
+    "childDevices",
+    "childAssets",
+    "childAdditions",
+    "deviceParents",
+    "assetParents",
+    "additionParents",
+    "c8y_IsDevice",
+    "com_cumulocity_model_Agent",
+    "c8y_Availability",
+    "c8y_Connection",
+    "c8y_RequiredAvailability",
+    "c8y_ActiveAlarmsStatus",
+}
+
+
+@dataclasses.dataclass
+class PooledDevice:
+    """Registered device which is managed by a DevicePool"""
+
+    external_id: str
+    external_type: str
+    credentials: DeviceCredentials
+    device_id: Optional[str] = None
+    leases: int = 0
+    fragments: Set[str] = dataclasses.field(default_factory=set)
+
+
+@dataclasses.dataclass
+class PoolMetrics:
+    """Device pool metrics. Times are in seconds
+
+    A lease is a hit if a device was available immediately, otherwise it is a miss
+    and the test had to wait for a new device to be registered.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    leases: int = 0
+    hits: int = 0
+    misses: int = 0
+    registered: int = 0
+    registration_failures: int = 0
+    resets: int = 0
+    reset_failures: int = 0
+    discarded: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+
+    @property
+    def hit_rate(self) -> float:
+        """Ratio of leases which did not have to wait for a device"""
+        return self.hits / self.leases if self.leases else 0.0
+
+    @property
+    def mean_wait(self) -> float:
+        """Mean time a lease had to wait for a device"""
+        return self.total_wait / self.leases if self.leases else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"leases={self.leases}, hit_rate={self.hit_rate:.2f}, "
+            f"wait(mean/max)={self.mean_wait:.3f}/{self.max_wait:.3f}s, "
+            f"registered={self.registered}, resets={self.resets}, "
+            f"discarded={self.discarded}"
+        )
+
+
+def reset_device(client: CumulocityApi, device: PooledDevice) -> None:
+    """Reset a device to the state it had when it was added to the pool. Pending
+    operations and alarms are deleted, and any fragments which were added to the
+    managed object are removed."""
+    client.delete("/devicecontrol/operations", params={"deviceId": device.device_id})
+    client.delete("/alarm/alarms", params={"source": device.device_id})
+
+    managed_object = client.get(f"/inventory/managedObjects/{device.device_id}")
+    added = {
+        key: None
+        for key in managed_object
+        if key not in device.fragments and key not in PRESERVED_FRAGMENTS
+    }
+    if added:
+        log.info(
+            "Removing fragments from device. id=%s, fragments=%s",
+            device.device_id,
+            list(added),
+        )
+        client.put(f"/inventory/managedObjects/{device.device_id}", json=added)
+
+
+class DevicePool:
+    """Pool of pre-registered devices (using basic auth credentials)"""
+
+    # pylint: disable=too-many-instance-attributes,too-many-arguments
+
+    def __init__(
+        self,
+        client: CumulocityApi,
+        size: int = 5,
+        prefix: str = "pool",
+        external_type: str = "c8y_Serial",
+        device_type: str = "thin-edge.io",
+        max_leases: int = 0,
+        reset: Callable[[CumulocityApi, PooledDevice], None] = reset_device,
+        refill_interval: float = 5.0,
+    ) -> None:
+        """
+        Args:
+            client (CumulocityApi): Cumulocity client
+            size (int, optional): Number of devices to keep ready. Defaults to 5.
+            prefix (str, optional): Prefix of the external ids. Defaults to 'pool'.
+            external_type (str, optional): External type. Defaults to c8y_Serial.
+            device_type (str, optional): Device type. Defaults to thin-edge.io.
+            max_leases (int, optional): Delete (and replace) a device after it has been
+                leased this many times. Unlimited if set to 0. Defaults to 0.
+            reset (Callable, optional): Function used to reset a device when it
+                is returned to the pool. Defaults to reset_device.
+            refill_interval (float, optional): Interval in seconds at which the
+                background thread checks the pool size (it is also woken up
+                when a device is leased). Defaults to 5.
+        """
+        self.client = client
+        self.size = size
+        self.prefix = prefix
+        self.external_type = external_type
+        self.device_type = device_type
+        self.max_leases = max_leases
+        self.reset = reset
+        self.refill_interval = refill_interval
+
+        context = AssertContext(device_id="", client=client)
+        self._registration = AssertDeviceRegistration(context)
+        self._inventory = AssertInventory(context)
+
+        self._condition = threading.Condition()
+        self._available: Deque[PooledDevice] = collections.deque()
+        self._leased: Dict[str, PooledDevice] = {}
+        self._registering = 0
+        self._metrics = PoolMetrics()
+        self._closed = False
+        self._refill_needed = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __enter__(self) -> "DevicePool":
+        self.start()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def metrics(self) -> PoolMetrics:
+        """Get a copy of the pool metrics"""
+        with self._condition:
+            return dataclasses.replace(self._metrics)
+
+    def start(self) -> None:
+        """Start refilling the pool in the background"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._refill_loop, daemon=True)
+        self._thread.start()
+
+    def _refill_loop(self) -> None:
+        while not self._closed:
+            try:
+                self.refill()
+            except Exception as ex:  # pylint: disable=broad-except
+                log.warning("Could not refill the device pool. %s", ex)
+            self._refill_needed.wait(self.refill_interval)
+            self._refill_needed.clear()
+
+    def _new_external_id(self) -> str:
+        return f"{self.prefix}_{secrets.token_hex(6)}"
+
+    def refill(self) -> int:
+        """Register new devices (in one bulk request) until the pool is full
+
+        Returns:
+            int: Number of registered devices
+        """
+        with self._condition:
+            missing = self.size - len(self._available) - self._registering
+            if missing <= 0 or self._closed:
+                return 0
+            self._registering += missing
+
+        devices: List[PooledDevice] = []
+        failures = 0
+        try:
+            result = self._registration.bulk_register_devices_with_basic_auth(
+                [self._new_external_id() for _ in range(missing)],
+                external_type=self.external_type,
+                device_type=self.device_type,
+                allow_failures=True,
+            )
+            devices = [
+                PooledDevice(
+                    external_id=external_id,
+                    external_type=self.external_type,
+                    credentials=credentials,
+                )
+                for external_id, credentials in result.credentials.items()
+            ]
+            failures = len(result.failures)
+        finally:
+            with self._condition:
+                self._registering -= missing
+                closed = self._closed
+                if not closed:
+                    self._available.extend(devices)
+                self._metrics.registered += len(devices)
+                self._metrics.registration_failures += missing - len(devices)
+                self._condition.notify_all()
+
+        if closed:
+            # the pool was closed while the devices were being registered
+            for device in devices:
+                self._delete(device)
+        if failures:
+            log.warning("Could not register %d pool device/s", failures)
+        return len(devices)
+
+    def acquire(self, timeout: float = 60) -> PooledDevice:
+        """Lease a device from the pool. Prefer using lease() so the device is
+        always returned to the pool.
+
+        Args:
+            timeout (float, optional): Maximum time to wait for a device in seconds.
+                Defaults to 60.
+
+        Returns:
+            PooledDevice: Leased device
+        """
+        started = time.monotonic()
+        with self._condition:
+            hit = bool(self._available)
+        if not hit:
+            self._refill_needed.set()
+            if self._thread is None:
+                self.refill()
+
+        with self._condition:
+            if not self._condition.wait_for(
+                lambda: self._available or self._closed, timeout
+            ):
+                raise TimeoutError(
+                    f"No pool device was available within {timeout}s. "
+                    f"metrics: {self._metrics}"
+                )
+            if self._closed:
+                raise RuntimeError("Device pool is closed")
+            device = self._available.popleft()
+            self._leased[device.external_id] = device
+
+            wait = time.monotonic() - started
+            self._metrics.leases += 1
+            self._metrics.hits += int(hit)
+            self._metrics.misses += int(not hit)
+            self._metrics.total_wait += wait
+            self._metrics.max_wait = max(self._metrics.max_wait, wait)
+        self._refill_needed.set()
+
+        device.leases += 1
+        if device.device_id is None:
+            # the managed object is only looked up once per device
+            try:
+                device.device_id = get_identity_cache(self.client).get_id(
+                    device.external_id, device.external_type
+                )
+                device.fragments = set(
+                    self.client.get(f"/inventory/managedObjects/{device.device_id}")
+                )
+            except Exception:
+                # the caller never receives the device, so it would never be released
+                self.release(device, discard=True)
+                raise
+        return device
+
+    def release(self, device: PooledDevice, discard: bool = False) -> None:
+        """Return a device to the pool. The device is reset, or deleted if it
+        can't be reset, has reached the maximum number of leases or discard is set.
+        """
+        with self._condition:
+            self._leased.pop(device.external_id, None)
+            closed = self._closed
+
+        discard = discard or closed
+        discard = discard or (self.max_leases > 0 and device.leases >= self.max_leases)
+        if not discard:
+            try:
+                self.reset(self.client, device)
+            except Exception as ex:  # pylint: disable=broad-except
+                log.warning(
+                    "Could not reset pool device. id=%s, %s", device.external_id, ex
+                )
+                with self._condition:
+                    self._metrics.reset_failures += 1
+                discard = True
+
+        if discard:
+            self._delete(device)
+            self._refill_needed.set()
+            return
+
+        with self._condition:
+            self._metrics.resets += 1
+            self._available.append(device)
+            self._condition.notify_all()
+
+    def _delete(self, device: PooledDevice) -> None:
+        with self._condition:
+            self._metrics.discarded += 1
+        try:
+            self._inventory.delete_device_and_user(
+                device.external_id, device.external_type
+            )
+        except Exception as ex:  # pylint: disable=broad-except
+            log.warning(
+                "Could not delete pool device. id=%s, %s", device.external_id, ex
+            )
+
+    @contextlib.contextmanager
+    def lease(self, timeout: float = 60) -> Iterator[PooledDevice]:
+        """Lease a device for the duration of the with block
+
+        Example:
+            with pool.lease() as device:
+                ...
+        """
+        device = self.acquire(timeout=timeout)
+        try:
+            yield device
+        finally:
+            self.release(device)
+
+    def close(self) -> None:
+        """Stop refilling the pool, and delete the available devices.
+        Leased devices are deleted when they are released."""
+        with self._condition:
+            self._closed = True
+            devices = list(self._available)
+            self._available.clear()
+            self._condition.notify_all()
+        self._refill_needed.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        for device in devices:
+            self._delete(device)
+        log.info("Device pool metrics: %s", self._metrics)
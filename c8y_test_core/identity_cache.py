@@ -0,0 +1,212 @@
+"""Identity (external id) resolution cache
+
+Resolving an external id to a managed object id is done by many helpers, often
+for the same device within a test run. The cache keeps the resolved ids for a
+limited time (ttl), and is shared by all helpers using the same client.
+Entries are invalidated when the library deletes a device or creates an
+identity, and when the cached managed object no longer exists (see
+call_with_id). Callers which can't detect a stale id (e.g. because the id is
+only used later) should use refresh=True.
+"""
+import collections
+import logging
+import threading
+import time
+import weakref
+from typing import Callable, Optional, Tuple, TypeVar
+
+from c8y_api import CumulocityApi
+from c8y_api.model import ManagedObject
+
+log = logging.getLogger()
+
+T = TypeVar("T")
+
+DEFAULT_TTL = 300.0
+DEFAULT_MAX_SIZE = 4096
+
+
+class IdentityCache:
+    """Cache of external id (and type) to managed object id. Only successful
+    lookups are cached, so a device which does not exist yet is looked up again
+    on the next call."""
+
+    def __init__(
+        self,
+        client: CumulocityApi,
+        ttl: float = DEFAULT_TTL,
+        max_size: int = DEFAULT_MAX_SIZE,
+    ) -> None:
+        """
+        Args:
+            client (CumulocityApi): Cumulocity client
+            ttl (float, optional): Time in seconds an entry is valid for.
+                Defaults to 300.
+            max_size (int, optional): Maximum number of entries. The least
+                recently used entries are removed first. Defaults to 4096.
+        """
+        self.client = client
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._items: "collections.OrderedDict[Tuple[str, str], Tuple[str, float]]" = (
+            collections.OrderedDict()
+        )
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def _lookup(self, key: Tuple[str, str]) -> Optional[str]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            mo_id, expires = item
+            if expires <= time.monotonic():
+                del self._items[key]
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return mo_id
+
+    def put(
+        self, external_id: str, external_type: str = "c8y_Serial", mo_id: str = ""
+    ) -> None:
+        """Add (or replace) an entry, e.g. after creating an identity"""
+        with self._lock:
+            self._items[(external_id, external_type)] = (
+                mo_id,
+                time.monotonic() + self.ttl,
+            )
+            self._items.move_to_end((external_id, external_type))
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def get_id(
+        self,
+        external_id: str,
+        external_type: str = "c8y_Serial",
+        refresh: bool = False,
+    ) -> str:
+        """Get the managed object id of an external id. The errors are the same
+        as client.identity.get_id (e.g. KeyError if the identity does not exist)
+
+        Args:
+            external_id (str): External id
+            external_type (str, optional): External type. Defaults to c8y_Serial.
+            refresh (bool, optional): Ignore any cached value. Defaults to False.
+
+        Returns:
+            str: Managed object id
+        """
+        key = (external_id, external_type)
+        if not refresh:
+            mo_id = self._lookup(key)
+            if mo_id is not None:
+                return mo_id
+        try:
+            mo_id = self.client.identity.get_id(external_id, external_type)
+        except KeyError:
+            self.invalidate(external_id, external_type)
+            raise
+        self.put(external_id, external_type, mo_id)
+        return mo_id
+
+    def call_with_id(
+        self,
+        external_id: str,
+        external_type: str,
+        func: Callable[[str], T],
+        refresh: bool = False,
+        is_stale: Optional[Callable[[str], bool]] = None,
+    ) -> T:
+        """Call a function with the managed object id of an external id. If the
+        id was cached and the function raises a KeyError (e.g. 404 as the managed
+        object was deleted and re-created), then the identity is looked up again
+        and the function is called once more.
+
+        Args:
+            external_id (str): External id
+            external_type (str): External type
+            func (Callable[[str], T]): Function called with the managed object id
+            refresh (bool, optional): Ignore any cached value. Defaults to False.
+            is_stale (Callable[[str], bool], optional): Check if the cached id is
+                stale when the function raises a KeyError. Use it when a KeyError
+                does not always mean that the managed object does not exist, e.g.
+                a missing child reference. The KeyError is raised as is if the
+                id is not stale. Defaults to None (always stale).
+
+        Returns:
+            T: Result of the function
+        """
+        mo_id = None if refresh else self._lookup((external_id, external_type))
+        if mo_id is None:
+            return func(self.get_id(external_id, external_type, refresh=True))
+        try:
+            return func(mo_id)
+        except KeyError:
+            if is_stale is not None and not is_stale(mo_id):
+                raise
+            log.info(
+                "Cached managed object id is not valid anymore. "
+                "external_id=%s, type=%s, id=%s",
+                external_id,
+                external_type,
+                mo_id,
+            )
+        self.invalidate(external_id, external_type, mo_id=mo_id)
+        return func(self.get_id(external_id, external_type, refresh=True))
+
+    def get_object(
+        self,
+        external_id: str,
+        external_type: str = "c8y_Serial",
+        refresh: bool = False,
+    ) -> ManagedObject:
+        """Get the managed object of an external id. If the cached managed object
+        does not exist anymore, then the identity is looked up again."""
+        return self.call_with_id(
+            external_id, external_type, self.client.inventory.get, refresh=refresh
+        )
+
+    def invalidate(
+        self,
+        external_id: Optional[str] = None,
+        external_type: str = "c8y_Serial",
+        mo_id: Optional[str] = None,
+    ) -> None:
+        """Remove the entry of an external id, and/or all entries referencing
+        a managed object id (e.g. after the managed object was deleted)"""
+        with self._lock:
+            if external_id is not None:
+                self._items.pop((external_id, external_type), None)
+            if mo_id is not None:
+                for key in [
+                    key for key, value in self._items.items() if value[0] == mo_id
+                ]:
+                    del self._items[key]
+
+    def clear(self) -> None:
+        """Remove all entries"""
+        with self._lock:
+            self._items.clear()
+
+
+_caches: "weakref.WeakKeyDictionary[CumulocityApi, IdentityCache]" = (
+    weakref.WeakKeyDictionary()
+)
+_caches_lock = threading.Lock()
+
+
+def get_identity_cache(client: CumulocityApi) -> IdentityCache:
+    """Get the identity cache shared by all helpers using the given client"""
+    with _caches_lock:
+        cache = _caches.get(client)
+        if cache is None:
+            cache = IdentityCache(client)
+            _caches[client] = cache
+        return cache
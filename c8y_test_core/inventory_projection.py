@@ -0,0 +1,145 @@
+"""Projected (reduced) managed object reads
+
+Most inventory assertions only look at one or two fragments, but a managed
+object read includes all fragments and the child references. A projected read
+asks the server to skip the child references (withChildren=false), and only
+keeps the requested fragments. The inventory api does not support selecting
+fragments, so the fragments are limited after the response has been parsed.
+
+The received bytes and parse time of each read are recorded per client, and
+measure_savings compares a projected read against a full read.
+"""
+import dataclasses
+import json
+import threading
+import time
+import weakref
+from typing import Iterable, Optional, Tuple
+
+from c8y_api import CumulocityApi
+from c8y_api.model import ManagedObject
+
+from c8y_test_core.c8y import check_response
+
+# Fragments which are always kept by a projected read
+BASE_FRAGMENTS = (
+    "id",
+    "self",
+    "name",
+    "type",
+    "owner",
+    "creationTime",
+    "lastUpdated",
+)
+
+
+@dataclasses.dataclass
+class ReadStats:
+    """Statistics of projected reads. Times are in seconds"""
+
+    requests: int = 0
+    bytes: int = 0
+    parse_time: float = 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"requests={self.requests}, bytes={self.bytes}, "
+            f"parse_time={self.parse_time:.6f}s"
+        )
+
+
+@dataclasses.dataclass
+class ProjectionSavings:
+    """Size and parse time of a full and a projected read of the same managed object"""
+
+    full_bytes: int = 0
+    projected_bytes: int = 0
+    full_parse_time: float = 0.0
+    projected_parse_time: float = 0.0
+
+    @property
+    def bytes_saved(self) -> int:
+        """Number of bytes which are not transferred when using a projected read"""
+        return self.full_bytes - self.projected_bytes
+
+    def __str__(self) -> str:
+        return (
+            f"bytes(full/projected)={self.full_bytes}/{self.projected_bytes}, "
+            f"bytes_saved={self.bytes_saved}, "
+            f"parse_time(full/projected)="
+            f"{self.full_parse_time:.6f}/{self.projected_parse_time:.6f}s"
+        )
+
+
+_stats: "weakref.WeakKeyDictionary[CumulocityApi, ReadStats]" = (
+    weakref.WeakKeyDictionary()
+)
+_stats_lock = threading.Lock()
+
+
+def get_read_stats(client: CumulocityApi) -> ReadStats:
+    """Get a copy of the projected read statistics of a client"""
+    with _stats_lock:
+        return dataclasses.replace(_stats.get(client) or ReadStats())
+
+
+def _read(
+    client: CumulocityApi, mo_id: str, with_children: bool
+) -> Tuple[dict, int, float]:
+    resource = f"/inventory/managedObjects/{mo_id}"
+    response = client.session.get(
+        client.base_url + resource,
+        params={"withChildren": str(with_children).lower()},
+    )
+    check_response(response, resource)
+    started = time.perf_counter()
+    data = json.loads(response.content)
+    return data, len(response.content), time.perf_counter() - started
+
+
+def get_managed_object(
+    client: CumulocityApi,
+    mo_id: str,
+    fragments: Optional[Iterable[str]] = None,
+    with_children: bool = False,
+) -> ManagedObject:
+    """Read a managed object, skipping the child references and only keeping
+    the given fragments (and the base fragments such as id, name and type).
+    The errors are the same as client.inventory.get.
+
+    Args:
+        client (CumulocityApi): Cumulocity client
+        mo_id (str): Managed object id
+        fragments (Iterable[str], optional): Fragments to keep. All fragments are
+            kept if set to None.
+        with_children (bool, optional): Include the child references. Defaults to False.
+
+    Returns:
+        ManagedObject: Managed object
+    """
+    data, size, parse_time = _read(client, mo_id, with_children)
+    with _stats_lock:
+        stats = _stats.setdefault(client, ReadStats())
+        stats.requests += 1
+        stats.bytes += size
+        stats.parse_time += parse_time
+
+    if fragments is not None:
+        keep = set(BASE_FRAGMENTS).union(fragments)
+        data = {key: value for key, value in data.items() if key in keep}
+    managed_object = ManagedObject.from_json(data)
+    managed_object.c8y = client
+    return managed_object
+
+
+def measure_savings(client: CumulocityApi, mo_id: str) -> ProjectionSavings:
+    """Compare the size and parse time of a full read (including the child
+    references) and a projected read of a managed object"""
+    _, full_bytes, full_parse_time = _read(client, mo_id, with_children=True)
+    _, projected_bytes, projected_parse_time = _read(client, mo_id, with_children=False)
+    return ProjectionSavings(
+        full_bytes=full_bytes,
+        projected_bytes=projected_bytes,
+        full_parse_time=full_parse_time,
+        projected_parse_time=projected_parse_time,
+    )
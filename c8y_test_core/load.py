@@ -0,0 +1,266 @@
+"""Synthetic telemetry (load) generator
+
+Measurements, events and alarms are created at a target rate for a list of devices.
+Requests are paced in open loop, e.g. a request is sent at its scheduled time
+regardless of whether the previous requests have completed, so a slow server
+shows up as higher latency instead of a lower request rate.
+"""
+import dataclasses
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from c8y_api import CumulocityApi
+from requests.exceptions import RequestException
+
+from c8y_test_core.stats import percentile
+
+log = logging.getLogger()
+
+# Function returning the payload of a single item given the device id and item index
+PayloadFactory = Callable[[str, int], Dict[str, Any]]
+
+
+class TelemetryKind:
+    """Supported telemetry types"""
+
+    # pylint: disable=too-few-public-methods
+
+    MEASUREMENTS = "measurements"
+    EVENTS = "events"
+    ALARMS = "alarms"
+
+
+# Resource, collection name (used for bulk requests) and content type of each type.
+# Only measurements can be created in bulk (using a measurement collection)
+_RESOURCES = {
+    TelemetryKind.MEASUREMENTS: (
+        "/measurement/measurements",
+        "measurements",
+        CumulocityApi.CONTENT_MEASUREMENT_COLLECTION,
+    ),
+    TelemetryKind.EVENTS: ("/event/events", None, None),
+    TelemetryKind.ALARMS: ("/alarm/alarms", None, None),
+}
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="milliseconds")
+
+
+def default_payload(kind: str) -> PayloadFactory:
+    """Get the default payload factory of a telemetry type"""
+
+    def measurement(device_id: str, index: int) -> Dict[str, Any]:
+        return {
+            "source": {"id": device_id},
+            "type": "c8y_LoadTest",
+            "time": _now(),
+            "c8y_LoadTest": {"index": {"value": index}},
+        }
+
+    def event(device_id: str, index: int) -> Dict[str, Any]:
+        return {
+            "source": {"id": device_id},
+            "type": "c8y_LoadTest",
+            "time": _now(),
+            "text": f"Load test event {index}",
+        }
+
+    def alarm(device_id: str, index: int) -> Dict[str, Any]:
+        return {
+            "source": {"id": device_id},
+            "type": "c8y_LoadTest",
+            "time": _now(),
+            "severity": "WARNING",
+            "text": f"Load test alarm {index}",
+        }
+
+    factories = {
+        TelemetryKind.MEASUREMENTS: measurement,
+        TelemetryKind.EVENTS: event,
+        TelemetryKind.ALARMS: alarm,
+    }
+    if kind not in factories:
+        raise ValueError(
+            f"Invalid telemetry kind. got={kind}, wanted one of {list(factories.keys())}"
+        )
+    return factories[kind]
+
+
+@dataclasses.dataclass
+class LoadStats:
+    """Load generator results
+
+    Rates are in items per second, and times are in seconds. The latency is
+    measured from the scheduled send time, so it includes any time spent waiting
+    for a free worker, and the service time is measured from the actual send time.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    kind: str
+    target_rate: float = 0.0
+    requests: int = 0
+    items: int = 0
+    errors: int = 0
+    duration: float = 0.0
+    rate: float = 0.0
+    latency: Dict[str, float] = dataclasses.field(default_factory=dict)
+    service_time: Dict[str, float] = dataclasses.field(default_factory=dict)
+
+    def __str__(self) -> str:
+        return (
+            f"kind={self.kind}, requests={self.requests}, items={self.items}, "
+            f"errors={self.errors}, duration={self.duration:.3f}s, "
+            f"rate={self.rate:.3f}/s (target={self.target_rate}/s), "
+            f"latency={self.latency}, service_time={self.service_time}"
+        )
+
+
+class LoadGenerator(threading.Thread):
+    """Create telemetry at a target rate (in the background) until the duration or
+    count is reached, or cancel is called"""
+
+    # pylint: disable=too-many-instance-attributes,too-many-arguments
+
+    def __init__(
+        self,
+        client: CumulocityApi,
+        kind: str,
+        devices: Sequence[str],
+        rate: float,
+        duration: Optional[float] = None,
+        count: Optional[int] = None,
+        batch_size: int = 100,
+        max_workers: int = 8,
+        factory: Optional[PayloadFactory] = None,
+        event: Optional[threading.Event] = None,
+    ):
+        """
+        Args:
+            client (CumulocityApi): Cumulocity client
+            kind (str): Telemetry type, see TelemetryKind
+            devices (Sequence[str]): Managed object ids of the devices. Items are
+                assigned to the devices in a round-robin fashion.
+            rate (float): Target rate in items per second (across all devices)
+            duration (float, optional): Stop after the given number of seconds
+            count (int, optional): Stop after the given number of items
+            batch_size (int, optional): Number of items per request, if the type
+                supports bulk requests (measurements). Defaults to 100.
+            max_workers (int, optional): Maximum number of concurrent requests.
+                Defaults to 8.
+            factory (PayloadFactory, optional): Function returning the payload
+                of an item. Defaults to a type specific payload.
+        """
+        threading.Thread.__init__(self, daemon=True)
+        if rate <= 0:
+            raise ValueError("rate needs to be greater than 0")
+        if not devices:
+            raise ValueError("devices must not be empty")
+        if not duration and not count and event is None:
+            raise ValueError("One of duration, count or event must be set")
+        self.client = client
+        self.kind = kind
+        self.devices = list(devices)
+        self.rate = rate
+        self.duration = duration
+        self.max_count = count or 0
+        self.max_workers = max_workers
+        self.factory = factory or default_payload(kind)
+        self.stopped = event or threading.Event()
+
+        self._resource, self._collection, self._content_type = _RESOURCES[kind]
+        self.batch_size = batch_size if self._collection else 1
+
+        self._lock = threading.Lock()
+        self._stats = LoadStats(kind=kind, target_rate=rate)
+        self._latency: List[float] = []
+        self._service_time: List[float] = []
+        self._start = 0.0
+        self._end = 0.0
+
+    def cancel(self):
+        """Stop generating load (requests which are already sent are completed)"""
+        self.stopped.set()
+
+    def _send(self, scheduled: float, items: List[Dict[str, Any]]) -> None:
+        sent = time.monotonic()
+        failed = False
+        try:
+            if self._collection:
+                self.client.post(
+                    self._resource,
+                    json={self._collection: items},
+                    content_type=self._content_type,
+                )
+            else:
+                self.client.post(self._resource, json=items[0])
+        except (KeyError, SyntaxError, ValueError, RequestException) as ex:
+            log.debug("Load request failed. kind=%s, error=%s", self.kind, ex)
+            failed = True
+        done = time.monotonic()
+
+        with self._lock:
+            self._stats.requests += 1
+            if failed:
+                self._stats.errors += len(items)
+            else:
+                self._stats.items += len(items)
+            self._latency.append(done - scheduled)
+            self._service_time.append(done - sent)
+            self._end = max(self._end, done)
+
+    def run(self):
+        interval = self.batch_size / self.rate
+        self._start = time.monotonic()
+        index = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while True:
+                scheduled = self._start + (index / self.batch_size) * interval
+                if self.duration and scheduled - self._start >= self.duration:
+                    break
+                size = self.batch_size
+                if self.max_count:
+                    size = min(size, self.max_count - index)
+                    if size <= 0:
+                        break
+
+                # open loop: wait for the scheduled time, not for previous requests
+                delay = scheduled - time.monotonic()
+                if delay > 0:
+                    if self.stopped.wait(delay):
+                        break
+                elif self.stopped.is_set():
+                    break
+
+                items = [
+                    self.factory(self.devices[i % len(self.devices)], i)
+                    for i in range(index, index + size)
+                ]
+                executor.submit(self._send, scheduled, items)
+                index += size
+
+    def stats(self) -> LoadStats:
+        """Get the current load statistics"""
+        with self._lock:
+            stats = dataclasses.replace(self._stats)
+            latency = sorted(self._latency)
+            service_time = sorted(self._service_time)
+            stats.duration = max(self._end - self._start, 0.0)
+        if stats.duration > 0:
+            stats.rate = stats.items / stats.duration
+        percents = (50, 90, 99)
+        stats.latency = {f"p{p}": percentile(latency, p) for p in percents}
+        stats.service_time = {f"p{p}": percentile(service_time, p) for p in percents}
+        return stats
+
+    def result(self, timeout: Optional[float] = None) -> LoadStats:
+        """Wait for the generator to finish and return the (logged) statistics"""
+        self.join(timeout)
+        stats = self.stats()
+        log.info("Load generator results: %s", stats)
+        return stats
@@ -0,0 +1,545 @@
+"""Paging helpers"""
+import itertools
+import json
+from collections.abc import Sequence
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generic,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+from c8y_test_core.errors import FinalAssertionError
+
+T = TypeVar("T")
+
+
+class LazySequence(Sequence, Generic[T]):
+    """Read-only sequence which is materialized from an iterator on demand.
+
+    Items are only pulled from the source iterator (e.g. a paginated
+    c8y_api select() generator) when they are accessed, so callers which
+    never look at the items never pay for fetching all of the pages.
+
+    Any operation which needs the whole collection, e.g. len(), slicing,
+    negative indexing or sorting, will read the remaining items first.
+
+    It is not a list (e.g. there is no append), but it can be concatenated with
+    a list (which reads all items). Use list() to get a mutable copy.
+    """
+
+    def __init__(self, source: Iterable[T]) -> None:
+        self._items: List[T] = []
+        self._source: Optional[Iterator[T]] = iter(source)
+        self._pending_sorts: List[Tuple[Optional[Callable[[T], Any]], bool]] = []
+
+    @property
+    def exhausted(self) -> bool:
+        """All items have been read from the source"""
+        return self._source is None
+
+    @property
+    def fetched(self) -> int:
+        """Number of items which have been read from the source so far"""
+        return len(self._items)
+
+    def prefetch(self, count: int) -> int:
+        """Read items from the source until at least the given number
+        of items are buffered, or the source is exhausted.
+
+        Args:
+            count (int): Number of items to buffer
+
+        Returns:
+            int: Number of buffered items
+        """
+        while self._source is not None and len(self._items) < count:
+            try:
+                self._items.append(next(self._source))
+            except StopIteration:
+                self._source = None
+        return len(self._items)
+
+    def materialize(self) -> List[T]:
+        """Read all remaining items and apply any pending sorting
+
+        Returns:
+            List[T]: All items
+        """
+        if self._source is not None:
+            self._items.extend(self._source)
+            self._source = None
+        for key, reverse in self._pending_sorts:
+            self._items.sort(key=key, reverse=reverse)
+        self._pending_sorts.clear()
+        return self._items
+
+    def sort(
+        self, key: Optional[Callable[[T], Any]] = None, reverse: bool = False
+    ) -> None:
+        """Sort the items (same as list.sort). The sorting is deferred until
+        the items are accessed
+        """
+        self._pending_sorts.append((key, reverse))
+        if self._source is None:
+            self.materialize()
+
+    def _ensure(self, count: int) -> None:
+        if self._pending_sorts:
+            self.materialize()
+        else:
+            self.prefetch(count)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice) or index < 0:
+            return self.materialize()[index]
+        self._ensure(index + 1)
+        return self._items[index]
+
+    def __iter__(self) -> Iterator[T]:
+        index = 0
+        while True:
+            self._ensure(index + 1)
+            if index >= len(self._items):
+                return
+            yield self._items[index]
+            index += 1
+
+    def __len__(self) -> int:
+        return len(self.materialize())
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, (LazySequence, list, tuple)):
+            return self.materialize() == list(other)
+        return NotImplemented
+
+    def __add__(self, other: object) -> List[T]:
+        if isinstance(other, (LazySequence, list, tuple)):
+            return self.materialize() + list(other)
+        return NotImplemented
+
+    def __radd__(self, other: object) -> List[T]:
+        if isinstance(other, (list, tuple)):
+            return list(other) + self.materialize()
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        # only the items which have been read are shown, so that formatting
+        # (e.g. in an assertion message) does not read the remaining pages
+        if self._source is None:
+            return repr(self._items)
+        fetched = ", ".join(repr(item) for item in self._items)
+        return f"[{fetched}{', ' if fetched else ''}... more not fetched]"
+
+
+def fetch_until_decided(
+    items: LazySequence,
+    min_count: Optional[int] = None,
+    max_count: Optional[int] = None,
+) -> int:
+    """Read only as many items as needed to decide a min/max count assertion.
+
+    Without a max_count, reading stops once min_count items have been found.
+    With a max_count, reading stops once the max_count has been exceeded
+    (max_count + 1 items) or when there are no more items.
+
+    Args:
+        items (LazySequence): Items to count
+        min_count (int, optional): Minimum (inclusive) number of items
+        max_count (int, optional): Maximum (inclusive) number of items
+
+    Returns:
+        int: Number of items read. This is only the total count if
+            items.exhausted is True.
+    """
+    if max_count is not None:
+        return items.prefetch(max_count + 1)
+    return items.prefetch(min_count or 0)
+
+
+def format_count(items: LazySequence) -> str:
+    """Format the number of read items for assertion messages,
+    indicating when more items may exist"""
+    if items.exhausted:
+        return str(items.fetched)
+    return f">={items.fetched}"
+
+
+def to_datetime(value: Union[str, datetime]) -> datetime:
+    """Convert an ISO 8601 time string (or datetime) to a timezone aware datetime.
+    Naive values are assumed to be in UTC.
+    """
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def get_field(item: Any, name: str) -> Any:
+    """Get a top level field of an item, which can either be a c8y_api object,
+    a raw json dictionary or a projected record (see records.py)"""
+    if isinstance(item, dict):
+        return item.get(name)
+    return getattr(item, name, None)
+
+
+def item_time(item: Any) -> Optional[datetime]:
+    """Get the time of an item (c8y_api object, raw dictionary or projected record)"""
+    if isinstance(item, (dict, tuple)):
+        value = get_field(item, "time")
+        return to_datetime(value) if value else None
+    return item.datetime
+
+
+def item_creation_time(item: Any) -> Optional[datetime]:
+    """Get the creation time of an item (c8y_api object, raw dictionary or projected record)"""
+    if isinstance(item, (dict, tuple)):
+        value = get_field(item, "creationTime")
+        return to_datetime(value) if value else None
+    return item.creation_datetime
+
+
+def item_last_updated(item: Any) -> Optional[datetime]:
+    """Get the last updated time of an item (c8y_api object, raw dictionary or projected record)"""
+    if isinstance(item, (dict, tuple)):
+        value = get_field(item, "lastUpdated")
+        return to_datetime(value) if value else None
+    return item.updated_datetime
+
+
+def default_item_key(item: Any) -> Hashable:
+    """Key used to deduplicate items. The id is used if present, otherwise
+    the whole item"""
+    item_id = get_field(item, "id")
+    if item_id:
+        return item_id
+    if isinstance(item, tuple):
+        return item
+    if isinstance(item, dict):
+        return json.dumps(item, sort_keys=True, default=str)
+    return json.dumps(item.to_json(), sort_keys=True, default=str)
+
+
+class QueryCursor(Generic[T]):
+    """Cursor which accumulates the results of a time based query over
+    multiple polls, so that each poll only has to fetch items which are newer
+    than the newest item seen so far (using the dateFrom query parameter).
+
+    Items are deduplicated by their key (id), so an overlap can be used
+    to also pick up items which arrive slightly out of order.
+
+    Items which can change (e.g. alarms) should use a last updated cursor with
+    replace set, so that an item which is returned again is re-evaluated.
+    """
+
+    def __init__(
+        self,
+        time_func: Callable[[T], Optional[datetime]],
+        key_func: Callable[[T], Hashable] = default_item_key,
+        overlap: float = 1.0,
+        replace: bool = False,
+    ) -> None:
+        """
+        Args:
+            time_func (Callable): Function returning the (timezone aware) time of an item
+            key_func (Callable, optional): Function returning the deduplication key of an item
+            overlap (float, optional): Number of seconds before the newest seen item
+                to include in the next poll. Defaults to 1.0.
+            replace (bool, optional): Re-evaluate items which were seen before,
+                replacing the accumulated item if it still matches, and removing
+                it if it does not. Defaults to False.
+        """
+        self._time_func = time_func
+        self._key_func = key_func
+        self._items: Dict[Hashable, T] = {}
+        self._rejected: Set[Hashable] = set()
+        self.overlap = overlap
+        self.replace = replace
+        self.newest: Optional[datetime] = None
+        self.polls = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def after(
+        self, after: Optional[Union[str, datetime]] = None
+    ) -> Optional[Union[str, datetime]]:
+        """Get the dateFrom value which should be used for the next poll
+
+        Args:
+            after (str | datetime, optional): dateFrom value requested by the user.
+                It is used if it is newer than the cursor.
+        """
+        if self.newest is None:
+            return after
+        cursor = self.newest - timedelta(seconds=self.overlap)
+        if after is not None and to_datetime(after) > cursor:
+            return after
+        return cursor
+
+    def merge(
+        self, items: Iterable[T], predicate: Optional[Callable[[T], Any]] = None
+    ) -> int:
+        """Merge new items into the accumulated result
+
+        Args:
+            items (Iterable[T]): Items returned by the latest poll
+            predicate (Callable, optional): Only keep items matching the predicate.
+                The predicate is only evaluated once per item (unless replace
+                is set), and items which do not match still advance the cursor.
+
+        Returns:
+            int: Number of matching items which were not seen before
+        """
+        added = 0
+        for item in items:
+            key = self._key_func(item)
+            seen = key in self._items or key in self._rejected
+            if seen and not self.replace:
+                continue
+
+            timestamp = self._time_func(item)
+            if timestamp is not None and (self.newest is None or timestamp > self.newest):
+                self.newest = timestamp
+
+            if predicate is not None and not predicate(item):
+                self._items.pop(key, None)
+                self._rejected.add(key)
+                continue
+            if key not in self._items:
+                added += 1
+            self._rejected.discard(key)
+            self._items[key] = item
+        self.polls += 1
+        return added
+
+    def evict_before(self, after: Union[str, datetime]) -> int:
+        """Remove the accumulated items which are older than the given time,
+        e.g. when a relative time range (max_age) has moved on since the
+        previous poll
+
+        Returns:
+            int: Number of removed items
+        """
+        after = to_datetime(after)
+        expired = [
+            key
+            for key, item in self._items.items()
+            if (timestamp := self._time_func(item)) is not None and timestamp < after
+        ]
+        for key in expired:
+            del self._items[key]
+        return len(expired)
+
+    def items(self) -> List[T]:
+        """Get a copy of all of the accumulated items"""
+        return list(self._items.values())
+
+
+class CursorStore:
+    """Cursors of incremental queries, one per unique set of query parameters"""
+
+    def __init__(self, factory: Callable[[], QueryCursor]) -> None:
+        self._factory = factory
+        self._cursors: Dict[Hashable, QueryCursor] = {}
+
+    def get(self, **params: Any) -> QueryCursor:
+        """Get (or create) the cursor of a query"""
+        key = tuple(sorted((name, str(value)) for name, value in params.items()))
+        if key not in self._cursors:
+            self._cursors[key] = self._factory()
+        return self._cursors[key]
+
+    def clear(self) -> None:
+        """Forget all cursors"""
+        self._cursors.clear()
+
+
+def select_new(
+    cursor: QueryCursor[T],
+    select: Callable[..., Iterable[T]],
+    predicate: Optional[Callable[[T], Any]] = None,
+    cursor_param: str = "created_after",
+    **kwargs,
+) -> List[T]:
+    """Poll only the items created (or updated) since the previous poll of the
+    cursor, and merge the matching items into the cursor. The cursor must use
+    the time matching the cursor_param, e.g. the creation time for created_after
+    (createdFrom) or the last updated time for updated_after (lastUpdatedFrom).
+    Shards are not supported, as they split the time range using the time.
+
+    Returns:
+        List[T]: All accumulated items, newest (time) first
+    """
+    kwargs[cursor_param] = cursor.after(kwargs.get(cursor_param))
+    cursor.merge(select(**kwargs), predicate)
+    return sorted(cursor.items(), key=time_sort_key(item_time), reverse=True)
+
+
+def pop_time_range(
+    params: Dict[str, Any]
+) -> Tuple[Optional[datetime], datetime]:
+    """Remove the after/before/max_age query parameters and return them as an
+    absolute time range. before defaults to now, and after is None if neither
+    after nor max_age is set.
+    """
+    now = datetime.now(timezone.utc)
+    before = params.pop("before", None)
+    after = params.pop("after", None)
+    max_age = params.pop("max_age", None)
+    if max_age is not None:
+        after = now - max_age
+    return (
+        to_datetime(after) if after else None,
+        to_datetime(before) if before else now,
+    )
+
+
+def time_sort_key(time_func: Callable[[T], Optional[datetime]]) -> Callable[[T], float]:
+    """Sort key (epoch seconds) using a time function. Items without a time are first"""
+
+    def key(item: T) -> float:
+        timestamp = time_func(item)
+        return timestamp.timestamp() if timestamp else 0
+
+    return key
+
+
+def fetch_sharded(
+    select: Callable[..., Iterable[T]],
+    after: Union[str, datetime],
+    before: Union[str, datetime],
+    time_func: Callable[[T], Optional[datetime]],
+    shards: int = 4,
+    max_workers: int = 4,
+    max_shard_pages: int = 3,
+    key_func: Callable[[T], Hashable] = default_item_key,
+    **kwargs,
+) -> List[T]:
+    """Fetch all items of a time range by splitting the range into shards which
+    are fetched concurrently (sharing the client's connection pool).
+
+    Shards are adaptive: if a shard contains more than max_shard_pages pages, the
+    items read so far are kept and the remaining part of the shard is split in
+    two new shards. The results are merged in time order (oldest first), and
+    items which are returned by multiple shards (e.g. at the shard boundaries)
+    are deduplicated.
+
+    Args:
+        select (Callable): Lazy query function, e.g. client.measurements.select
+        after (str | datetime): Start of the time range
+        before (str | datetime): End of the time range
+        time_func (Callable): Function returning the time of an item
+        shards (int, optional): Initial number of shards. Defaults to 4.
+        max_workers (int, optional): Maximum number of concurrent requests. Defaults to 4.
+        max_shard_pages (int, optional): Maximum number of pages to read per shard
+            before it is split. Defaults to 3.
+        key_func (Callable, optional): Function returning the deduplication key of an item
+        **kwargs: Additional query parameters passed to the select function
+
+    Returns:
+        List[T]: Items sorted by time
+    """
+    # pylint: disable=too-many-arguments,too-many-locals
+    date_from = to_datetime(after)
+    date_to = to_datetime(before)
+    if date_to <= date_from:
+        raise ValueError(
+            f"Invalid time range. after ({date_from}) must be before before ({date_to})"
+        )
+
+    max_items = max_shard_pages * kwargs.get("page_size", 1000)
+    # Don't split shards any further when they are this small (e.g. lots of
+    # items with the same time), just read all of the pages instead
+    min_duration = timedelta(seconds=1)
+
+    def fetch(shard_from: datetime, shard_to: datetime):
+        limit = max_items if shard_to - shard_from > min_duration else None
+        items = list(
+            itertools.islice(
+                select(after=shard_from, before=shard_to, **kwargs),
+                limit,
+            )
+        )
+        remaining = None
+        if limit is not None and len(items) >= limit:
+            first, last = time_func(items[0]), time_func(items[-1])
+            if first is not None and last is not None:
+                if first <= last:
+                    # oldest first
+                    remaining = (last, shard_to)
+                else:
+                    # newest first
+                    remaining = (shard_from, last)
+        return items, remaining
+
+    step = (date_to - date_from) / shards
+    boundaries = [date_from + step * i for i in range(shards)] + [date_to]
+
+    results: Dict[Hashable, T] = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {
+            executor.submit(fetch, shard_from, shard_to)
+            for shard_from, shard_to in zip(boundaries, boundaries[1:])
+        }
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                items, remaining = future.result()
+                for item in items:
+                    results.setdefault(key_func(item), item)
+
+                if remaining is not None:
+                    shard_from, shard_to = remaining
+                    middle = shard_from + (shard_to - shard_from) / 2
+                    pending.add(executor.submit(fetch, shard_from, middle))
+                    pending.add(executor.submit(fetch, middle, shard_to))
+
+    return sorted(results.values(), key=time_sort_key(time_func))
+
+
+def select_with_shards(
+    select: Callable[..., Iterable[T]], shards: int = 0, **kwargs
+) -> Iterable[T]:
+    """Run a select query, either as is (lazy), or split into time range
+    shards which are fetched concurrently (see fetch_sharded).
+
+    The time range is defined by the after (or max_age) and before query
+    parameters, where before defaults to now.
+
+    Args:
+        select (Callable): Lazy query function, e.g. client.events.select
+        shards (int, optional): Number of shards. Shards are not used if set to 0.
+        **kwargs: Query parameters passed to the select function
+
+    Returns:
+        Iterable[T]: Items
+    """
+    if not shards:
+        return select(**kwargs)
+
+    after, before = pop_time_range(kwargs)
+    if after is None:
+        raise FinalAssertionError(
+            "Either after or max_age must be set when using shards"
+        )
+    return fetch_sharded(
+        select,
+        after,
+        before,
+        time_func=item_time,
+        shards=shards,
+        **kwargs,
+    )
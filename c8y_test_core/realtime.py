@@ -14,7 +14,7 @@ class Subscriber:
         proc = subprocess.Popen(
             [
                 "c8y",
-                "measurements",
+                typename,
                 "subscribe",
                 "--device",
                 device_id,
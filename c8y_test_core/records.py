@@ -0,0 +1,122 @@
+"""Lightweight (raw or projected) query results
+
+Building full c8y_api objects (Measurement, Event, Alarm, Operation) for every
+item is expensive for large result sets, when the assertions only look at one
+or two fields. The helpers here read the same pages, but return either the raw
+json dictionaries, or compact records (namedtuples) holding only the requested
+fields.
+"""
+import collections
+import functools
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Sequence, Tuple
+
+# CumulocityResource and _build_base_query are private c8y_api api, but they are
+# only used by select_records (to build the same query as the resource's select)
+from c8y_api.model._base import CumulocityResource
+
+# Same default page size as the c8y_api select functions (the server default is 5)
+DEFAULT_PAGE_SIZE = 1000
+
+
+def _get_path(data: Any, path: Tuple[str, ...]) -> Any:
+    for key in path:
+        if not isinstance(data, dict):
+            return None
+        data = data.get(key)
+    return data
+
+
+@functools.lru_cache(maxsize=128)
+def record_type(fields: Tuple[str, ...]):
+    """Get the record type (namedtuple) for a list of fields. Nested fields use
+    dot notation (e.g. source.id) and are accessible using underscores (source_id)
+    """
+    return collections.namedtuple(
+        "Record", [field.replace(".", "_") for field in fields], rename=True
+    )
+
+
+def ensure_fields(
+    fields: Optional[Sequence[str]], *required: str
+) -> Optional[Tuple[str, ...]]:
+    """Add required fields to a field list (if they are missing). None is returned
+    if no fields are given (e.g. no projection)"""
+    if fields is None:
+        return None
+    return tuple(name for name in required if name not in fields) + tuple(fields)
+
+
+class Projection:
+    """Convert raw json items to records containing only the given fields"""
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, fields: Sequence[str]) -> None:
+        self.fields = tuple(fields)
+        self._paths = [tuple(field.split(".")) for field in self.fields]
+        self._type = record_type(self.fields)
+
+    def __call__(self, data: Dict[str, Any]) -> Tuple[Any, ...]:
+        return self._type._make(_get_path(data, path) for path in self._paths)
+
+
+def select_records(
+    resource: CumulocityResource,
+    fields: Optional[Sequence[str]] = None,
+    limit: Optional[int] = None,
+    **kwargs,
+) -> Iterator[Any]:
+    """Query a resource (lazily), without building c8y_api objects
+
+    Args:
+        resource (CumulocityResource): Resource, e.g. client.measurements
+        fields (Sequence[str], optional): Fields to include in the records. If None,
+            then the raw json dictionaries are returned.
+        limit (int, optional): Maximum number of items to return
+        **kwargs: Query parameters, the same as the resource's select function.
+            The page_size defaults to 1000.
+
+    Returns:
+        Iterator[Any]: Raw dictionaries or records
+    """
+    # The query parameters are mapped the same way as the resource's select function.
+    # _build_base_query is private c8y_api api, so it is only called here
+    # pylint: disable=protected-access
+    kwargs.setdefault("page_size", DEFAULT_PAGE_SIZE)
+    base_query = resource._build_base_query(**kwargs)
+    parse = Projection(fields) if fields is not None else None
+    count = 0
+    page = 1
+    while True:
+        response = resource.c8y.get(f"{base_query}&currentPage={page}")
+        items = response.get(resource.object_name, [])
+        if not items:
+            return
+        for item in items:
+            yield parse(item) if parse else item
+            count += 1
+            if limit and count >= limit:
+                return
+        page += 1
+
+
+def get_select(
+    resource: CumulocityResource,
+    raw: bool = False,
+    fields: Optional[Sequence[str]] = None,
+) -> Callable[..., Iterable[Any]]:
+    """Get the select function of a resource for the given result mode
+
+    Args:
+        resource (CumulocityResource): Resource, e.g. client.measurements
+        raw (bool, optional): Return raw json dictionaries. Defaults to False.
+        fields (Sequence[str], optional): Return records with only these fields.
+
+    Returns:
+        Callable[..., Iterable[Any]]: select function
+    """
+    if fields is not None:
+        return functools.partial(select_records, resource, fields)
+    if raw:
+        return functools.partial(select_records, resource, None)
+    return resource.select
@@ -0,0 +1,220 @@
+"""Shared scheduler for periodic tasks
+
+A single scheduler thread keeps the deadlines of all tasks in a heap, and
+dispatches the due tasks to a bounded worker pool. This allows simulating many
+devices (e.g. hundreds of periodic publishers) without a thread per task.
+"""
+import collections
+import heapq
+import itertools
+import logging
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from c8y_test_core.timer import Lateness, Overrun
+
+log = logging.getLogger()
+
+
+class ScheduledTask:
+    """Periodic task managed by a Scheduler
+
+    The next run is only scheduled once the previous run has finished, so runs
+    of the same task never overlap. The overrun policy is the same as RepeatTimer.
+    """
+
+    # pylint: disable=too-many-instance-attributes,too-many-arguments
+
+    def __init__(
+        self,
+        scheduler: "Scheduler",
+        name: str,
+        target: Callable[..., Any],
+        args: List[Any],
+        kwargs: Dict[str, Any],
+        interval: float,
+        next_at: float,
+        count: int = 0,
+        overrun: str = Overrun.CATCH_UP,
+        max_errors: int = 100,
+    ) -> None:
+        self._scheduler = scheduler
+        self.name = name
+        self.target = target
+        self.target_args = args
+        self.target_kwargs = kwargs
+        self.interval = interval
+        self.next_at = next_at
+        self.max_count = count
+        self.overrun = overrun
+        self.runs = 0
+        self.skipped = 0
+        self.error_count = 0
+        self.errors: collections.deque = collections.deque(maxlen=max_errors)
+        self.last_result: Any = None
+        self.lateness = Lateness()
+        self.cancelled = threading.Event()
+
+    def cancel(self) -> None:
+        """Stop scheduling the task (a run which has already started is completed)"""
+        self.cancelled.set()
+
+    @property
+    def done(self) -> bool:
+        """Task will not run again"""
+        return self.cancelled.is_set() or (
+            self.max_count > 0 and self.runs >= self.max_count
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """Run count, errors and lateness of the task"""
+        return {
+            "runs": self.runs,
+            "skipped": self.skipped,
+            "errors": self.error_count,
+            "lateness": self.lateness.stats(),
+        }
+
+    def _run(self) -> None:
+        self.lateness.record(time.monotonic() - self.next_at)
+        try:
+            self.last_result = self.target(*self.target_args, **self.target_kwargs)
+        except Exception as ex:  # pylint: disable=broad-except
+            log.warning("Scheduled task failed. name=%s, error=%s", self.name, ex)
+            self.error_count += 1
+            self.errors.append(ex)
+        self.runs += 1
+        if self.done:
+            return
+
+        self.next_at += self.interval
+        behind = time.monotonic() - self.next_at
+        if self.overrun == Overrun.SKIP and behind > 0:
+            missed = math.ceil(behind / self.interval)
+            self.next_at += missed * self.interval
+            self.skipped += missed
+        self._scheduler._push(self)  # pylint: disable=protected-access
+
+
+class Scheduler:
+    """Run periodic tasks on a bounded worker pool"""
+
+    def __init__(self, max_workers: int = 8) -> None:
+        self.max_workers = max_workers
+        self._heap: List[Any] = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._tasks: List[ScheduledTask] = []
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def tasks(self) -> List[ScheduledTask]:
+        """All tasks which have been scheduled"""
+        return list(self._tasks)
+
+    def schedule(
+        self,
+        target: Callable[..., Any],
+        args: Optional[List[Any]] = None,
+        kwargs: Optional[Dict[str, Any]] = None,
+        interval: float = 10.0,
+        delay: float = 0.0,
+        count: int = 0,
+        overrun: str = Overrun.CATCH_UP,
+        name: Optional[str] = None,
+    ) -> ScheduledTask:
+        """Schedule a periodic task. The scheduler is started if it is not running
+
+        Args:
+            target (Callable): Function to run
+            args (List[Any], optional): Positional arguments of the target
+            kwargs (Dict[str, Any], optional): Keyword arguments of the target
+            interval (float, optional): Interval in seconds. Defaults to 10.
+            delay (float, optional): Delay in seconds before the first run. Defaults to 0.
+            count (int, optional): Number of runs. Unlimited if set to 0. Defaults to 0.
+            overrun (str, optional): Overrun policy, see Overrun. Defaults to Overrun.CATCH_UP.
+            name (str, optional): Task name used in logs and stats. Defaults to
+                the target's name and an index.
+
+        Returns:
+            ScheduledTask: Task, which can be used to cancel it or read its stats
+        """
+        # pylint: disable=too-many-arguments
+        if interval <= 0:
+            raise ValueError("interval needs to be greater than 0")
+        if overrun not in (Overrun.CATCH_UP, Overrun.SKIP):
+            raise ValueError(
+                f"Invalid overrun policy. got={overrun}, "
+                f"wanted one of {[Overrun.CATCH_UP, Overrun.SKIP]}"
+            )
+        task = ScheduledTask(
+            self,
+            name or f"{getattr(target, '__name__', 'task')}-{len(self._tasks)}",
+            target,
+            args or [],
+            kwargs or {},
+            interval=interval,
+            next_at=time.monotonic() + delay,
+            count=count,
+            overrun=overrun,
+        )
+        self._tasks.append(task)
+        self.start()
+        self._push(task)
+        return task
+
+    def _push(self, task: ScheduledTask) -> None:
+        with self._condition:
+            if self._stopped:
+                return
+            heapq.heappush(self._heap, (task.next_at, next(self._sequence), task))
+            self._condition.notify()
+
+    def start(self) -> None:
+        """Start the scheduler thread and worker pool (if not already running)"""
+        with self._condition:
+            if self._thread is not None:
+                return
+            self._stopped = False
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            self._thread = threading.Thread(target=self._loop, daemon=True)
+            self._thread.start()
+
+    def stop(self, wait: bool = True) -> None:
+        """Stop scheduling tasks. Runs which have already started are completed
+        if wait is True"""
+        with self._condition:
+            if self._thread is None:
+                return
+            self._stopped = True
+            self._condition.notify()
+            thread, executor = self._thread, self._executor
+            self._thread = self._executor = None
+        thread.join()
+        executor.shutdown(wait=wait, cancel_futures=True)
+        self._heap.clear()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Stats of each task (by name)"""
+        return {task.name: task.stats() for task in self._tasks}
+
+    def _loop(self) -> None:
+        with self._condition:
+            while not self._stopped:
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+                next_at, _, task = self._heap[0]
+                delay = next_at - time.monotonic()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+                heapq.heappop(self._heap)
+                if not task.cancelled.is_set():
+                    # pylint: disable=protected-access
+                    self._executor.submit(task._run)
@@ -0,0 +1,284 @@
+"""Measurement series helpers
+
+The columnar helpers (SeriesData) require numpy, which is an optional dependency
+and can be installed using:
+
+    pip install "c8y-test-core[series]"
+"""
+import dataclasses
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+from c8y_test_core.paging import to_datetime
+
+# Maximum number of offending values to include in a failure message
+MAX_DIAGNOSTIC_VALUES = 5
+
+# Interval length (in seconds) of the aggregation types supported by the
+# measurement series endpoint
+AGGREGATION_INTERVALS = {
+    "MINUTELY": 60,
+    "HOURLY": 3600,
+    "DAILY": 86400,
+}
+
+
+class Monotonic:
+    """Monotonic series checks"""
+
+    # pylint: disable=too-few-public-methods
+
+    INCREASING = "increasing"
+    NON_DECREASING = "non_decreasing"
+    DECREASING = "decreasing"
+    NON_INCREASING = "non_increasing"
+
+
+def require_numpy():
+    """Raise an error if numpy is not installed"""
+    if np is None:
+        raise ImportError(
+            "numpy is required for measurement series assertions. "
+            'Install it using: pip install "c8y-test-core[series]"'
+        )
+
+
+def format_timestamp(timestamp: float) -> str:
+    """Format an epoch timestamp (in seconds) as an ISO 8601 string"""
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat(
+        timespec="milliseconds"
+    )
+
+
+@dataclasses.dataclass
+class SeriesData:
+    """Measurement series stored as columns
+
+    timestamps are epoch seconds (float64) sorted in ascending order, and
+    values are the corresponding series values (float64).
+    """
+
+    name: str
+    timestamps: Any
+    values: Any
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def stats(self) -> Dict[str, Any]:
+        """Summary statistics of the series values"""
+        if len(self) == 0:
+            return {"count": 0}
+        return {
+            "count": len(self),
+            "min": float(self.values.min()),
+            "max": float(self.values.max()),
+            "mean": float(self.values.mean()),
+            "std": float(self.values.std()),
+            "start": format_timestamp(self.timestamps[0]),
+            "end": format_timestamp(self.timestamps[-1]),
+        }
+
+    def describe(self, indexes: Iterable[int]) -> str:
+        """Describe the values at the given indexes (limited to the first few)"""
+        return ", ".join(
+            f"{format_timestamp(self.timestamps[i])}={self.values[i]:g}"
+            for i in list(indexes)[:MAX_DIAGNOSTIC_VALUES]
+        )
+
+
+def extract_series(measurements: Iterable[Any], fragment: str, series: str) -> SeriesData:
+    """Extract a measurement series into columnar numpy arrays
+
+    Measurements which do not contain the series are skipped.
+
+    Args:
+        measurements (Iterable[Measurement]): Measurements
+        fragment (str): Value fragment, e.g. c8y_Temperature
+        series (str): Series name, e.g. T
+
+    Returns:
+        SeriesData: Series sorted by time
+    """
+    require_numpy()
+    timestamps = []
+    values = []
+    for measurement in measurements:
+        value = measurement.fragments.get(fragment, {}).get(series, {}).get("value")
+        if value is None or not measurement.time:
+            continue
+        timestamps.append(to_datetime(measurement.time).timestamp())
+        values.append(value)
+
+    timestamps_arr = np.asarray(timestamps, dtype=np.float64)
+    values_arr = np.asarray(values, dtype=np.float64)
+
+    # normalize the order between legacy and time series measurements
+    order = np.argsort(timestamps_arr, kind="stable")
+    return SeriesData(
+        name=f"{fragment}.{series}",
+        timestamps=timestamps_arr[order],
+        values=values_arr[order],
+    )
+
+
+def check_series(
+    data: SeriesData,
+    min_value: Optional[float] = None,
+    max_value: Optional[float] = None,
+    monotonic: Optional[str] = None,
+    max_gap: Optional[float] = None,
+    min_rate: Optional[float] = None,
+    max_rate: Optional[float] = None,
+    mean: Optional[float] = None,
+    mean_tolerance: float = 0.0,
+    max_std: Optional[float] = None,
+) -> List[str]:
+    """Check properties of a series. See AssertMeasurements.assert_series
+    for a description of the arguments.
+
+    Returns:
+        List[str]: Description of each failed check
+    """
+    # pylint: disable=too-many-arguments,too-many-locals,too-many-branches
+    errors = []
+    values = data.values
+    timestamps = data.timestamps
+
+    if min_value is not None:
+        (indexes,) = np.nonzero(values < min_value)
+        if len(indexes):
+            errors.append(
+                f"{len(indexes)} value/s less than min_value={min_value}: "
+                f"{data.describe(indexes)}"
+            )
+
+    if max_value is not None:
+        (indexes,) = np.nonzero(values > max_value)
+        if len(indexes):
+            errors.append(
+                f"{len(indexes)} value/s greater than max_value={max_value}: "
+                f"{data.describe(indexes)}"
+            )
+
+    if monotonic is not None:
+        diffs = np.diff(values)
+        violations = {
+            Monotonic.INCREASING: diffs <= 0,
+            Monotonic.NON_DECREASING: diffs < 0,
+            Monotonic.DECREASING: diffs >= 0,
+            Monotonic.NON_INCREASING: diffs > 0,
+        }
+        if monotonic not in violations:
+            raise ValueError(
+                f"Invalid monotonic value. got={monotonic}, "
+                f"wanted one of {list(violations.keys())}"
+            )
+        (indexes,) = np.nonzero(violations[monotonic])
+        if len(indexes):
+            errors.append(
+                f"Series is not {monotonic}. {len(indexes)} violation/s at: "
+                f"{data.describe(indexes + 1)}"
+            )
+
+    if max_gap is not None and len(timestamps) > 1:
+        gaps = np.diff(timestamps)
+        (indexes,) = np.nonzero(gaps > max_gap)
+        if len(indexes):
+            gap_details = ", ".join(
+                f"{gaps[i]:.3f}s after {format_timestamp(timestamps[i])}"
+                for i in indexes[:MAX_DIAGNOSTIC_VALUES]
+            )
+            errors.append(
+                f"{len(indexes)} gap/s longer than max_gap={max_gap}s "
+                f"(largest={gaps.max():.3f}s): {gap_details}"
+            )
+
+    if (min_rate is not None or max_rate is not None) and len(values) > 1:
+        time_diffs = np.diff(timestamps)
+        valid = time_diffs > 0
+        rates = np.diff(values)[valid] / time_diffs[valid]
+        rate_indexes = np.nonzero(valid)[0] + 1
+        if min_rate is not None:
+            (indexes,) = np.nonzero(rates < min_rate)
+            if len(indexes):
+                errors.append(
+                    f"{len(indexes)} rate/s less than min_rate={min_rate}/s "
+                    f"(lowest={rates.min():g}/s): {data.describe(rate_indexes[indexes])}"
+                )
+        if max_rate is not None:
+            (indexes,) = np.nonzero(rates > max_rate)
+            if len(indexes):
+                errors.append(
+                    f"{len(indexes)} rate/s greater than max_rate={max_rate}/s "
+                    f"(highest={rates.max():g}/s): {data.describe(rate_indexes[indexes])}"
+                )
+
+    if mean is not None and len(values):
+        actual_mean = float(values.mean())
+        if abs(actual_mean - mean) > mean_tolerance:
+            errors.append(
+                f"Mean is out of tolerance. wanted={mean}±{mean_tolerance}, got={actual_mean:g}"
+            )
+
+    if max_std is not None and len(values):
+        actual_std = float(values.std())
+        if actual_std > max_std:
+            errors.append(
+                f"Standard deviation is too high. wanted<={max_std}, got={actual_std:g}"
+            )
+
+    return errors
+
+
+@dataclasses.dataclass
+class SeriesInterval:
+    """Aggregated values of a series within one interval"""
+
+    start: datetime
+    min: Optional[float]
+    max: Optional[float]
+
+
+def get_aggregation_interval(aggregation: str) -> float:
+    """Get the interval length in seconds of an aggregation type"""
+    try:
+        return AGGREGATION_INTERVALS[aggregation.upper()]
+    except KeyError as ex:
+        raise ValueError(
+            f"Invalid aggregation type. got={aggregation}, "
+            f"wanted one of {list(AGGREGATION_INTERVALS.keys())}"
+        ) from ex
+
+
+def find_missing_intervals(
+    intervals: Iterable[SeriesInterval],
+    date_from: datetime,
+    date_to: datetime,
+    interval: float,
+) -> List[datetime]:
+    """Find the intervals without any values. Only intervals which are completely
+    within the time range are considered. Intervals are aligned to the unix epoch (UTC).
+
+    Args:
+        intervals (Iterable[SeriesInterval]): Intervals which contain values
+        date_from (datetime): Start of the time range
+        date_to (datetime): End of the time range
+        interval (float): Interval length in seconds
+
+    Returns:
+        List[datetime]: Start of each missing interval
+    """
+    present = {int(item.start.timestamp() // interval) for item in intervals}
+    first = -(-date_from.timestamp() // interval)  # ceil
+    last = date_to.timestamp() // interval
+    return [
+        datetime.fromtimestamp(index * interval, timezone.utc)
+        for index in range(int(first), int(last))
+        if index not in present
+    ]
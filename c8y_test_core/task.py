@@ -1,17 +1,25 @@
 """Task utilities"""
-from typing import Any, Callable, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Sequence
 from c8y_api import CumulocityApi
-from c8y_test_core.timer import RepeatTimer
+from c8y_test_core.load import LoadGenerator
+from c8y_test_core.scheduler import ScheduledTask, Scheduler
+from c8y_test_core.timer import Overrun
 
 
 class BackgroundTask:
-    """Background task that can be used to run periodic tasks"""
+    """Background task that can be used to run periodic tasks
+
+    All periodic tasks share a single scheduler thread and a pool of
+    max_workers threads, so many tasks (e.g. one per simulated device) can be
+    run without a thread per task.
+    """
 
     # pylint: disable=too-many-arguments
 
-    def __init__(self, client: CumulocityApi) -> None:
+    def __init__(self, client: CumulocityApi, max_workers: int = 8) -> None:
         self.client = client
-        self._timers: List[RepeatTimer] = []
+        self.scheduler = Scheduler(max_workers=max_workers)
+        self._timers: List[LoadGenerator] = []
 
     def start(
         self,
@@ -21,24 +29,63 @@ class BackgroundTask:
         interval: float = 0.0,
         delay: float = 0.0,
         count: int = 0,
-    ):
-        """Start a new background task"""
-        if interval <= 0:
-            raise ValueError("interval needs to be greater than 0")
+        overrun: str = Overrun.CATCH_UP,
+        name: Optional[str] = None,
+    ) -> ScheduledTask:
+        """Start a new background task
 
-        timer = RepeatTimer(
+        The task is run at fixed deadlines (delay + n * interval). If a run
+        is late by more than one interval, the missed runs are either caught up or
+        skipped (see Overrun). Exceptions raised by the target are collected
+        (task.errors) and do not stop the task. The run count and scheduling
+        lateness are available from the returned task (task.stats()).
+        """
+        return self.scheduler.schedule(
+            target,
+            args=args,
+            kwargs=kwargs,
             interval=interval,
-            count=count,
             delay=delay,
-            target=target,
-            args=(args or []),
-            kwargs=(kwargs or {}),
+            count=count,
+            overrun=overrun,
+            name=name,
+        )
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Run count, errors and lateness of each periodic task (by name)"""
+        return self.scheduler.stats()
+
+    def start_load(
+        self,
+        kind: str,
+        devices: Sequence[str],
+        rate: float,
+        duration: Optional[float] = None,
+        count: Optional[int] = None,
+        **kwargs,
+    ) -> LoadGenerator:
+        """Start generating telemetry (measurements, events or alarms) at a target
+        rate for the given devices. See LoadGenerator for the supported options.
+
+        Use LoadGenerator.result() to wait for the load to finish and get
+        the achieved throughput and latency.
+        """
+        generator = LoadGenerator(
+            self.client,
+            kind=kind,
+            devices=devices,
+            rate=rate,
+            duration=duration,
+            count=count,
+            **kwargs,
         )
-        timer.start()
-        self._timers.append(timer)
+        generator.start()
+        self._timers.append(generator)
+        return generator
 
     def stop(self):
-        """Stop all timers"""
+        """Stop all tasks"""
+        self.scheduler.stop()
         for timer in self._timers:
             timer.cancel()
             timer.join()
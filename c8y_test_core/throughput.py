@@ -0,0 +1,226 @@
+"""Throughput (publishing rate) helpers"""
+import bisect
+import dataclasses
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from c8y_test_core.paging import to_datetime
+from c8y_test_core.proc_utils import JsonReader
+from c8y_test_core.stats import percentile
+
+log = logging.getLogger()
+
+
+@dataclasses.dataclass
+class ThroughputStats:
+    """Observed throughput
+
+    Rates are in messages per second, and times are in seconds.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    count: int = 0
+    duration: float = 0.0
+    rate: float = 0.0
+    window: float = 0.0
+    min_window_rate: float = 0.0
+    max_window_rate: float = 0.0
+    max_gap: float = 0.0
+    interarrival: Dict[str, float] = dataclasses.field(default_factory=dict)
+    jitter: Dict[str, float] = dataclasses.field(default_factory=dict)
+
+    def __str__(self) -> str:
+        return (
+            f"count={self.count}, duration={self.duration:.3f}s, rate={self.rate:.3f}/s, "
+            f"window_rate(min/max)={self.min_window_rate:.3f}/{self.max_window_rate:.3f}/s "
+            f"(window={self.window}s), max_gap={self.max_gap:.3f}s, "
+            f"interarrival={self.interarrival}, jitter={self.jitter}"
+        )
+
+
+def compute_throughput(
+    timestamps: Iterable[float],
+    window: float = 10.0,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    percentiles: Iterable[int] = (50, 90, 99),
+) -> ThroughputStats:
+    """Compute the throughput of a series of arrival times
+
+    Args:
+        timestamps (Iterable[float]): Arrival times (epoch seconds), in any order
+        window (float, optional): Length of the sliding window in seconds. Defaults to 10.
+        start (float, optional): Start of the observation period. Defaults to the first arrival.
+        end (float, optional): End of the observation period. Defaults to the last arrival.
+        percentiles (Iterable[int], optional): Percentiles of the interarrival times
+            and jitter to compute. Defaults to (50, 90, 99).
+
+    Returns:
+        ThroughputStats: Observed throughput
+    """
+    times = sorted(timestamps)
+    stats = ThroughputStats(count=len(times), window=window)
+    if not times:
+        return stats
+
+    start = times[0] if start is None else start
+    end = times[-1] if end is None else end
+    stats.duration = max(end - start, 0.0)
+    if stats.duration > 0:
+        stats.rate = len(times) / stats.duration
+
+    # include the silence before the first and after the last arrival
+    gaps = [b - a for a, b in zip([start, *times], [*times, end])]
+    stats.max_gap = max(gaps)
+
+    interarrival = sorted(b - a for a, b in zip(times, times[1:]))
+    if interarrival:
+        mean_interval = sum(interarrival) / len(interarrival)
+        jitter = sorted(abs(value - mean_interval) for value in interarrival)
+        for percent in sorted(set(percentiles)):
+            stats.interarrival[f"p{percent}"] = percentile(interarrival, percent)
+            stats.jitter[f"p{percent}"] = percentile(jitter, percent)
+
+    if stats.duration < window:
+        # not enough data for a full window
+        stats.min_window_rate = stats.max_window_rate = stats.rate
+        return stats
+
+    # The busiest window starts at an arrival, and the quietest window starts
+    # at the observation start or just after an arrival
+    max_count = 0
+    min_count = bisect.bisect_right(times, start + window) - bisect.bisect_left(
+        times, start
+    )
+    for time in times:
+        if time + window > end:
+            break
+        max_count = max(
+            max_count,
+            bisect.bisect_right(times, time + window) - bisect.bisect_left(times, time),
+        )
+        min_count = min(
+            min_count,
+            bisect.bisect_right(times, time + window) - bisect.bisect_right(times, time),
+        )
+    stats.min_window_rate = min_count / window
+    stats.max_window_rate = max(max_count, min_count) / window
+    return stats
+
+
+def check_throughput(
+    stats: ThroughputStats,
+    min_rate: Optional[float] = None,
+    max_rate: Optional[float] = None,
+    max_gap: Optional[float] = None,
+    max_jitter: Optional[float] = None,
+    jitter_percentile: int = 99,
+) -> List[str]:
+    """Check the throughput against the expectations
+
+    Returns:
+        List[str]: Description of each failed check
+    """
+    # pylint: disable=too-many-arguments
+    errors = []
+    if min_rate is not None and stats.min_window_rate < min_rate:
+        errors.append(
+            f"Rate is less than expected. wanted>={min_rate}/s, "
+            f"got={stats.min_window_rate:.3f}/s (lowest {stats.window}s window)"
+        )
+    if max_rate is not None and stats.max_window_rate > max_rate:
+        errors.append(
+            f"Rate is more than expected. wanted<={max_rate}/s, "
+            f"got={stats.max_window_rate:.3f}/s (highest {stats.window}s window)"
+        )
+    if max_gap is not None and stats.max_gap > max_gap:
+        errors.append(
+            f"Gap between messages is longer than expected. wanted<={max_gap}s, "
+            f"got={stats.max_gap:.3f}s"
+        )
+    if max_jitter is not None:
+        # there is no jitter with less than 2 messages
+        actual = stats.jitter.get(f"p{jitter_percentile}", 0.0)
+        if actual > max_jitter:
+            errors.append(
+                f"Jitter (p{jitter_percentile}) is higher than expected. "
+                f"wanted<={max_jitter}s, got={actual:.3f}s"
+            )
+    return errors
+
+
+def assert_throughput(
+    name: str,
+    timestamps: Iterable[float],
+    window: float = 10.0,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    **kwargs: Any,
+) -> ThroughputStats:
+    """Assert the throughput of a series of arrival times. The observed throughput
+    is logged regardless of the result.
+
+    See check_throughput for the supported expectations. Timestamps outside of
+    the observation period (start/end) are ignored, e.g. items which were
+    accumulated by previous incremental polls.
+    """
+    # pylint: disable=too-many-arguments
+    timestamps = [
+        timestamp
+        for timestamp in timestamps
+        if (start is None or timestamp >= start) and (end is None or timestamp <= end)
+    ]
+    stats = compute_throughput(
+        timestamps,
+        window=window,
+        start=start,
+        end=end,
+        percentiles=(50, 90, 99, kwargs.get("jitter_percentile", 99)),
+    )
+    log.info("Observed %s throughput: %s", name, stats)
+    errors = check_throughput(stats, **kwargs)
+    assert len(errors) == 0, (
+        f"{name} throughput does not match expectations\n"
+        + "\n".join(f"  {error}" for error in errors)
+        + f"\nobserved: {stats}"
+    )
+    return stats
+
+
+def timestamps_from_stream(reader: JsonReader, time_field: str = "time") -> List[float]:
+    """Read all messages from a realtime subscription and return their times
+
+    Args:
+        reader (JsonReader): Realtime subscription, e.g. Subscriber.to_measurements
+        time_field (str, optional): Field containing the message time. Defaults to 'time'.
+
+    Returns:
+        List[float]: Arrival times (epoch seconds)
+    """
+    messages = reader.read_all() or []
+    return [
+        to_datetime(message[time_field]).timestamp()
+        for message in messages
+        if message.get(time_field)
+    ]
+
+
+def observation_period(
+    params: Dict[str, Any]
+) -> Tuple[Optional[float], Optional[float]]:
+    """Get the observation period (epoch seconds) from the after/before/max_age
+    query parameters. None is returned for unset values, in which case the time
+    of the first or last message is used.
+    """
+    start = params.get("after")
+    end = params.get("before")
+    max_age = params.get("max_age")
+    if max_age is not None:
+        end = end or datetime.now(timezone.utc)
+        start = to_datetime(end) - max_age
+    return (
+        to_datetime(start).timestamp() if start else None,
+        to_datetime(end).timestamp() if end else None,
+    )
@@ -1,11 +1,68 @@
 """Global fixtures"""
+import collections
+import math
 import threading
 import time
 from typing import Any, Dict, List, Optional
 
+from c8y_test_core.stats import percentile
+
+
+class Overrun:
+    """What to do when a run is late by more than one interval (e.g. the target
+    took longer than the interval)"""
+
+    # pylint: disable=too-few-public-methods
+
+    # Run the missed runs immediately (back to back) so that the
+    # number of runs matches the configured rate
+    CATCH_UP = "catch_up"
+
+    # Skip the missed runs and continue at the next deadline on the original schedule
+    SKIP = "skip"
+
+
+class Lateness:
+    """Scheduling lateness (in seconds) of a periodic task, e.g. how long after
+    its deadline a run actually started. Only the most recent values are
+    kept for the percentiles."""
+
+    def __init__(self, max_samples: int = 1000) -> None:
+        self._lock = threading.Lock()
+        self._samples = collections.deque(maxlen=max_samples)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value: float) -> None:
+        """Record the lateness of a run"""
+        value = max(value, 0.0)
+        with self._lock:
+            self._samples.append(value)
+            self.count += 1
+            self.total += value
+            self.max = max(self.max, value)
+
+    def stats(self) -> Dict[str, float]:
+        """Summary of the lateness (count, mean, max and percentiles)"""
+        with self._lock:
+            samples = sorted(self._samples)
+            result = {
+                "count": self.count,
+                "mean": self.total / self.count if self.count else 0.0,
+                "max": self.max,
+            }
+        for percent in (50, 90, 99):
+            result[f"p{percent}"] = percentile(samples, percent)
+        return result
+
 
 class RepeatTimer(threading.Thread):
-    """Repeat timer which runs the given target at an interval until cancel is called"""
+    """Repeat timer which runs the given target at an interval until cancel is called
+
+    The runs are scheduled at fixed deadlines (delay + n * interval), so the
+    timer does not drift when the target takes some time to run.
+    """
 
     # pylint: disable=too-many-instance-attributes,too-many-arguments
     def __init__(
@@ -17,28 +74,48 @@ class RepeatTimer(threading.Thread):
         interval: float = 10.0,
         count: Optional[int] = None,
         event: Optional[threading.Event] = None,
+        overrun: str = Overrun.CATCH_UP,
     ):
         threading.Thread.__init__(self)
+        if overrun not in (Overrun.CATCH_UP, Overrun.SKIP):
+            raise ValueError(
+                f"Invalid overrun policy. got={overrun}, "
+                f"wanted one of {[Overrun.CATCH_UP, Overrun.SKIP]}"
+            )
         self.stopped = event or threading.Event()
         self.target = target
         self.interval = interval or 0.5
         self.delay = delay
         self.max_count = count or 0
+        self.overrun = overrun
         self._count = 0
+        self.skipped = 0
+        self.lateness = Lateness()
         self.target_args = args or []
         self.target_kwargs = kwargs or {}
 
+    @property
+    def runs(self) -> int:
+        """Number of times the target has been run"""
+        return self._count
+
     def cancel(self):
         """Stop the timer"""
         self.stopped.set()
 
     def run(self):
         next_at = time.monotonic() + self.delay
-        while not self.stopped.wait(0.5):
-            if time.monotonic() >= next_at:
-                self.target(*self.target_args, **self.target_kwargs)
-                next_at += self.interval
-                self._count += 1
-
-                if self.max_count > 0 and self._count > self.max_count:
-                    break
+        while not self.stopped.wait(max(next_at - time.monotonic(), 0)):
+            self.lateness.record(time.monotonic() - next_at)
+            self.target(*self.target_args, **self.target_kwargs)
+            self._count += 1
+
+            if self.max_count > 0 and self._count >= self.max_count:
+                break
+
+            next_at += self.interval
+            behind = time.monotonic() - next_at
+            if self.overrun == Overrun.SKIP and behind > 0:
+                missed = math.ceil(behind / self.interval)
+                next_at += missed * self.interval
+                self.skipped += missed
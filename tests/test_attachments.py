@@ -0,0 +1,186 @@
+"""Attachment tests
+"""
+import hashlib
+import re
+import tempfile
+import unittest
+from unittest.mock import Mock, patch
+from c8y_test_core.assert_events import Events
+from c8y_test_core.attachments import WindowSearch, file_checksum, verify_chunks
+from .fixtures import create_context
+
+CONTENTS = b"line 1\nline 2\nERROR: something failed\nline 4\n" * 10
+
+
+def chunked(data: bytes, size: int):
+    return [data[i : i + size] for i in range(0, len(data), size)]
+
+
+def mock_download(context, data: bytes, status_code: int = 200):
+    response = Mock()
+    response.status_code = status_code
+    response.iter_content.side_effect = lambda chunk_size: iter(
+        chunked(data, chunk_size)
+    )
+    context.client.base_url = "https://example.com"
+    context.client.session = Mock()
+    context.client.session.get.return_value = response
+    context.client.events.build_object_path.side_effect = (
+        lambda event_id: f"/event/events/{event_id}"
+    )
+    return response
+
+
+class TestVerifyChunks(unittest.TestCase):
+    def test_checksums(self):
+        digest, errors = verify_chunks(
+            chunked(CONTENTS, 7),
+            expected_md5=hashlib.md5(CONTENTS).hexdigest(),
+            expected_sha256=hashlib.sha256(CONTENTS).hexdigest().upper(),
+            expected_size_min=len(CONTENTS),
+        )
+        assert errors == []
+        assert digest.size == len(CONTENTS)
+        assert digest.contents is None
+
+    def test_contents_mismatch(self):
+        _, errors = verify_chunks(
+            chunked(CONTENTS, 7), expected_contents=CONTENTS.decode()[:-1] + "x"
+        )
+        assert len(errors) == 1
+        assert f"First difference at byte {len(CONTENTS) - 1}" in errors[0]
+
+        _, errors = verify_chunks(chunked(CONTENTS, 7), expected_contents="line")
+        assert "wanted_size=4" in errors[0]
+
+    def test_window_search_across_chunks(self):
+        search = WindowSearch(re.compile(rb"ERROR: \w+ failed"), 32)
+        for chunk in chunked(CONTENTS, 5):
+            search.feed(chunk)
+        assert search.matched
+
+        _, errors = verify_chunks(
+            chunked(CONTENTS, 5), expected_window_pattern="^FATAL", window_size=32
+        )
+        assert "did not contain pattern" in errors[0]
+
+    def test_window_search_line_start_across_chunks(self):
+        pattern = re.compile(rb"^ERROR", re.MULTILINE)
+        # the kept window starts in the middle of the line
+        search = WindowSearch(pattern, 5)
+        for chunk in (b"line 1\nxx", b"ERROR", b" not at the start\n"):
+            search.feed(chunk)
+        assert not search.matched
+
+        search = WindowSearch(pattern, 5)
+        for chunk in (b"line 1\n", b"ERR", b"OR at the start\n"):
+            search.feed(chunk)
+        assert search.matched
+
+
+class TestEventAttachment(unittest.TestCase):
+    def setUp(self) -> None:
+        self.context = create_context()
+        self.events = Events(self.context)
+        return super().setUp()
+
+    def test_assert_attachment_streams_download(self):
+        response = mock_download(self.context, CONTENTS)
+        contents = self.events.assert_attachment(
+            "123",
+            expected_pattern="^line 1.*line 4\n$",
+            expected_window_pattern="something failed",
+            chunk_size=16,
+        )
+        assert contents == CONTENTS
+        self.context.client.session.get.assert_called_once_with(
+            "https://example.com/event/events/123/binaries", stream=True
+        )
+        response.close.assert_called_once()
+
+    def test_assert_attachment_digest(self):
+        mock_download(self.context, CONTENTS)
+        digest = self.events.assert_attachment_digest(
+            "123", expected_sha256=hashlib.sha256(CONTENTS).hexdigest()
+        )
+        assert digest.contents is None
+        assert digest.md5 == hashlib.md5(CONTENTS).hexdigest()
+
+        mock_download(self.context, CONTENTS)
+        with self.assertRaisesRegex(AssertionError, r"checksum \(md5\) did not match"):
+            self.events.assert_attachment_digest("123", expected_md5="0" * 32)
+
+    def test_missing_attachment(self):
+        mock_download(self.context, b"", status_code=404)
+        with self.assertRaises(KeyError):
+            self.events.assert_attachment("123")
+
+
+class TestBulkAttachments(unittest.TestCase):
+    def setUp(self) -> None:
+        self.context = create_context()
+        self.events = Events(self.context)
+        mock_download(self.context, CONTENTS)
+        return super().setUp()
+
+    def test_all_attachments_match(self):
+        results = self.events.assert_attachments(
+            ["1", "2", "3"],
+            expected_md5=hashlib.md5(CONTENTS).hexdigest(),
+            max_workers=2,
+        )
+        assert [result.event_id for result in results] == ["1", "2", "3"]
+        assert all(result.ok for result in results)
+        assert self.context.client.session.get.call_count == 3
+        self.context.client.events.get.assert_not_called()
+
+    def test_failures_are_reported_per_event(self):
+        responses = {
+            "/event/events/1/binaries": CONTENTS,
+            "/event/events/2/binaries": b"other",
+        }
+
+        def get(url, stream):
+            response = Mock()
+            data = responses.get(url.replace("https://example.com", ""))
+            response.status_code = 404 if data is None else 200
+            response.iter_content.side_effect = lambda chunk_size: iter([data])
+            return response
+
+        self.context.client.session.get.side_effect = get
+        with self.assertRaises(AssertionError) as ctx:
+            self.events.assert_attachments(
+                ["1", "2", "3"], expected_window_pattern="ERROR"
+            )
+        message = str(ctx.exception)
+        assert "2 of 3 event attachment/s did not match" in message
+        assert "Attachment not found" in message
+        assert "did not contain pattern" in message
+
+    def test_checksum_file_is_read_once(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = f"{tmpdir}/expected.bin"
+            with open(path, "wb") as file:
+                file.write(CONTENTS)
+            with patch(
+                "c8y_test_core.attachments.file_checksum",
+                wraps=file_checksum,
+            ) as checksum:
+                results = self.events.assert_attachments(
+                    ["1", "2", "3"], expected_md5=path, expected_sha256=path
+                )
+        assert all(result.ok for result in results)
+        assert checksum.call_count == 2
+
+    def test_missing_event_is_reported(self):
+        self.context.client.events.get.side_effect = KeyError("not found")
+        with self.assertRaises(AssertionError) as ctx:
+            self.events.assert_attachments(["1"], expected_name_pattern="log")
+        message = str(ctx.exception)
+        assert "Event not found" in message
+        assert "Attachment not found" not in message
+        self.context.client.session.get.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
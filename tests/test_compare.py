@@ -1,7 +1,7 @@
 """Compare tests
 """
 import unittest
-from c8y_test_core.compare import compare_dataclass
+from c8y_test_core.compare import compare_dataclass, compile_matcher, RegexPattern
 import re
 
 
@@ -178,6 +178,54 @@ class TestDataclassComparison(unittest.TestCase):
             },
         )
 
+    def test_nested_dict_checks_all_keys(self):
+        mo = {
+            "c8y_Agent": {"name": "thin-edge.io"},
+            "type": "thin-edge.io",
+        }
+        # keys after a nested dict must also be compared
+        assert not compare_dataclass(
+            mo, {"c8y_Agent": {"name": "thin-edge.io"}, "type": "other"}
+        )
+        assert compare_dataclass(
+            mo, {"c8y_Agent": {"name": "thin-edge.io"}, "type": "thin-edge.io"}
+        )
+
+    def test_mismatches_include_full_path(self):
+        mo = {
+            "c8y_Agent": {"name": "thin-edge.io", "version": "1.0.0"},
+            "c8y_SupportedLogs": ["software-management"],
+        }
+        matcher = compile_matcher(
+            {
+                "c8y_Agent": {
+                    "name": "other",
+                    "version": re.compile(r"^2\."),
+                    "url": RegexPattern(".+"),
+                },
+                "c8y_SupportedLogs": ["shell"],
+                "c8y_Firmware": {"name": "core"},
+            }
+        )
+        mismatches = matcher.mismatches(mo)
+        self.assertEqual(
+            [mismatch.path for mismatch in mismatches],
+            [
+                "c8y_Agent.name",
+                "c8y_Agent.version",
+                "c8y_Agent.url",
+                "c8y_SupportedLogs[0]",
+                "c8y_Firmware",
+            ],
+        )
+        self.assertEqual(str(mismatches[-1]), "c8y_Firmware: missing")
+        assert not matcher.matches(mo)
+
+    def test_matchers_are_cached(self):
+        spec = {"c8y_Agent": {"version": re.compile("^1")}, "type": "thin-edge.io"}
+        self.assertIs(compile_matcher(spec), compile_matcher(dict(spec)))
+        self.assertIsNot(compile_matcher({"value": 1}), compile_matcher({"value": True}))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,105 @@
+"""Device pool tests
+"""
+import time
+import unittest
+from unittest.mock import Mock
+from c8y_api import CumulocityApi
+from c8y_test_core.device_pool import DevicePool
+
+
+def create_client():
+    client = Mock(CumulocityApi)
+    client.base_url = "https://example.com"
+    client.tenant_id = "t12345"
+    client.identity = Mock()
+    client.identity.get_id.side_effect = lambda external_id, external_type: (
+        f"mo_{external_id}"
+    )
+
+    def post_file(resource, body, **kwargs):
+        # one header line and one line per device
+        count = len(body.getvalue().splitlines()) - 1
+        return {"numberOfAll": count, "numberOfSuccessful": count}
+
+    client.post_file.side_effect = post_file
+    client.get.return_value = {"id": "1", "name": "device", "c8y_Hardware": {}}
+    return client
+
+
+class TestDevicePool(unittest.TestCase):
+    def test_lease_and_reuse(self):
+        client = create_client()
+        pool = DevicePool(client, size=2)
+        pool.refill()
+        assert client.post_file.call_count == 1
+
+        with pool.lease() as device:
+            assert device.device_id == f"mo_{device.external_id}"
+            assert device.credentials.username.startswith("t12345/device_pool_")
+            # fragment added by the test
+            client.get.return_value = {"id": "1", "c8y_Hardware": {}, "c8y_Test": {}}
+
+        client.delete.assert_any_call(
+            "/alarm/alarms", params={"source": device.device_id}
+        )
+        client.put.assert_called_once_with(
+            f"/inventory/managedObjects/{device.device_id}", json={"c8y_Test": None}
+        )
+
+        first = device
+        with pool.lease() as device:
+            pass
+        with pool.lease() as device:
+            pass
+        assert device is first
+
+        metrics = pool.metrics()
+        assert metrics.leases == 3
+        assert metrics.hit_rate == 1.0
+        assert metrics.resets == 3
+        assert metrics.registered == 2
+
+    def test_background_refill(self):
+        client = create_client()
+        with DevicePool(client, size=1, refill_interval=0.01, max_leases=1) as pool:
+            with pool.lease(timeout=5):
+                pass
+            # the device is deleted after its single lease, and replaced
+            deadline = time.monotonic() + 5
+            while pool.metrics().registered < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            metrics = pool.metrics()
+            assert metrics.discarded == 1
+            assert metrics.registered == 2
+        # the remaining device is deleted when the pool is closed
+        assert pool.metrics().discarded == 2
+
+    def test_reset_failure_discards_device(self):
+        client = create_client()
+        pool = DevicePool(client, size=1, reset=Mock(side_effect=ValueError("failed")))
+        with pool.lease():
+            pass
+        metrics = pool.metrics()
+        assert metrics.reset_failures == 1
+        assert metrics.discarded == 1
+        assert metrics.misses == 1
+
+    def test_lookup_failure_discards_device(self):
+        client = create_client()
+        client.identity.get_id.side_effect = KeyError("not found")
+        pool = DevicePool(client, size=1)
+        with self.assertRaises(KeyError):
+            pool.acquire(timeout=5)
+        assert pool.metrics().discarded == 1
+
+        # the discarded device is replaced, so the pool keeps its capacity
+        client.identity.get_id.side_effect = lambda external_id, external_type: (
+            f"mo_{external_id}"
+        )
+        with pool.lease(timeout=5) as device:
+            assert device.device_id == f"mo_{device.external_id}"
+        assert pool.metrics().registered == 2
+
+
+if __name__ == "__main__":
+    unittest.main()
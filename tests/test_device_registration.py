@@ -0,0 +1,178 @@
+"""Device registration tests
+"""
+import unittest
+from c8y_test_core.assert_device_registration import (
+    AssertDeviceRegistration,
+    DeviceRegistration,
+)
+from .fixtures import create_context
+
+
+def read_csv(call):
+    body = call.args[1].getvalue().decode("utf-8")
+    header, *rows = body.splitlines()
+    columns = [name.strip('"') for name in header.split("\t")]
+    return [dict(zip(columns, row.split("\t"))) for row in rows]
+
+
+class TestBulkRegistration(unittest.TestCase):
+    def setUp(self) -> None:
+        self.context = create_context()
+        self.context.client.base_url = "https://example.com"
+        self.context.client.tenant_id = "t12345"
+        self.registration = AssertDeviceRegistration(self.context)
+        return super().setUp()
+
+    def test_devices_are_chunked(self):
+        def post_file(*args, **kwargs):
+            rows = read_csv(self.context.client.post_file.call_args)
+            return {"numberOfAll": len(rows), "numberOfSuccessful": len(rows)}
+
+        self.context.client.post_file.side_effect = post_file
+        devices = (f"device{i:03d}" for i in range(5))
+        result = self.registration.bulk_register_devices_with_basic_auth(
+            devices, chunk_size=2
+        )
+
+        calls = self.context.client.post_file.call_args_list
+        assert len(calls) == 3
+        assert result.requests == 3
+        rows = read_csv(calls[0])
+        assert [row["ID"] for row in rows] == ['"device000"', '"device001"']
+        assert len(result.credentials) == 5
+        credentials = result.credentials["device004"]
+        assert credentials.username == "t12345/device_device004"
+        assert rows[0]["CREDENTIALS"] == f'"{result.credentials["device000"].password}"'
+
+    def test_failures_are_reported_per_device(self):
+        self.context.client.post_file.return_value = {
+            "numberOfAll": 2,
+            "numberOfSuccessful": 1,
+            "failedCreationList": [
+                {"deviceId": "device001", "failureReason": "Invalid password"}
+            ],
+        }
+        devices = ["device000", DeviceRegistration("device001", name="custom")]
+        with self.assertRaisesRegex(AssertionError, "device001: Invalid password"):
+            self.registration.bulk_register_devices_with_basic_auth(devices)
+
+        result = self.registration.bulk_register_devices_with_basic_auth(
+            devices, allow_failures=True
+        )
+        assert list(result.credentials) == ["device000"]
+        assert result.failures == {"device001": "Invalid password"}
+        rows = read_csv(self.context.client.post_file.call_args)
+        assert rows[1]["NAME"] == '"custom"'
+
+    def test_unlisted_devices_are_failures(self):
+        # only 1 of 2 devices were created, but no failure details are included
+        self.context.client.post_file.return_value = {
+            "numberOfAll": 2,
+            "numberOfSuccessful": 1,
+        }
+        result = self.registration.bulk_register_devices_with_basic_auth(
+            ["device000", "device001"], allow_failures=True
+        )
+        assert not result.credentials
+        assert sorted(result.failures) == ["device000", "device001"]
+        assert "numberOfSuccessful=1" in result.failures["device000"]
+
+    def test_ca_failed_devices_are_replaced(self):
+        self.context.client.post_file.side_effect = [
+            {
+                "numberOfAll": 2,
+                "numberOfSuccessful": 1,
+                "failedCreationList": [{"deviceId": "device001"}],
+            },
+            {"numberOfAll": 1, "numberOfSuccessful": 1},
+        ]
+        result = self.registration.bulk_register_devices_with_ca(
+            ["device000", "device001"]
+        )
+        self.context.client.delete.assert_called_once_with(
+            "/devicecontrol/bulkNewDeviceRequests/device001"
+        )
+        retry_rows = read_csv(self.context.client.post_file.call_args)
+        assert [row["ID"] for row in retry_rows] == ['"device001"']
+        assert sorted(result.credentials) == ["device000", "device001"]
+        assert not result.failures
+
+
+class TestRegistrationApproval(unittest.TestCase):
+    def setUp(self) -> None:
+        self.context = create_context()
+        self.registration = AssertDeviceRegistration(self.context)
+        return super().setUp()
+
+    def test_ready_devices_are_accepted_each_tick(self):
+        statuses = [
+            {"device01": "WAITING_FOR_CONNECTION", "device02": "PENDING_ACCEPTANCE"},
+            {"device01": "WAITING_FOR_CONNECTION"},
+            {"device01": "PENDING_ACCEPTANCE", "other": "PENDING_ACCEPTANCE"},
+        ]
+
+        def get(resource, params=None):
+            current = statuses.pop(0) if len(statuses) > 1 else statuses[0]
+            return {
+                "newDeviceRequests": [
+                    {"id": key, "status": value} for key, value in current.items()
+                ]
+            }
+
+        self.context.client.get.side_effect = get
+        accepted = self.registration.register_devices_with_basic_auth(
+            ["device01", "device02"], timeout=5, min_interval=0.01
+        )
+        assert accepted == ["device02", "device01"]
+        assert self.context.client.post.call_count == 2
+        accepted_ids = [
+            call.args[0] for call in self.context.client.put.call_args_list
+        ]
+        assert accepted_ids == [
+            "/devicecontrol/newDeviceRequests/device02",
+            "/devicecontrol/newDeviceRequests/device01",
+        ]
+        assert self.context.client.get.call_count == 3
+
+    def test_single_device_polls_its_request(self):
+        statuses = ["WAITING_FOR_CONNECTION", "PENDING_ACCEPTANCE"]
+        self.context.client.get.side_effect = lambda resource: {
+            "id": "device01",
+            "status": statuses.pop(0),
+        }
+        self.registration.register_with_basic_auth(
+            "device01", timeout=5, min_interval=0.01
+        )
+        requested = [call.args[0] for call in self.context.client.get.call_args_list]
+        assert requested == ["/devicecontrol/newDeviceRequests/device01"] * 2
+        self.context.client.put.assert_called_once()
+
+    def test_existing_request_is_used(self):
+        self.context.client.post.side_effect = ValueError(
+            "Unable to perform POST request. Status: 409 Response:\n..."
+        )
+        self.context.client.get.return_value = {"status": "PENDING_ACCEPTANCE"}
+        self.registration.register_with_basic_auth("device01", timeout=5)
+        self.context.client.put.assert_called_once()
+
+    def test_request_errors_are_raised(self):
+        self.context.client.post.side_effect = ValueError(
+            "Unable to perform POST request. Status: 403 Response:\n..."
+        )
+        with self.assertRaisesRegex(ValueError, "Status: 403"):
+            self.registration.register_with_basic_auth("device01", timeout=5)
+        with self.assertRaisesRegex(ValueError, "Status: 403"):
+            self.registration.register_devices_with_basic_auth(["device01"], timeout=5)
+        self.context.client.get.assert_not_called()
+
+    def test_timeout(self):
+        self.context.client.get.return_value = {"status": "WAITING_FOR_CONNECTION"}
+        with self.assertRaisesRegex(AssertionError, "Failed to register device"):
+            self.registration.register_with_basic_auth(
+                "device01", timeout=0.05, min_interval=0.01
+            )
+        self.context.client.put.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+"""Identity cache tests
+"""
+import unittest
+from unittest.mock import Mock, patch
+from c8y_test_core.identity_cache import IdentityCache, get_identity_cache
+from .fixtures import create_context
+
+
+class TestIdentityCache(unittest.TestCase):
+    def setUp(self) -> None:
+        self.client = create_context().client
+        self.client.identity = Mock()
+        self.client.identity.get_id.side_effect = lambda external_id, external_type: (
+            f"id_{external_id}"
+        )
+        self.client.inventory = Mock()
+        return super().setUp()
+
+    def test_cached_lookup(self):
+        cache = IdentityCache(self.client)
+        assert cache.get_id("device01") == "id_device01"
+        assert cache.get_id("device01") == "id_device01"
+        assert cache.get_id("device01", "c8y_Other") == "id_device01"
+        assert self.client.identity.get_id.call_count == 2
+        assert (cache.hits, cache.misses) == (1, 2)
+
+        cache.get_id("device01", refresh=True)
+        assert self.client.identity.get_id.call_count == 3
+
+    def test_missing_identity_is_not_cached(self):
+        cache = IdentityCache(self.client)
+        self.client.identity.get_id.side_effect = KeyError("not found")
+        with self.assertRaises(KeyError):
+            cache.get_id("device01")
+        assert len(cache) == 0
+
+    @patch("c8y_test_core.identity_cache.time.monotonic")
+    def test_ttl_and_max_size(self, monotonic):
+        monotonic.return_value = 100
+        cache = IdentityCache(self.client, ttl=10, max_size=2)
+        cache.get_id("device01")
+        cache.get_id("device02")
+        cache.get_id("device01")
+        cache.get_id("device03")  # evicts device02 (least recently used)
+        assert self.client.identity.get_id.call_count == 3
+        cache.get_id("device02")
+        assert self.client.identity.get_id.call_count == 4
+
+        monotonic.return_value = 111
+        cache.get_id("device02")
+        assert self.client.identity.get_id.call_count == 5
+
+    def test_invalidate(self):
+        cache = IdentityCache(self.client)
+        cache.put("device01", "c8y_Serial", "101")
+        cache.put("device01", "c8y_Other", "101")
+        cache.put("device02", "c8y_Serial", "102")
+        cache.invalidate(mo_id="101")
+        assert len(cache) == 1
+        cache.invalidate("device02")
+        assert len(cache) == 0
+
+    def test_stale_managed_object_is_refreshed(self):
+        cache = IdentityCache(self.client)
+        cache.put("device01", "c8y_Serial", "stale")
+
+        def get(mo_id):
+            if mo_id == "stale":
+                raise KeyError("not found")
+            return mo_id
+
+        self.client.inventory.get.side_effect = get
+        assert cache.get_object("device01") == "id_device01"
+        assert cache.get_id("device01") == "id_device01"
+
+    def test_call_with_id_only_retries_cached_ids(self):
+        cache = IdentityCache(self.client)
+        func = Mock(side_effect=KeyError("not found"))
+        with self.assertRaises(KeyError):
+            cache.call_with_id("device01", "c8y_Serial", func)
+        assert func.call_count == 1
+
+        func.reset_mock()
+        cache.put("device01", "c8y_Serial", "stale")
+        with self.assertRaises(KeyError):
+            cache.call_with_id("device01", "c8y_Serial", func)
+        assert [call.args[0] for call in func.call_args_list] == [
+            "stale",
+            "id_device01",
+        ]
+
+    def test_shared_per_client(self):
+        assert get_identity_cache(self.client) is get_identity_cache(self.client)
+        assert get_identity_cache(self.client) is not get_identity_cache(
+            create_context().client
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
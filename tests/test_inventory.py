@@ -0,0 +1,227 @@
+"""Inventory tests
+"""
+import unittest
+import urllib.parse
+from unittest.mock import Mock, patch
+from c8y_api.model import Inventory
+from c8y_test_core.assert_inventory import AssertInventory, InventoryNotFound
+from c8y_test_core.identity_cache import get_identity_cache
+from .fixtures import create_context
+
+
+class TestBulkTeardown(unittest.TestCase):
+    def setUp(self) -> None:
+        self.context = create_context()
+        self.context.client.tenant_id = "t12345"
+        self.context.client.identity = Mock()
+        self.inventory = AssertInventory(self.context)
+        return super().setUp()
+
+    def test_delete_by_external_ids(self):
+        ids = {"device01": "101", "device02": "102"}
+
+        def get_id(external_id, external_type):
+            return ids[external_id]
+
+        def delete(resource, params=None):
+            if resource == "/user/t12345/users/device_device02":
+                raise KeyError("not found")
+            if resource == "/inventory/managedObjects/102":
+                raise KeyError("not found")
+
+        self.context.client.identity.get_id.side_effect = get_id
+        self.context.client.delete.side_effect = delete
+
+        report = self.inventory.delete_devices_and_users(
+            ["device01", "device02", "device03"]
+        )
+        assert sorted(report.removed) == ["device01", "device03"]
+        assert report.already_removed == ["device02"]
+        assert not report.failed
+        self.context.client.delete.assert_any_call(
+            "/inventory/managedObjects/101",
+            params={"cascade": True, "withDeviceUser": False},
+        )
+
+    @patch("c8y_test_core.assert_inventory.time.sleep")
+    def test_retry_when_throttled(self, sleep):
+        self.context.client.identity.get_id.return_value = "101"
+        self.context.client.delete.side_effect = [
+            ValueError("Unable to perform DELETE request. Status: 429 Response:\n"),
+            None,
+            None,
+            ValueError("Unable to perform DELETE request. Status: 403 Response:\n"),
+        ]
+        report = self.inventory.delete_devices_and_users(["device01"])
+        assert report.removed == ["device01"]
+        sleep.assert_called_once_with(0.5)
+
+        with self.assertRaisesRegex(AssertionError, "Status: 403"):
+            self.inventory.delete_devices_and_users(["device02"], max_workers=1)
+
+    def test_delete_by_query(self):
+        self.context.client.inventory = Mock()
+        self.context.client.inventory.object_name = "managedObjects"
+        self.context.client.inventory._build_base_query.return_value = "/inventory"
+        self.context.client.inventory.c8y = self.context.client
+        self.context.client.get.side_effect = [
+            {
+                "managedObjects": [
+                    {"id": "101", "owner": "device_pool_1"},
+                    {"id": "102", "owner": "admin"},
+                ]
+            },
+            {"managedObjects": []},
+        ]
+        report = self.inventory.delete_devices_and_users(query="name eq 'pool_*'")
+        assert sorted(report.removed) == ["101", "102"]
+        self.context.client.inventory._build_base_query.assert_called_once_with(
+            query="name eq 'pool_*'", page_size=2000
+        )
+        deleted = [call.args[0] for call in self.context.client.delete.call_args_list]
+        assert "/user/t12345/users/device_pool_1" in deleted
+        assert "/user/t12345/users/admin" not in deleted
+        self.context.client.identity.get_id.assert_not_called()
+
+
+class TestBulkManagedObjects(unittest.TestCase):
+    def setUp(self) -> None:
+        self.context = create_context()
+        self.existing = {
+            str(i): {"id": str(i), "c8y_Agent": {}} for i in range(1, 251) if i != 42
+        }
+        self.existing["7"] = {"id": "7"}
+        self.context.client.inventory = Inventory(self.context.client)
+        self.context.client.get.side_effect = self.get
+        self.inventory = AssertInventory(self.context)
+        return super().setUp()
+
+    def get(self, resource):
+        path, _, query = resource.partition("?")
+        assert path == "/inventory/managedObjects"
+        params = dict(urllib.parse.parse_qsl(query))
+        assert params["withChildren"] == "false"
+        items = list(self.existing.values())
+        if "ids" in params:
+            items = [item for item in items if item["id"] in params["ids"].split(",")]
+        if params.get("query") == "has(c8y_Agent)":
+            items = [item for item in items if "c8y_Agent" in item]
+        page_size = int(params["pageSize"])
+        start = (int(params["currentPage"]) - 1) * page_size
+        return {"managedObjects": items[start : start + page_size]}
+
+    def test_exists_in_chunks(self):
+        ids = [str(i) for i in range(1, 251) if i != 42]
+        result = self.inventory.assert_exists_many(ids, chunk_size=100)
+        self.assertEqual(list(result), ids)
+        self.assertEqual(self.context.client.get.call_count, 3)
+
+        with self.assertRaisesRegex(AssertionError, r"missing=\['42'\]"):
+            self.inventory.assert_exists_many(["1", "42"])
+
+        self.inventory.assert_not_exists_many(["42", "300"])
+        with self.assertRaisesRegex(AssertionError, r"existing=\['1'\]"):
+            self.inventory.assert_not_exists_many(["1", "42"])
+
+    def test_query(self):
+        result = self.inventory.assert_exists_many(query="has(c8y_Agent)")
+        self.assertEqual(len(result), 248)
+        # one page of results and one empty page
+        self.assertEqual(self.context.client.get.call_count, 2)
+        assert "pageSize=2000" in self.context.client.get.call_args.args[0]
+
+        # ids are sent with the query
+        result = self.inventory.get_managed_objects(["1", "7"], query="has(c8y_Agent)")
+        self.assertEqual(result, {"1": {"id": "1", "c8y_Agent": {}}, "7": None})
+        assert "ids=1%2C7" in self.context.client.get.call_args.args[0]
+        assert "query=has%28c8y_Agent%29" in self.context.client.get.call_args.args[0]
+
+    def test_contains_fragments(self):
+        self.inventory.assert_contains_fragments_many(["c8y_Agent"], ["1", "2", "3"])
+        with self.assertRaisesRegex(
+            AssertionError, r"7: missing=\['c8y_Agent'\]\n  42: not found"
+        ):
+            self.inventory.assert_contains_fragments_many(
+                ["c8y_Agent"], ["1", "7", "42"]
+            )
+
+
+class TestRelationship(unittest.TestCase):
+    def setUp(self) -> None:
+        self.context = create_context()
+        self.context.device_id = "1"
+        self.context.client.identity = Mock()
+        self.context.client.identity.get_id.return_value = "2"
+        self.inventory = AssertInventory(self.context)
+        return super().setUp()
+
+    def test_missing_reference_does_not_refresh_the_child(self):
+        get_identity_cache(self.context.client).put("child01", "c8y_Serial", "2")
+
+        def get(resource, params=None):
+            if resource == "/inventory/managedObjects/2":
+                return {"id": "2"}
+            raise KeyError("not found")
+
+        self.context.client.get.side_effect = get
+        with self.assertRaises(InventoryNotFound):
+            self.inventory.assert_relationship("child01", timeout=0.01, wait=0.01)
+        self.context.client.identity.get_id.assert_not_called()
+
+    def test_deleted_child_is_looked_up_again(self):
+        get_identity_cache(self.context.client).put("child01", "c8y_Serial", "stale")
+
+        def get(resource, params=None):
+            if resource == "/inventory/managedObjects/1/childDevices/2":
+                return {"managedObject": {"id": "2"}}
+            raise KeyError("not found")
+
+        self.context.client.get.side_effect = get
+        assert self.inventory.assert_relationship("child01") == {
+            "managedObject": {"id": "2"}
+        }
+        self.context.client.identity.get_id.assert_called_once()
+
+
+class TestChildren(unittest.TestCase):
+    def setUp(self) -> None:
+        self.context = create_context("gateway01")
+        self.total = 4500
+        self.context.client.get.side_effect = self.get
+        self.inventory = AssertInventory(self.context)
+        return super().setUp()
+
+    def get(self, resource, params=None):
+        assert resource == "/inventory/managedObjects/gateway01/childDevices"
+        if params.get("withTotalPages"):
+            return {"references": [], "statistics": {"totalPages": self.total}}
+        start = (params["currentPage"] - 1) * params["pageSize"]
+        end = min(start + params["pageSize"], self.total)
+        return {
+            "references": [
+                {"managedObject": {"id": str(i), "name": f"child{i}", "self": ""}}
+                for i in range(start, end)
+            ]
+        }
+
+    def test_iter_children_pages(self):
+        children = list(self.inventory.iter_children(fields=["id", "name"]))
+        self.assertEqual(len(children), 4500)
+        self.assertEqual(children[-1], ("4499", "child4499"))
+        self.assertEqual(children[-1].name, "child4499")
+        self.assertEqual(self.context.client.get.call_count, 3)
+
+        references = self.inventory.assert_child_device_count(min_count=4500)
+        self.assertEqual(len(references), 4500)
+
+    def test_count_from_totals(self):
+        self.assertEqual(self.inventory.assert_child_count(min_count=4500), 4500)
+        self.assertEqual(self.context.client.get.call_count, 1)
+        with self.assertRaisesRegex(AssertionError, "got=4500"):
+            self.inventory.assert_child_count(max_count=10)
+        with self.assertRaisesRegex(AssertionError, "Invalid child type"):
+            self.inventory.count_children("children")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+"""Projected inventory read tests
+"""
+import json
+import unittest
+from unittest.mock import Mock
+from c8y_test_core.assert_inventory import AssertInventory
+from c8y_test_core.inventory_projection import get_read_stats, measure_savings
+from .fixtures import create_context
+
+
+MANAGED_OBJECT = {
+    "id": "12345",
+    "name": "device01",
+    "type": "thin-edge.io",
+    "c8y_Agent": {"name": "thin-edge.io"},
+    "c8y_Firmware": {"name": "core", "version": "1.0.0"},
+    "c8y_SoftwareList": [
+        {"name": f"package{i}", "version": "1.0"} for i in range(100)
+    ],
+}
+
+CHILDREN = {
+    "childDevices": {
+        "references": [
+            {"managedObject": {"id": str(i), "name": f"child{i}"}} for i in range(100)
+        ]
+    }
+}
+
+
+def create_response(params=None, status_code=200):
+    data = dict(MANAGED_OBJECT)
+    if params and params.get("withChildren") == "true":
+        data.update(CHILDREN)
+    response = Mock()
+    response.status_code = status_code
+    response.content = json.dumps(data).encode()
+    response.text = ""
+    return response
+
+
+class TestProjectedReads(unittest.TestCase):
+    def setUp(self) -> None:
+        self.context = create_context("12345")
+        self.context.projected_reads = True
+        self.context.client.base_url = "https://example.com"
+        self.context.client.session = Mock()
+        self.context.client.session.get.side_effect = lambda url, params: (
+            create_response(params)
+        )
+        self.inventory = AssertInventory(self.context)
+        return super().setUp()
+
+    def test_only_requested_fragments(self):
+        mo = self.inventory.assert_contains_fragment_values(
+            {"c8y_Firmware": {"name": "core"}}
+        )
+        self.assertEqual(sorted(mo.to_json().keys()), ["c8y_Firmware", "name", "type"])
+        self.context.client.session.get.assert_called_once_with(
+            "https://example.com/inventory/managedObjects/12345",
+            params={"withChildren": "false"},
+        )
+        self.context.client.inventory.get.assert_not_called()
+
+        stats = get_read_stats(self.context.client)
+        self.assertEqual(stats.requests, 1)
+        self.assertEqual(stats.bytes, len(create_response().content))
+
+    def test_not_found(self):
+        self.context.client.session.get.side_effect = lambda url, params: (
+            create_response(params, status_code=404)
+        )
+        with self.assertRaises(KeyError):
+            self.inventory._get_managed_object("c8y_Agent")
+
+    def test_measure_savings(self):
+        savings = measure_savings(self.context.client, "12345")
+        full = json.dumps({**MANAGED_OBJECT, **CHILDREN})
+        self.assertEqual(savings.bytes_saved, len(full) - len(json.dumps(MANAGED_OBJECT)))
+
+
+if __name__ == "__main__":
+    unittest.main()
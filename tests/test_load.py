@@ -0,0 +1,89 @@
+"""Load generator tests
+"""
+import threading
+import time
+import unittest
+from unittest.mock import Mock
+from c8y_api import CumulocityApi
+from c8y_test_core.load import LoadGenerator, TelemetryKind
+from c8y_test_core.task import BackgroundTask
+
+
+class TestLoadGenerator(unittest.TestCase):
+    def test_measurements_are_sent_in_bulk(self):
+        client = Mock(CumulocityApi)
+        generator = LoadGenerator(
+            client,
+            TelemetryKind.MEASUREMENTS,
+            devices=["1", "2", "3"],
+            rate=1000,
+            count=250,
+            batch_size=100,
+        )
+        generator.start()
+        stats = generator.result(timeout=5)
+
+        assert client.post.call_count == 3
+        assert stats.requests == 3
+        assert stats.items == 250
+        assert stats.errors == 0
+        payload = client.post.call_args_list[0].kwargs["json"]["measurements"]
+        assert [item["source"]["id"] for item in payload[:4]] == ["1", "2", "3", "1"]
+        assert (
+            client.post.call_args_list[0].kwargs["content_type"]
+            == CumulocityApi.CONTENT_MEASUREMENT_COLLECTION
+        )
+
+    def test_open_loop_pacing(self):
+        client = Mock(CumulocityApi)
+        lock = threading.Lock()
+        active = []
+
+        def slow_post(*args, **kwargs):
+            with lock:
+                active.append(time.monotonic())
+            time.sleep(0.2)
+
+        client.post.side_effect = slow_post
+        generator = LoadGenerator(
+            client,
+            TelemetryKind.EVENTS,
+            devices=["1"],
+            rate=100,
+            count=10,
+            max_workers=10,
+        )
+        generator.start()
+        stats = generator.result(timeout=5)
+
+        assert stats.items == 10
+        # requests are sent every 10ms (90ms in total), even though each one
+        # takes 200ms. Sending them one after the other would take >= 1.8s
+        assert active[-1] - active[0] < 0.9
+        assert stats.service_time["p50"] >= 0.2
+
+    def test_errors_are_counted(self):
+        client = Mock(CumulocityApi)
+        client.post.side_effect = SyntaxError("server error")
+        generator = LoadGenerator(
+            client, TelemetryKind.ALARMS, devices=["1"], rate=1000, count=5
+        )
+        generator.start()
+        stats = generator.result(timeout=5)
+        assert stats.errors == 5
+        assert stats.items == 0
+
+    def test_background_task_stops_load(self):
+        client = Mock(CumulocityApi)
+        task = BackgroundTask(client)
+        generator = task.start_load(
+            TelemetryKind.EVENTS, devices=["1"], rate=100, duration=60
+        )
+        time.sleep(0.05)
+        task.stop()
+        assert not generator.is_alive()
+        assert 0 < generator.stats().requests < 100
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,366 @@
+"""Paging tests
+"""
+import threading
+import unittest
+from unittest.mock import patch
+from datetime import datetime, timedelta, timezone
+from c8y_api.model import Alarm, Event, Measurement
+from c8y_test_core.assert_alarms import Alarms
+from c8y_test_core.assert_events import Events
+from c8y_test_core.assert_measurements import AssertMeasurements
+from c8y_test_core.errors import FinalAssertionError
+from c8y_test_core.paging import (
+    LazySequence,
+    QueryCursor,
+    fetch_sharded,
+    fetch_until_decided,
+)
+from .fixtures import create_context
+
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def create_measurement(index: int) -> Measurement:
+    measurement = Measurement(
+        type="c8y_Temperature",
+        source="unittest001",
+        time=START + timedelta(seconds=index),
+        c8y_Temperature={"T": {"value": index}},
+    )
+    measurement.id = str(index)
+    return measurement
+
+
+class CountingIterator:
+    def __init__(self, items):
+        self._items = iter(items)
+        self.consumed = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        item = next(self._items)
+        self.consumed += 1
+        return item
+
+
+class TestLazySequence(unittest.TestCase):
+    def test_items_are_read_on_demand(self):
+        source = CountingIterator(range(10))
+        items = LazySequence(source)
+        assert source.consumed == 0
+
+        assert items[2] == 2
+        assert source.consumed == 3
+        assert not items.exhausted
+
+        assert len(items) == 10
+        assert items.exhausted
+        assert items == list(range(10))
+
+    def test_iterate_resumes_source(self):
+        items = LazySequence(iter(range(5)))
+        items.prefetch(2)
+        assert list(items) == [0, 1, 2, 3, 4]
+        assert list(items) == [0, 1, 2, 3, 4]
+
+    def test_sort_is_deferred(self):
+        source = CountingIterator([3, 1, 2])
+        items = LazySequence(source)
+        items.sort(reverse=True)
+        assert source.consumed == 0
+        assert items[0] == 3
+        assert items == [3, 2, 1]
+
+
+    def test_repr_does_not_read_remaining_items(self):
+        source = CountingIterator(range(10))
+        items = LazySequence(source)
+        items.prefetch(2)
+        assert repr(items) == "[0, 1, ... more not fetched]"
+        assert f"{items}" == "[0, 1, ... more not fetched]"
+        assert source.consumed == 2
+        items.materialize()
+        assert repr(items) == repr(list(range(10)))
+
+    def test_concatenate_with_list(self):
+        items = LazySequence(iter(range(3)))
+        assert items + [3] == [0, 1, 2, 3]
+        assert [-1] + items == [-1, 0, 1, 2]
+
+class TestFetchUntilDecided(unittest.TestCase):
+    def test_stop_at_min_count(self):
+        source = CountingIterator(range(100))
+        items = LazySequence(source)
+        assert fetch_until_decided(items, min_count=5) == 5
+        assert source.consumed == 5
+
+    def test_stop_when_max_count_is_exceeded(self):
+        source = CountingIterator(range(100))
+        items = LazySequence(source)
+        assert fetch_until_decided(items, min_count=1, max_count=10) == 11
+        assert source.consumed == 11
+
+    def test_read_all_when_under_max_count(self):
+        items = LazySequence(iter(range(3)))
+        assert fetch_until_decided(items, min_count=1, max_count=10) == 3
+        assert items.exhausted
+
+
+class TestEventCount(unittest.TestCase):
+    def setUp(self) -> None:
+        self.context = create_context()
+        self.events = Events(self.context)
+        return super().setUp()
+
+    def test_early_termination(self):
+        source = CountingIterator([{"id": str(i)} for i in range(50)])
+        self.context.client.events.select.return_value = source
+
+        result = self.events.assert_count(min_matches=2)
+        assert source.consumed == 2
+        assert len(result) == 50
+
+    def test_max_count_exceeded(self):
+        source = CountingIterator([{"id": str(i)} for i in range(50)])
+        self.context.client.events.select.return_value = source
+
+        with self.assertRaisesRegex(AssertionError, "got=>=6"):
+            self.events.assert_count(min_matches=1, max_matches=5)
+        assert source.consumed == 6
+
+
+class TestQueryCursor(unittest.TestCase):
+    def test_merge_deduplicates_items(self):
+        cursor = QueryCursor(lambda item: item.datetime, overlap=2)
+        assert cursor.after() is None
+
+        assert cursor.merge([create_measurement(i) for i in range(5)]) == 5
+        assert cursor.newest == START + timedelta(seconds=4)
+        assert cursor.after() == START + timedelta(seconds=2)
+
+        # overlapping poll
+        assert cursor.merge([create_measurement(i) for i in range(2, 8)]) == 3
+        assert len(cursor) == 8
+        assert [item.id for item in cursor.items()] == [str(i) for i in range(8)]
+
+    def test_user_after_is_used_when_newer(self):
+        cursor = QueryCursor(lambda item: item.datetime, overlap=0)
+        cursor.merge([create_measurement(0)])
+        after = "2024-01-02T00:00:00Z"
+        assert cursor.after(after) == after
+
+
+class TestIncrementalMeasurements(unittest.TestCase):
+    def setUp(self) -> None:
+        self.context = create_context()
+        self.measurements = AssertMeasurements(self.context)
+        return super().setUp()
+
+    def test_only_new_measurements_are_fetched(self):
+        select = self.context.client.measurements.select
+        select.return_value = [create_measurement(i) for i in range(3)]
+
+        with self.assertRaises(AssertionError):
+            self.measurements.assert_count(min_count=5, incremental=True)
+        assert select.call_args.kwargs["after"] is None
+
+        select.return_value = [create_measurement(i) for i in range(2, 6)]
+        result = self.measurements.assert_count(
+            min_count=5, incremental=True, sort_newest=True
+        )
+        assert select.call_args.kwargs["after"] == START + timedelta(seconds=1)
+        assert [item.id for item in result] == ["5", "4", "3", "2", "1", "0"]
+
+        self.measurements.reset_cursors()
+        self.measurements.assert_count(min_count=1, incremental=True)
+        assert select.call_args.kwargs["after"] is None
+
+    @patch("c8y_test_core.assert_measurements.datetime")
+    def test_measurements_outside_of_max_age_are_removed(self, mock_datetime):
+        select = self.context.client.measurements.select
+        max_age = timedelta(seconds=10)
+        mock_datetime.now.return_value = START + timedelta(seconds=12)
+        select.return_value = [create_measurement(i) for i in range(2, 10)]
+        self.measurements.assert_count(min_count=8, incremental=True, max_age=max_age)
+
+        # the window moved on by 5s, so measurements 2-6 are too old now
+        mock_datetime.now.return_value = START + timedelta(seconds=17)
+        select.return_value = [create_measurement(i) for i in range(9, 12)]
+        with self.assertRaises(AssertionError):
+            self.measurements.assert_count(
+                max_count=4, incremental=True, max_age=max_age
+            )
+        assert select.call_args.kwargs["after"] == START + timedelta(seconds=8)
+        result = self.measurements.assert_count(
+            max_count=5, incremental=True, max_age=max_age, sort_newest=True
+        )
+        assert [item.id for item in result] == ["11", "10", "9", "8", "7"]
+
+
+def create_event(index: int, text: str = "hello") -> Event:
+    event = Event(
+        type="c8y_Test",
+        source="unittest001",
+        time=START + timedelta(seconds=index),
+        text=text,
+    )
+    event.id = str(index)
+    event.creation_time = (START + timedelta(seconds=index)).isoformat()
+    return event
+
+
+class TestIncrementalEvents(unittest.TestCase):
+    def setUp(self) -> None:
+        self.context = create_context()
+        self.events = Events(self.context)
+        return super().setUp()
+
+    def test_text_is_only_matched_on_new_events(self):
+        select = self.context.client.events.select
+        select.return_value = [create_event(1), create_event(0, "other")]
+
+        with self.assertRaises(AssertionError):
+            self.events.assert_count(
+                "hello", min_matches=2, incremental=True, type="c8y_Test"
+            )
+        assert select.call_args.kwargs["created_after"] is None
+        assert select.call_args.kwargs["type"] == "c8y_Test"
+
+        # overlapping poll, only event 2 is new
+        select.return_value = [create_event(2), create_event(1)]
+        result = self.events.assert_count(
+            "hello", min_matches=2, incremental=True, type="c8y_Test"
+        )
+        assert select.call_args.kwargs["created_after"] == START
+        assert [item.id for item in result] == ["2", "1"]
+
+    def test_incremental_with_shards_is_rejected(self):
+        with self.assertRaises(FinalAssertionError):
+            self.events.assert_count(incremental=True, shards=4, max_age="1h")
+        with self.assertRaises(FinalAssertionError):
+            Alarms(self.context).assert_count(incremental=True, shards=4, max_age="1h")
+        self.context.client.events.select.assert_not_called()
+        self.context.client.alarms.select.assert_not_called()
+
+
+def create_alarm(
+    index: int, updated: int, status: str = "ACTIVE", text: str = "hello"
+) -> Alarm:
+    alarm = Alarm(
+        type="c8y_Test",
+        source="unittest001",
+        time=START + timedelta(seconds=index),
+        text=text,
+        status=status,
+        severity="MAJOR",
+    )
+    alarm.id = str(index)
+    alarm.updated_time = (START + timedelta(seconds=updated)).isoformat()
+    return alarm
+
+
+class TestIncrementalAlarms(unittest.TestCase):
+    def setUp(self) -> None:
+        self.context = create_context()
+        self.alarms = Alarms(self.context)
+        return super().setUp()
+
+    def test_status_is_checked_by_the_client(self):
+        select = self.context.client.alarms.select
+        select.return_value = [
+            create_alarm(1, 1),
+            create_alarm(2, 2, status="CLEARED"),
+        ]
+        result = self.alarms.assert_count(
+            incremental=True, status="ACTIVE", severity="MAJOR", type="c8y_Test"
+        )
+        assert [item.id for item in result] == ["1"]
+        assert "status" not in select.call_args.kwargs
+        assert "severity" not in select.call_args.kwargs
+        assert select.call_args.kwargs["type"] == "c8y_Test"
+        assert select.call_args.kwargs["updated_after"] is None
+
+    def test_cleared_alarm_is_removed(self):
+        select = self.context.client.alarms.select
+        select.return_value = [create_alarm(1, 1)]
+        with self.assertRaises(AssertionError):
+            self.alarms.assert_count(
+                min_matches=0, max_matches=0, incremental=True, status="ACTIVE"
+            )
+
+        # the alarm was cleared, so it is returned again (lastUpdated changed)
+        select.return_value = [create_alarm(1, 5, status="CLEARED")]
+        result = self.alarms.assert_count(
+            min_matches=0, max_matches=0, incremental=True, status="ACTIVE"
+        )
+        assert select.call_args.kwargs["updated_after"] == START
+        assert not list(result)
+
+        # and it is counted again if it is reactivated
+        select.return_value = [create_alarm(1, 9)]
+        result = self.alarms.assert_count(incremental=True, status="ACTIVE")
+        assert [item.id for item in result] == ["1"]
+
+    def test_changed_text_is_matched_again(self):
+        select = self.context.client.alarms.select
+        select.return_value = [create_alarm(1, 1, text="other")]
+        with self.assertRaises(AssertionError):
+            self.alarms.assert_count("hello", incremental=True)
+
+        select.return_value = [create_alarm(1, 3)]
+        result = self.alarms.assert_count("hello", incremental=True)
+        assert [item.id for item in result] == ["1"]
+
+
+class FakeSelect:
+    """Fake select function which filters by time (after inclusive, before inclusive)"""
+
+    def __init__(self, items, reverse: bool = False):
+        self.items = items
+        self.reverse = reverse
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, after, before, page_size=1000, **kwargs):
+        with self._lock:
+            self.calls.append((after, before))
+        matches = [item for item in self.items if after <= item.datetime <= before]
+        return iter(reversed(matches) if self.reverse else matches)
+
+
+class TestFetchSharded(unittest.TestCase):
+    def test_merge_in_time_order(self):
+        items = [create_measurement(i) for i in range(100)]
+        select = FakeSelect(items)
+        result = fetch_sharded(
+            select,
+            START,
+            START + timedelta(seconds=99),
+            time_func=lambda item: item.datetime,
+            shards=4,
+        )
+        assert [item.id for item in result] == [str(i) for i in range(100)]
+        assert len(select.calls) == 4
+
+    def test_large_shards_are_split(self):
+        for reverse in (False, True):
+            items = [create_measurement(i) for i in range(100)]
+            select = FakeSelect(items, reverse=reverse)
+            result = fetch_sharded(
+                select,
+                START,
+                START + timedelta(seconds=99),
+                time_func=lambda item: item.datetime,
+                shards=2,
+                max_shard_pages=2,
+                page_size=10,
+            )
+            assert [item.id for item in result] == [str(i) for i in range(100)]
+            assert len(select.calls) > 2
+
+
+if __name__ == "__main__":
+    unittest.main()
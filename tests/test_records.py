@@ -0,0 +1,99 @@
+"""Raw and projected record tests
+"""
+import unittest
+from unittest.mock import Mock
+from c8y_api.model import Events as EventsResource
+from c8y_test_core.assert_events import Events
+from c8y_test_core.assert_measurements import AssertMeasurements
+from c8y_test_core.records import ensure_fields, record_type, select_records
+from .fixtures import create_context
+
+
+def create_resource(object_name, *pages):
+    resource = Mock()
+    resource.object_name = object_name
+    resource._build_base_query.return_value = f"/{object_name}?pageSize=2"
+    resource.c8y.get.side_effect = [{object_name: page} for page in pages] + [
+        {object_name: []}
+    ]
+    return resource
+
+
+class TestSelectRecords(unittest.TestCase):
+    def test_raw_items_are_paged(self):
+        resource = create_resource("events", [{"id": "1"}, {"id": "2"}], [{"id": "3"}])
+        items = list(select_records(resource, type="c8y_Test"))
+        assert items == [{"id": "1"}, {"id": "2"}, {"id": "3"}]
+        resource._build_base_query.assert_called_once_with(
+            type="c8y_Test", page_size=1000
+        )
+        assert resource.c8y.get.call_args.args[0] == "/events?pageSize=2&currentPage=3"
+
+    def test_query_url_includes_page_size(self):
+        c8y = Mock()
+        c8y.get.side_effect = [{"events": [{"id": "1"}]}, {"events": []}]
+        items = list(select_records(EventsResource(c8y), source="12345"))
+        assert items == [{"id": "1"}]
+        assert c8y.get.call_args_list[0].args[0] == (
+            "/event/events?source=12345&pageSize=1000&currentPage=1"
+        )
+
+        c8y.get.side_effect = [{"events": []}]
+        list(select_records(EventsResource(c8y), source="12345", page_size=10))
+        assert "pageSize=10&" in c8y.get.call_args.args[0]
+
+    def test_projection(self):
+        resource = create_resource(
+            "events", [{"id": "1", "text": "hello", "source": {"id": "10"}}]
+        )
+        (item,) = select_records(resource, fields=["id", "source.id", "missing"])
+        assert item.id == "1"
+        assert item.source_id == "10"
+        assert item.missing is None
+        assert isinstance(item, record_type(("id", "source.id", "missing")))
+
+    def test_limit_stops_paging(self):
+        resource = create_resource("events", [{"id": "1"}, {"id": "2"}], [{"id": "3"}])
+        assert len(list(select_records(resource, limit=2))) == 2
+        assert resource.c8y.get.call_count == 1
+
+    def test_ensure_fields(self):
+        assert ensure_fields(None, "id") is None
+        assert ensure_fields(["text", "id"], "id", "time") == ("time", "text", "id")
+
+
+class TestAssertionRecords(unittest.TestCase):
+    def setUp(self) -> None:
+        self.context = create_context()
+        return super().setUp()
+
+    def test_event_count_with_fields(self):
+        self.context.client.events = create_resource(
+            "events",
+            [
+                {"id": "1", "time": "2024-01-01T00:00:00Z", "text": "hello world"},
+                {"id": "2", "time": "2024-01-01T00:00:01Z", "text": "other"},
+            ],
+        )
+        result = Events(self.context).assert_count(
+            "hello", min_matches=1, max_matches=1, fields=["type"]
+        )
+        assert [(item.id, item.text) for item in result] == [("1", "hello world")]
+        self.context.client.events.select.assert_not_called()
+
+    def test_measurement_count_raw(self):
+        self.context.client.measurements = create_resource(
+            "measurements",
+            [
+                {"id": "2", "time": "2024-01-01T00:00:01Z"},
+                {"id": "1", "time": "2024-01-01T00:00:00Z"},
+            ],
+        )
+        result = AssertMeasurements(self.context).assert_count(
+            min_count=2, raw=True, incremental=True
+        )
+        assert [item["id"] for item in result] == ["1", "2"]
+
+
+if __name__ == "__main__":
+    unittest.main()
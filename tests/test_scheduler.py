@@ -0,0 +1,97 @@
+"""Scheduler tests
+"""
+import threading
+import time
+import unittest
+from unittest.mock import Mock
+from c8y_api import CumulocityApi
+from c8y_test_core.scheduler import Scheduler
+from c8y_test_core.task import BackgroundTask
+
+
+class TestScheduler(unittest.TestCase):
+    def setUp(self) -> None:
+        self.scheduler = Scheduler(max_workers=4)
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        self.scheduler.stop()
+        return super().tearDown()
+
+    def test_many_tasks_share_the_workers(self):
+        threads_before = threading.active_count()
+        tasks = [
+            self.scheduler.schedule(lambda i=i: i, interval=0.01, count=5)
+            for i in range(200)
+        ]
+        # scheduler thread + worker pool, regardless of the number of tasks
+        assert threading.active_count() - threads_before <= 5
+
+        deadline = time.monotonic() + 5
+        while not all(task.done for task in tasks) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert [task.runs for task in tasks] == [5] * 200
+        assert tasks[7].last_result == 7
+        assert self.scheduler.stats()[tasks[0].name]["lateness"]["count"] == 5
+
+    def test_errors_are_collected(self):
+        def fail():
+            raise RuntimeError("failed")
+
+        task = self.scheduler.schedule(fail, interval=0.01, count=3, name="fail")
+        deadline = time.monotonic() + 5
+        while not task.done and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert task.runs == 3
+        assert task.error_count == 3
+        assert isinstance(task.errors[0], RuntimeError)
+
+    def test_runs_do_not_overlap(self):
+        active = []
+        overlaps = []
+
+        def slow():
+            if active:
+                overlaps.append(True)
+            active.append(True)
+            time.sleep(0.03)
+            active.pop()
+
+        task = self.scheduler.schedule(slow, interval=0.01, count=3)
+        deadline = time.monotonic() + 5
+        while not task.done and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert task.runs == 3
+        assert not overlaps
+
+    def test_cancel(self):
+        task = self.scheduler.schedule(lambda: None, interval=0.01)
+        time.sleep(0.05)
+        task.cancel()
+        time.sleep(0.03)
+        runs = task.runs
+        time.sleep(0.05)
+        assert task.runs == runs > 0
+
+
+class TestBackgroundTask(unittest.TestCase):
+    def test_start_and_stop(self):
+        background = BackgroundTask(Mock(CumulocityApi))
+        target = Mock()
+        task = background.start(target, args=[1], interval=0.01, name="publish")
+        time.sleep(0.1)
+        background.stop()
+        target.assert_called_with(1)
+        runs = task.runs
+        time.sleep(0.05)
+        assert task.runs == runs
+        assert background.stats()["publish"]["runs"] == runs
+
+    def test_invalid_interval(self):
+        background = BackgroundTask(Mock(CumulocityApi))
+        with self.assertRaises(ValueError):
+            background.start(lambda: None)
+
+
+if __name__ == "__main__":
+    unittest.main()
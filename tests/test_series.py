@@ -0,0 +1,146 @@
+"""Measurement series tests
+"""
+import unittest
+from datetime import datetime, timedelta, timezone
+from c8y_api.model import Measurement
+from c8y_api.model.measurements import Series
+from c8y_test_core.assert_measurements import AssertMeasurements
+from c8y_test_core import series
+from .fixtures import create_context
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def create_measurements(values, interval: float = 1.0):
+    return [
+        Measurement(
+            type="c8y_Counter",
+            source="unittest001",
+            time=START + timedelta(seconds=i * interval),
+            c8y_Counter={"count": {"value": value}},
+        )
+        for i, value in enumerate(values)
+    ]
+
+
+@unittest.skipIf(series.np is None, "numpy is not installed")
+class TestSeriesAssertions(unittest.TestCase):
+    def setUp(self) -> None:
+        self.context = create_context()
+        self.measurements = AssertMeasurements(self.context)
+        return super().setUp()
+
+    def test_extract_series_is_sorted_by_time(self):
+        items = create_measurements([1, 2, 3])
+        data = series.extract_series(reversed(items), "c8y_Counter", "count")
+        assert data.values.tolist() == [1, 2, 3]
+        assert data.timestamps[0] == START.timestamp()
+
+    def test_series_matches(self):
+        self.context.client.measurements.select.return_value = create_measurements(
+            [1, 2, 3, 4]
+        )
+        data = self.measurements.assert_series(
+            "c8y_Counter",
+            "count",
+            min_value=1,
+            max_value=4,
+            monotonic=series.Monotonic.INCREASING,
+            max_gap=1,
+            max_rate=1,
+            mean=2.5,
+        )
+        assert len(data) == 4
+
+    def test_series_failure_diagnostics(self):
+        values = [1, 2, 10, 3]
+        self.context.client.measurements.select.return_value = create_measurements(
+            values, interval=2
+        )
+        with self.assertRaises(AssertionError) as ctx:
+            self.measurements.assert_series(
+                "c8y_Counter",
+                "count",
+                max_value=5,
+                monotonic=series.Monotonic.NON_DECREASING,
+                max_gap=1,
+            )
+        message = str(ctx.exception)
+        assert "1 value/s greater than max_value=5" in message
+        assert "2024-01-01T00:00:04.000+00:00=10" in message
+        assert "Series is not non_decreasing" in message
+        assert "3 gap/s longer than max_gap=1s" in message
+
+
+def create_series(values):
+    return Series(
+        {
+            "truncated": False,
+            "series": [{"type": "c8y_Temperature", "name": "T", "unit": "C"}],
+            "values": {
+                (START + timedelta(minutes=minute)).isoformat(): [
+                    {"min": min_value, "max": max_value}
+                ]
+                for minute, (min_value, max_value) in values.items()
+            },
+        }
+    )
+
+
+class TestSeriesAggregateAssertions(unittest.TestCase):
+    def setUp(self) -> None:
+        self.context = create_context()
+        self.measurements = AssertMeasurements(self.context)
+        return super().setUp()
+
+    def test_aggregates_match(self):
+        self.context.client.measurements.get_series.return_value = create_series(
+            {0: (1, 2), 1: (2, 3), 2: (1, 5)}
+        )
+        intervals = self.measurements.assert_series_aggregates(
+            "c8y_Temperature.T",
+            min_value=0,
+            max_value=5,
+            after=START,
+            before=START + timedelta(minutes=3),
+        )
+        assert len(intervals) == 3
+        self.context.client.measurements.select.assert_not_called()
+
+    def test_missing_intervals(self):
+        self.context.client.measurements.get_series.return_value = create_series(
+            {0: (1, 2), 2: (1, 5)}
+        )
+        with self.assertRaisesRegex(AssertionError, "1 interval/s without values"):
+            self.measurements.assert_series_aggregates(
+                "c8y_Temperature.T",
+                after=START,
+                before=START + timedelta(minutes=3),
+            )
+
+    def test_raw_values_are_only_fetched_for_failed_intervals(self):
+        self.context.client.measurements.get_series.return_value = create_series(
+            {0: (1, 2), 1: (1, 20)}
+        )
+        raw = Measurement(
+            type="c8y_Temperature",
+            source="unittest001",
+            time=START + timedelta(minutes=1, seconds=5),
+            c8y_Temperature={"T": {"value": 20}},
+        )
+        self.context.client.measurements.select.return_value = [raw]
+
+        with self.assertRaisesRegex(AssertionError, "1 interval/s out of range"):
+            self.measurements.assert_series_aggregates(
+                "c8y_Temperature.T",
+                max_value=10,
+                after=START,
+                before=START + timedelta(minutes=2),
+            )
+        select = self.context.client.measurements.select
+        select.assert_called_once()
+        assert select.call_args.kwargs["after"] == START + timedelta(minutes=1)
+
+
+if __name__ == "__main__":
+    unittest.main()
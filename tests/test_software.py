@@ -1,9 +1,13 @@
 """Software assertion tests
 """
+import threading
 import unittest
 from typing import List, Dict
+from unittest.mock import Mock
 from c8y_test_core import assert_software_management
+from c8y_api.model import Operation
 from c8y_api.model.inventory import ManagedObject
+from c8y_test_core.assert_operation import AssertOperation
 from c8y_test_core.models import Software
 from .fixtures import create_context
 
@@ -96,6 +100,36 @@ class TestSoftwareInstalled(unittest.TestCase):
                 Software("packageOther"), mo=mo, timeout=0.01
             )
 
+    def test_package_with_multiple_versions(self):
+        mo = create_mo_with_software(
+            [
+                *[
+                    {"name": f"other{i}", "version": "1.0.0", "softwareType": "apt"}
+                    for i in range(1000)
+                ],
+                {"name": "package1", "version": "1.0.0", "softwareType": "apt"},
+                {"name": "package1", "version": "2.0.0", "softwareType": "snap"},
+            ]
+        )
+        packages = self.software.assert_software_installed(
+            Software("package1", version="2.0.0", softwareType="snap"),
+            Software("other999", version="1.0.0"),
+            mo=mo,
+            timeout=0.01,
+        )
+        self.assertEqual(len(packages), 1001)
+
+        with self.assertRaisesRegex(
+            AssertionError,
+            r"errors=\[\('package1', 'TYPE_MATCH'\), \('package2', 'MISSING'\)\]",
+        ):
+            self.software.assert_software_installed(
+                Software("package1", version="1.0.0", softwareType="rpm"),
+                Software("package2"),
+                mo=mo,
+                timeout=0.01,
+            )
+
 
 class TestSoftwareNotInstalled(unittest.TestCase):
     def setUp(self) -> None:
@@ -134,5 +168,206 @@ class TestSoftwareNotInstalled(unittest.TestCase):
             )
 
 
+class TestSoftwareSnapshot(unittest.TestCase):
+    def setUp(self) -> None:
+        self.software = assert_software_management.SoftwareManagement(create_context())
+        self.before = self.software.snapshot(
+            create_mo_with_software(
+                [
+                    {"name": "curl", "version": "7.88.1", "softwareType": "apt"},
+                    {"name": "tedge", "version": "1.0.0", "softwareType": "apt"},
+                    {"name": "vim-tiny", "version": "9.0", "softwareType": "apt"},
+                ]
+            )
+        )
+        self.after = create_mo_with_software(
+            [
+                {"name": "curl", "version": "7.88.1", "softwareType": "apt"},
+                {"name": "tedge", "version": "1.1.0", "softwareType": "apt"},
+                {"name": "wget", "version": "1.21", "softwareType": "apt"},
+            ]
+        )
+        return super().setUp()
+
+    def test_diff(self):
+        diff = self.before.diff(self.software.snapshot(self.after))
+        self.assertEqual([item.name for item in diff.added], ["wget"])
+        self.assertEqual([item.name for item in diff.removed], ["vim-tiny"])
+        self.assertEqual(
+            diff.changed,
+            [assert_software_management.SoftwareChange("tedge", "apt", "1.0.0", "1.1.0")],
+        )
+        assert self.before.diff(self.before).empty
+
+    def test_diff_with_empty_and_multiple_versions(self):
+        before = assert_software_management.SoftwareSnapshot.from_list(
+            [
+                {"name": "curl", "version": "", "softwareType": "apt"},
+                {"name": "vim", "version": "1.0", "softwareType": "apt"},
+                {"name": "wget", "version": "1.20", "softwareType": "apt"},
+            ]
+        )
+        after = assert_software_management.SoftwareSnapshot.from_list(
+            [
+                {"name": "curl", "version": "1.0", "softwareType": "apt"},
+                {"name": "vim", "version": "", "softwareType": "apt"},
+                {"name": "wget", "version": "1.21", "softwareType": "apt"},
+                {"name": "wget", "version": "1.22", "softwareType": "apt"},
+            ]
+        )
+        diff = before.diff(after)
+        assert not diff.added
+        assert not diff.removed
+        self.assertEqual(
+            [(item.name, item.before, item.after) for item in diff.changed],
+            [("curl", "", "1.0"), ("vim", "1.0", ""), ("wget", "1.20", "1.21,1.22")],
+        )
+
+        mo = create_mo_with_software(
+            [
+                {"name": "curl", "version": "1.0", "softwareType": "apt"},
+                {"name": "vim", "version": "", "softwareType": "apt"},
+                {"name": "wget", "version": "1.21", "softwareType": "apt"},
+                {"name": "wget", "version": "1.22", "softwareType": "apt"},
+            ]
+        )
+        self.software.assert_software_changed(
+            before, changed=[Software("wget", version=r"1\.22$")], mo=mo
+        )
+
+    def test_assert_software_changed(self):
+        self.software.assert_software_changed(
+            self.before,
+            added=[Software("wget")],
+            removed=[Software("vim-tiny", version="9.0")],
+            changed=[Software("tedge", version=r"1\.1\.")],
+            exact=True,
+            mo=self.after,
+            timeout=0.01,
+        )
+
+        with self.assertRaisesRegex(AssertionError, "UNEXPECTED_CHANGE"):
+            self.software.assert_software_changed(
+                self.before, added=[Software("wget")], exact=True, mo=self.after
+            )
+
+        with self.assertRaisesRegex(AssertionError, "NOT_CHANGED"):
+            self.software.assert_software_changed(
+                self.before, changed=[Software("curl")], mo=self.after
+            )
+
+        # a change can only satisfy one expectation
+        with self.assertRaisesRegex(AssertionError, "NOT_ADDED"):
+            self.software.assert_software_changed(
+                self.before,
+                added=[Software("wget"), Software("wget", version="1.21")],
+                mo=self.after,
+            )
+
+        with self.assertRaisesRegex(AssertionError, "Software list changed"):
+            self.software.assert_software_unchanged(self.before, mo=self.after)
+
+
+class TestSoftwareBatches(unittest.TestCase):
+    def setUp(self) -> None:
+        self.software = assert_software_management.SoftwareManagement(create_context())
+        self.submitted = []
+        self.fail_batches = {1}
+        self.request_errors = set()
+        self.timeouts = set()
+        self.lock = threading.Lock()
+        self.software.update = self.update
+        return super().setUp()
+
+    def update(self, *software_list, **kwargs):
+        with self.lock:
+            index = len(self.submitted)
+            self.submitted.append(list(software_list))
+        if index in self.request_errors:
+            raise ConnectionError("Connection refused")
+        status = "FAILED" if index in self.fail_batches else "SUCCESSFUL"
+        operation = Mock(AssertOperation)
+        operation.id = str(index)
+        if index in self.timeouts:
+            operation.operation = Mock(status="PENDING")
+
+            def fetch_operation():
+                operation.operation = Mock(status="EXECUTING")
+                return operation
+
+            operation.fetch_operation.side_effect = fetch_operation
+            operation.assert_done.side_effect = AssertionError("not done")
+            return operation
+        operation.assert_done.return_value.status = status
+        operation.assert_done.return_value.to_json.return_value = {}
+        return operation
+
+    def test_batches_and_resume(self):
+        packages = [Software(f"package{i}") for i in range(25)]
+        rollout = self.software.install_in_batches(*packages, batch_size=10)
+        self.assertEqual([len(batch) for batch in self.submitted], [10, 10])
+        self.assertEqual(self.submitted[0][0].action, "install")
+        self.assertEqual(
+            [batch.status for batch in rollout.batches], ["SUCCESSFUL", "FAILED", ""]
+        )
+        self.assertEqual(len(rollout.remaining), 15)
+        assert not rollout.done
+
+        # resume only submits the batches which were not successful
+        self.fail_batches = set()
+        rollout = self.software.update_in_batches(rollout=rollout)
+        self.assertEqual([len(batch) for batch in self.submitted], [10, 10, 10, 5])
+        assert rollout.done
+
+    def test_request_errors_fail_the_batch(self):
+        packages = [Software(f"package{i}") for i in range(30)]
+        self.fail_batches = set()
+        self.request_errors = {1, 2}
+        rollout = self.software.install_in_batches(
+            *packages, batch_size=10, stop_on_failure=False
+        )
+        self.assertEqual(
+            [batch.status for batch in rollout.batches],
+            ["SUCCESSFUL", "FAILED", "FAILED"],
+        )
+        assert "Connection refused" in rollout.batches[1].failure_reason
+
+        # the batch skipped on resume does not keep the results of the previous run
+        self.request_errors = {3}
+        rollout = self.software.update_in_batches(rollout=rollout)
+        self.assertEqual(
+            [batch.status for batch in rollout.batches], ["SUCCESSFUL", "FAILED", ""]
+        )
+        self.assertEqual(rollout.batches[2].failure_reason, "")
+        self.assertEqual(len(rollout.failed), 1)
+
+    def test_resume_waits_for_operations_in_progress(self):
+        packages = [Software(f"package{i}") for i in range(20)]
+        self.timeouts = {1}
+        rollout = self.software.install_in_batches(*packages, batch_size=10)
+        batch = rollout.batches[1]
+        self.assertEqual((batch.operation_id, batch.status), ("1", "EXECUTING"))
+
+        # the queued operation is waited for, rather than submitted again
+        operations = self.software.context.client.operations
+        operations.get.return_value = Operation(status="SUCCESSFUL")
+        operations.get.return_value.id = "1"
+        rollout = self.software.update_in_batches(rollout=rollout)
+        operations.get.assert_called_with("1")
+        self.assertEqual(len(self.submitted), 2)
+        self.assertEqual((batch.operation_id, batch.status), ("1", "SUCCESSFUL"))
+        assert rollout.done
+
+    def test_concurrent_batches(self):
+        packages = [Software(f"package{i}") for i in range(50)]
+        rollout = self.software.remove_in_batches(
+            *packages, batch_size=10, max_concurrent=4, stop_on_failure=False
+        )
+        self.assertEqual(len(self.submitted), 5)
+        self.assertEqual(len(rollout.successful), 4)
+        self.assertEqual(len(rollout.failed), 1)
+        self.assertEqual(self.submitted[0][0].action, "delete")
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,87 @@
+"""Throughput tests
+"""
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import Mock
+from c8y_api.model import Event, Measurement
+from c8y_test_core.assert_events import Events
+from c8y_test_core.assert_measurements import AssertMeasurements
+from c8y_test_core.throughput import compute_throughput
+from .fixtures import create_context
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+class TestComputeThroughput(unittest.TestCase):
+    def test_constant_rate(self):
+        stats = compute_throughput([float(i) for i in range(101)], window=10)
+        assert stats.count == 101
+        assert stats.duration == 100
+        assert stats.max_gap == 1
+        assert stats.min_window_rate == 1.0
+        assert stats.max_window_rate == 1.1
+        assert stats.jitter["p99"] == 0
+
+    def test_burst_and_gap(self):
+        times = [0, 1, 2, 2.1, 2.2, 2.3, 10, 11, 12]
+        stats = compute_throughput(times, window=2, start=0, end=14)
+        assert stats.max_gap == 7.7
+        assert stats.min_window_rate == 0
+        assert stats.max_window_rate == 2.5
+
+    def test_no_messages(self):
+        stats = compute_throughput([])
+        assert stats.count == 0
+        assert stats.rate == 0
+
+
+class TestEventRate(unittest.TestCase):
+    def setUp(self) -> None:
+        self.context = create_context()
+        self.events = Events(self.context)
+        return super().setUp()
+
+    def test_rate_from_polling(self):
+        self.context.client.events.select.return_value = [
+            Event(type="c8y_Test", time=START + timedelta(seconds=i / 2))
+            for i in range(41)
+        ]
+        stats = self.events.assert_rate(min_rate=1.5, max_gap=1, window=5)
+        assert stats.rate == 41 / 20
+
+        with self.assertRaisesRegex(AssertionError, "Rate is less than expected"):
+            self.events.assert_rate(
+                min_rate=1.5,
+                window=5,
+                after=START,
+                before=START + timedelta(seconds=30),
+            )
+
+    def test_items_outside_of_the_period_are_ignored(self):
+        measurements = AssertMeasurements(self.context)
+        self.context.client.measurements.select.return_value = [
+            Measurement(type="c8y_Test", time=START + timedelta(seconds=i / 2))
+            for i in range(41)
+        ]
+        stats = measurements.assert_rate(
+            max_rate=2.5,
+            window=5,
+            incremental=True,
+            after=START + timedelta(seconds=10),
+            before=START + timedelta(seconds=20),
+        )
+        assert stats.count == 21
+        assert stats.duration == 10
+
+    def test_rate_from_stream(self):
+        reader = Mock()
+        reader.read_all.return_value = [
+            {"time": (START + timedelta(seconds=i)).isoformat()} for i in range(10)
+        ]
+        with self.assertRaisesRegex(AssertionError, "Rate is more than expected"):
+            self.events.assert_rate(max_rate=0.5, window=2, reader=reader)
+        self.context.client.events.select.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+"""Timer tests
+"""
+import time
+import unittest
+from c8y_test_core.timer import Overrun, RepeatTimer
+
+
+class TestRepeatTimer(unittest.TestCase):
+    def test_sub_second_interval(self):
+        calls = []
+        timer = RepeatTimer(
+            target=lambda: calls.append(time.monotonic()), interval=0.01, count=20
+        )
+        started = time.monotonic()
+        timer.start()
+        timer.join(5)
+
+        assert timer.runs == 20
+        # runs never start before their deadline, and the last run is scheduled
+        # 190ms after the start (the upper bound allows for scheduler noise)
+        assert 0.19 <= calls[-1] - started < 1.0
+        assert timer.lateness.stats()["count"] == 20
+
+    def test_catch_up_after_overrun(self):
+        calls = []
+
+        def target():
+            calls.append(time.monotonic())
+            if len(calls) == 1:
+                time.sleep(0.5)
+
+        timer = RepeatTimer(target=target, interval=0.05, count=11)
+        started = time.monotonic()
+        timer.start()
+        timer.join(5)
+        assert timer.runs == 11
+        assert timer.skipped == 0
+        # missed runs are done back to back, so the last run is close to its
+        # deadline (0.5s), whereas a drifting schedule would be at >= 1.0s
+        assert calls[-1] - started < 0.9
+        assert timer.lateness.max >= 0.4
+
+    def test_skip_after_overrun(self):
+        calls = []
+
+        def target():
+            calls.append(time.monotonic())
+            if len(calls) == 1:
+                time.sleep(0.35)
+
+        timer = RepeatTimer(
+            target=target, interval=0.1, count=3, overrun=Overrun.SKIP
+        )
+        timer.start()
+        timer.join(5)
+        assert timer.runs == 3
+        assert timer.skipped >= 3
+        # the runs continue on the original schedule, catching up instead would
+        # make the runs late by more than one interval (p50 >= 0.15s)
+        assert timer.lateness.stats()["p50"] < 0.1
+
+    def test_cancel(self):
+        timer = RepeatTimer(target=lambda: None, interval=10, delay=10)
+        timer.start()
+        timer.cancel()
+        timer.join(1)
+        assert not timer.is_alive()
+        assert timer.runs == 0
+
+
+if __name__ == "__main__":
+    unittest.main()